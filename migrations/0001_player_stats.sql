@@ -0,0 +1,223 @@
+-- Migration 1: keep the standings of matches in player_stats.
+--
+-- Adds the player_stats table and its triggers, fills it from the existing
+-- players and matches, and recreates the single tournament standings and
+-- pairing views on top of it.
+
+-- Standings of each player in matches, kept current by the triggers below
+-- so that the standings views do not rescan matches on every read.
+--   wins: matches won
+--   draws: matches with no winner
+--   matches: matches played
+--   omw: total wins of the distinct opponents played
+create table player_stats(
+	player int primary key references players(id) on delete cascade,
+	wins int not null default 0,
+	draws int not null default 0,
+	matches int not null default 0,
+	omw int not null default 0
+);
+
+create function player_stats_players_inserted() returns trigger as $$
+begin
+	insert into player_stats (player)
+	select id from new_players;
+	return null;
+end;
+$$ language plpgsql;
+
+create trigger players_stats_insert after insert on players
+	referencing new table as new_players
+	for each statement execute procedure player_stats_players_inserted();
+
+-- Adds a statement's new matches to player_stats. The OMW of a player
+-- changes when they meet a new opponent or when an opponent wins, so it is
+-- recomputed only for the players in the new matches and the opponents of
+-- their winners.
+create function player_stats_matches_inserted() returns trigger as $$
+begin
+	update player_stats s
+	   set wins = s.wins + n.wins,
+	       draws = s.draws + n.draws,
+	       matches = s.matches + n.matches
+	  from (select p.player,
+	               count(*) filter (where p.winner = p.player) as wins,
+	               count(*) filter (where p.winner is null) as draws,
+	               count(*) as matches
+	          from (select player1 as player, winner from new_matches
+	                union all
+	                select player2 as player, winner from new_matches) p
+	         where p.player is not null
+	         group by p.player) n
+	 where s.player = n.player;
+
+	update player_stats s
+	   set omw = (select coalesce(sum(o.wins), 0)
+	                from player_stats o
+	               where o.player in (select m.player2 from matches m
+	                                   where m.player1 = s.player
+	                                  union
+	                                  select m.player1 from matches m
+	                                   where m.player2 = s.player))
+	 where s.player in (select player1 from new_matches
+	                    union
+	                    select player2 from new_matches
+	                    union
+	                    select m.player2 from matches m
+	                      join new_matches n on m.player1 = n.winner
+	                    union
+	                    select m.player1 from matches m
+	                      join new_matches n on m.player2 = n.winner);
+	return null;
+end;
+$$ language plpgsql;
+
+create trigger matches_stats_insert after insert on matches
+	referencing new table as new_matches
+	for each statement execute procedure player_stats_matches_inserted();
+
+-- Recomputes player_stats from scratch. Used after matches are updated or
+-- deleted, which only happens when results are corrected or cleared.
+create function refresh_player_stats() returns void as $$
+	update player_stats s
+	   set wins = (select count(*) from matches m
+	                where m.winner = s.player),
+	       draws = (select count(*) from matches m
+	                 where m.winner is null
+	                   and (m.player1 = s.player or m.player2 = s.player)),
+	       matches = (select count(*) from matches m
+	                   where m.player1 = s.player or m.player2 = s.player);
+	update player_stats s
+	   set omw = (select coalesce(sum(o.wins), 0)
+	                from player_stats o
+	               where o.player in (select m.player2 from matches m
+	                                   where m.player1 = s.player
+	                                  union
+	                                  select m.player1 from matches m
+	                                   where m.player2 = s.player));
+$$ language sql;
+
+create function player_stats_matches_changed() returns trigger as $$
+begin
+	perform refresh_player_stats();
+	return null;
+end;
+$$ language plpgsql;
+
+create trigger matches_stats_change after update or delete or truncate on matches
+	for each statement execute procedure player_stats_matches_changed();
+
+insert into player_stats (player)
+select id from players;
+
+select refresh_player_stats();
+
+drop view if exists swissPairings, playerStandingsRank, playerStandings,
+	swissPairingsDraw, playerStandingsRankDraw, playerStandingsDraw,
+	swissPairingsOMW, playerStandingsRankOMW, playerStandingsOMW;
+
+--Create VIEWs for Initial Requirements
+create view playerStandings as
+select 	players.id, 
+		players.name, 
+		player_stats.wins,
+		player_stats.matches
+from players
+join player_stats on player_stats.player = players.id
+order by wins desc;
+
+create view playerStandingsRank as
+select 	row_number() over (ORDER BY wins desc) as rank,
+		playerStandings.*
+from playerStandings
+order by wins desc;
+
+create view swissPairings as 
+select 	players1.id as id1,
+		players1.name as name1,
+		players2.id as id2,
+		players2.name as name2,
+		players1.rank as rank1,
+		players2.rank as rank2,
+		players1.wins as win1,
+		players2.wins as win2,
+		case 	when exists ( select 1 from matches where player1 = players1.id and player2 = players2.id) then 1
+				when exists ( select 1 from matches where player1 = players2.id and player2 = players1.id) then 1
+				else 0 end as matchedBefore
+from playerStandingsRank players1 
+left outer join playerStandingsRank players2
+  on players1.rank + 1 = players2.rank
+  and mod(players2.rank,2) = 0
+where mod(players1.rank,2) = 1
+ order by rank1;
+
+ --Create VIEWs for Draw Games
+create view playerStandingsDraw as
+select 	players.id, 
+		players.name, 
+		player_stats.wins * 3 + player_stats.draws as points,
+		player_stats.matches
+from players
+join player_stats on player_stats.player = players.id
+order by points desc;
+
+create view playerStandingsRankDraw as
+select 	row_number() over (ORDER BY points desc) as rank,
+		playerStandingsDraw.*
+from playerStandingsDraw
+order by points desc;
+
+create view swissPairingsDraw as 
+select 	players1.id as id1,
+		players1.name as name1,
+		players2.id as id2,
+		players2.name as name2,
+		players1.rank as rank1,
+		players2.rank as rank2,
+		players1.points as win1,
+		players2.points as win2,
+		case 	when exists ( select 1 from matches where player1 = players1.id and player2 = players2.id) then 1
+				when exists ( select 1 from matches where player1 = players2.id and player2 = players1.id) then 1
+				else 0 end as matchedBefore
+from playerStandingsRankDraw players1 
+left outer join playerStandingsRankDraw players2
+  on players1.rank + 1 = players2.rank
+  and mod(players2.rank,2) = 0
+where mod(players1.rank,2) = 1
+ order by rank1;
+ 
+ --Create VIEWs for OMW
+create view playerStandingsOMW as
+select 	players.id, 
+		players.name, 
+		player_stats.wins,
+		player_stats.omw,
+		player_stats.matches
+from players
+join player_stats on player_stats.player = players.id
+order by wins desc, omw desc;
+
+create view playerStandingsRankOMW as
+select 	row_number() over (ORDER BY wins desc, OMW desc) as rank,
+		playerStandingsOMW.*
+from playerStandingsOMW
+order by wins desc, OMW desc;
+
+create view swissPairingsOMW as 
+select 	players1.id as id1,
+		players1.name as name1,
+		players2.id as id2,
+		players2.name as name2,
+		players1.rank as rank1,
+		players2.rank as rank2,
+		players1.wins as win1,
+		players2.wins as win2,
+		case 	when exists ( select 1 from matches where player1 = players1.id and player2 = players2.id) then 1
+				when exists ( select 1 from matches where player1 = players2.id and player2 = players1.id) then 1
+				else 0 end as matchedBefore
+from playerStandingsRankOMW players1 
+left outer join playerStandingsRankOMW players2
+  on players1.rank + 1 = players2.rank
+  and mod(players2.rank,2) = 0
+where mod(players1.rank,2) = 1
+ order by rank1;
@@ -0,0 +1,24 @@
+-- migrate: no-transaction
+--
+-- Migration 2: indexes for the standings, pairing and rematch queries.
+--
+-- Built concurrently so that a large matches table stays writable while
+-- the indexes are created.
+
+-- Rematch lookups in either direction, and the opponent lists for OMW.
+create index concurrently if not exists matches_player1_player2_idx
+	on matches (player1, player2);
+create index concurrently if not exists matches_player2_player1_idx
+	on matches (player2, player1);
+create index concurrently if not exists matches_winner_idx
+	on matches (winner);
+
+create index concurrently if not exists tournamentmatches_tournament_player1_player2_idx
+	on tournamentmatches (tournament, player1, player2);
+create index concurrently if not exists tournamentmatches_tournament_player2_player1_idx
+	on tournamentmatches (tournament, player2, player1);
+create index concurrently if not exists tournamentmatches_tournament_winner_idx
+	on tournamentmatches (tournament, winner);
+
+create index concurrently if not exists playertournaments_tournament_player_idx
+	on playertournaments (tournament, player);
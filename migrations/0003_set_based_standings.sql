@@ -0,0 +1,84 @@
+-- Migration 3: compute standings in a single scan.
+--
+-- playerStandingsMT and refresh_player_stats() used to run several
+-- correlated subqueries per player over the whole match table. Both now
+-- unnest every match into one row per player and aggregate once.
+
+-- Recomputes player_stats from scratch, in a single scan of matches. Used
+-- after matches are updated or deleted, which only happens when results
+-- are corrected or cleared.
+create or replace function refresh_player_stats() returns void as $$
+	with participations as (
+		select p.player, p.opponent, m.winner
+		  from matches m
+		 cross join lateral (values (m.player1, m.player2),
+		                            (m.player2, m.player1)) as p(player, opponent)
+		 where p.player is not null
+	), stats as (
+		select player,
+		       count(*) filter (where winner = player) as wins,
+		       count(*) filter (where winner is null) as draws,
+		       count(*) as matches
+		  from participations
+		 group by player
+	), omw as (
+		select o.player, sum(stats.wins) as omw
+		  from (select distinct player, opponent
+		          from participations
+		         where opponent is not null) o
+		  join stats on stats.player = o.opponent
+		 group by o.player
+	)
+	update player_stats s
+	   set wins = coalesce(stats.wins, 0),
+	       draws = coalesce(stats.draws, 0),
+	       matches = coalesce(stats.matches, 0),
+	       omw = coalesce(omw.omw, 0)
+	  from player_stats p
+	  left join stats on stats.player = p.player
+	  left join omw on omw.player = p.player
+	 where s.player = p.player;
+$$ language sql;
+
+create or replace view playerStandingsMT as
+with participations as (
+	-- one row per player per match, in a single scan of tournamentmatches
+	select 	m.tournament,
+			p.player,
+			p.opponent,
+			m.winner
+	from tournamentmatches m
+	cross join lateral (values (m.player1, m.player2),
+	                           (m.player2, m.player1)) as p(player, opponent)
+	where p.player is not null
+), stats as (
+	select 	tournament,
+			player,
+			count(*) filter (where winner = player) as wins,
+			count(*) as matches
+	from participations
+	group by tournament, player
+), omw as (
+	select 	o.tournament,
+			o.player,
+			sum(stats.wins)::bigint as omw
+	from (select distinct tournament, player, opponent
+		  from participations
+		  where opponent is not null) o
+	join stats on stats.tournament = o.tournament
+	          and stats.player = o.opponent
+	group by o.tournament, o.player
+)
+select 	playertournaments.tournament,
+		players.id, 
+		players.name, 
+		coalesce(stats.wins, 0) as wins,
+		coalesce(omw.omw, 0) as omw,
+		coalesce(stats.matches, 0) as matches
+from players
+join playertournaments on players.id = playertournaments.player
+left join stats on stats.tournament = playertournaments.tournament
+               and stats.player = players.id
+left join omw on omw.tournament = playertournaments.tournament
+             and omw.player = players.id
+order by playertournaments.tournament, wins desc, omw desc;
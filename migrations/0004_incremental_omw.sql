@@ -0,0 +1,260 @@
+-- Migration 4: maintain OMW incrementally.
+--
+-- The player_stats trigger used to recompute the OMW of every affected
+-- player from their full opponent list, and playerStandingsMT derived the
+-- OMW of every player in every tournament on each read. Both are now
+-- stored and updated by the difference each new match makes: the
+-- tournament standings move to the new player_tournament_stats table.
+
+-- Adds a statement's new matches to player_stats. OMW is updated first,
+-- while player_stats still holds the wins from before the statement: each
+-- new win adds one to the OMW of every opponent the winner has played, and
+-- each opponent met for the first time adds the wins they had so far.
+create or replace function player_stats_matches_inserted() returns trigger as $$
+begin
+	update player_stats s
+	   set omw = s.omw + d.omw
+	  from (select g.player, sum(g.omw) as omw
+	          from (select o.opponent as player, w.wins as omw
+	                  from (select winner, count(*) as wins
+	                          from new_matches
+	                         where winner is not null
+	                         group by winner) w
+	                 cross join lateral (select m.player2 as opponent from matches m
+	                                      where m.player1 = w.winner
+	                                     union
+	                                     select m.player1 from matches m
+	                                      where m.player2 = w.winner) o
+	                 where o.opponent is not null
+	                union all
+	                select p.player, o.wins
+	                  from (select distinct p.player, p.opponent
+	                          from new_matches n
+	                         cross join lateral (values (n.player1, n.player2),
+	                                                    (n.player2, n.player1)) as p(player, opponent)
+	                         where p.player is not null
+	                           and p.opponent is not null) p
+	                  join player_stats o on o.player = p.opponent
+	                 where not exists (select 1 from matches m
+	                                    where ((m.player1 = p.player and m.player2 = p.opponent)
+	                                        or (m.player1 = p.opponent and m.player2 = p.player))
+	                                      and not exists (select 1 from new_matches n
+	                                                       where n.id = m.id))) g
+	         group by g.player) d
+	 where s.player = d.player;
+
+	update player_stats s
+	   set wins = s.wins + n.wins,
+	       draws = s.draws + n.draws,
+	       matches = s.matches + n.matches
+	  from (select p.player,
+	               count(*) filter (where p.winner = p.player) as wins,
+	               count(*) filter (where p.winner is null) as draws,
+	               count(*) as matches
+	          from (select player1 as player, winner from new_matches
+	                union all
+	                select player2 as player, winner from new_matches) p
+	         where p.player is not null
+	         group by p.player) n
+	 where s.player = n.player;
+	return null;
+end;
+$$ language plpgsql;
+
+-- Standings of each player in each tournament, kept current by the
+-- triggers below in the same way as player_stats.
+create table player_tournament_stats(
+	tournament int references tournaments(id) on delete cascade,
+	player int references players(id) on delete cascade,
+	wins int not null default 0,
+	draws int not null default 0,
+	matches int not null default 0,
+	omw int not null default 0,
+	primary key (tournament, player)
+);
+
+create function player_tournament_stats_registered() returns trigger as $$
+begin
+	insert into player_tournament_stats (tournament, player)
+	select distinct tournament, player from new_registrations
+	 where tournament is not null and player is not null
+	on conflict do nothing;
+	return null;
+end;
+$$ language plpgsql;
+
+create trigger playertournaments_stats_insert after insert on playertournaments
+	referencing new table as new_registrations
+	for each statement execute procedure player_tournament_stats_registered();
+
+-- Adds a statement's new tournament matches to player_tournament_stats,
+-- updating OMW incrementally as player_stats_matches_inserted() does, within
+-- each match's tournament.
+create function player_tournament_stats_matches_inserted() returns trigger as $$
+begin
+	insert into player_tournament_stats (tournament, player)
+	select distinct n.tournament, p.player
+	  from new_matches n
+	 cross join lateral (values (n.player1), (n.player2)) as p(player)
+	 where n.tournament is not null and p.player is not null
+	on conflict do nothing;
+
+	update player_tournament_stats s
+	   set omw = s.omw + d.omw
+	  from (select g.tournament, g.player, sum(g.omw) as omw
+	          from (select w.tournament, o.opponent as player, w.wins as omw
+	                  from (select tournament, winner, count(*) as wins
+	                          from new_matches
+	                         where winner is not null
+	                         group by tournament, winner) w
+	                 cross join lateral (select m.player2 as opponent from tournamentmatches m
+	                                      where m.tournament = w.tournament
+	                                        and m.player1 = w.winner
+	                                     union
+	                                     select m.player1 from tournamentmatches m
+	                                      where m.tournament = w.tournament
+	                                        and m.player2 = w.winner) o
+	                 where o.opponent is not null
+	                union all
+	                select p.tournament, p.player, o.wins
+	                  from (select distinct n.tournament, p.player, p.opponent
+	                          from new_matches n
+	                         cross join lateral (values (n.player1, n.player2),
+	                                                    (n.player2, n.player1)) as p(player, opponent)
+	                         where p.player is not null
+	                           and p.opponent is not null) p
+	                  join player_tournament_stats o on o.tournament = p.tournament
+	                                                and o.player = p.opponent
+	                 where not exists (select 1 from tournamentmatches m
+	                                    where m.tournament = p.tournament
+	                                      and ((m.player1 = p.player and m.player2 = p.opponent)
+	                                        or (m.player1 = p.opponent and m.player2 = p.player))
+	                                      and not exists (select 1 from new_matches n
+	                                                       where n.id = m.id))) g
+	         group by g.tournament, g.player) d
+	 where s.tournament = d.tournament and s.player = d.player;
+
+	update player_tournament_stats s
+	   set wins = s.wins + n.wins,
+	       draws = s.draws + n.draws,
+	       matches = s.matches + n.matches
+	  from (select p.tournament,
+	               p.player,
+	               count(*) filter (where p.winner = p.player) as wins,
+	               count(*) filter (where p.winner is null) as draws,
+	               count(*) as matches
+	          from (select tournament, player1 as player, winner from new_matches
+	                union all
+	                select tournament, player2 as player, winner from new_matches) p
+	         where p.player is not null
+	         group by p.tournament, p.player) n
+	 where s.tournament = n.tournament and s.player = n.player;
+	return null;
+end;
+$$ language plpgsql;
+
+create trigger tournamentmatches_stats_insert after insert on tournamentmatches
+	referencing new table as new_matches
+	for each statement execute procedure player_tournament_stats_matches_inserted();
+
+-- Recomputes player_tournament_stats from scratch, in a single scan of
+-- tournamentmatches, after tournament matches are updated or deleted.
+create function refresh_player_tournament_stats() returns void as $$
+	with participations as (
+		select m.tournament, p.player, p.opponent, m.winner
+		  from tournamentmatches m
+		 cross join lateral (values (m.player1, m.player2),
+		                            (m.player2, m.player1)) as p(player, opponent)
+		 where p.player is not null
+	), stats as (
+		select tournament,
+		       player,
+		       count(*) filter (where winner = player) as wins,
+		       count(*) filter (where winner is null) as draws,
+		       count(*) as matches
+		  from participations
+		 group by tournament, player
+	), omw as (
+		select o.tournament, o.player, sum(stats.wins) as omw
+		  from (select distinct tournament, player, opponent
+		          from participations
+		         where opponent is not null) o
+		  join stats on stats.tournament = o.tournament
+		            and stats.player = o.opponent
+		 group by o.tournament, o.player
+	)
+	update player_tournament_stats s
+	   set wins = coalesce(stats.wins, 0),
+	       draws = coalesce(stats.draws, 0),
+	       matches = coalesce(stats.matches, 0),
+	       omw = coalesce(omw.omw, 0)
+	  from player_tournament_stats p
+	  left join stats on stats.tournament = p.tournament
+	                 and stats.player = p.player
+	  left join omw on omw.tournament = p.tournament
+	               and omw.player = p.player
+	 where s.tournament = p.tournament and s.player = p.player;
+$$ language sql;
+
+create function player_tournament_stats_matches_changed() returns trigger as $$
+begin
+	perform refresh_player_tournament_stats();
+	return null;
+end;
+$$ language plpgsql;
+
+create trigger tournamentmatches_stats_change after update or delete or truncate on tournamentmatches
+	for each statement execute procedure player_tournament_stats_matches_changed();
+
+insert into player_tournament_stats (tournament, player)
+select tournament, player from playertournaments
+ where tournament is not null and player is not null
+union
+select m.tournament, p.player
+  from tournamentmatches m
+ cross join lateral (values (m.player1), (m.player2)) as p(player)
+ where m.tournament is not null and p.player is not null;
+
+select refresh_player_tournament_stats();
+
+drop view if exists swissPairingsMT, playerStandingsRankMT, playerStandingsMT;
+
+create view playerStandingsMT as
+select 	playertournaments.tournament,
+		players.id, 
+		players.name, 
+		player_tournament_stats.wins,
+		player_tournament_stats.omw,
+		player_tournament_stats.matches
+from players
+join playertournaments on players.id = playertournaments.player
+join player_tournament_stats on player_tournament_stats.tournament = playertournaments.tournament
+                            and player_tournament_stats.player = players.id
+order by playertournaments.tournament, wins desc, omw desc;
+
+create view playerStandingsRankMT as
+select 	row_number() over (PARTITION BY tournament ORDER BY wins desc, OMW desc) as rank,
+		playerStandingsMT.*
+from playerStandingsMT
+order by tournament, wins desc, OMW desc;
+
+create view swissPairingsMT as 
+select 	players1.id as id1,
+		players1.name as name1,
+		players2.id as id2,
+		players2.name as name2,
+		players1.rank as rank1,
+		players2.rank as rank2,
+		players1.wins as win1,
+		players2.wins as win2,
+		case 	when exists ( select 1 from matches where player1 = players1.id and player2 = players2.id) then 1
+				when exists ( select 1 from matches where player1 = players2.id and player2 = players1.id) then 1
+				else 0 end as matchedBefore,
+		players1.tournament
+from playerStandingsRankMT players1 
+left outer join playerStandingsRankMT players2
+  on players1.rank + 1 = players2.rank
+  and mod(players2.rank,2) = 0
+  and players1.tournament = players2.tournament
+where mod(players1.rank,2) = 1
+ order by rank1;
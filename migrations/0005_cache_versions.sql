@@ -0,0 +1,69 @@
+-- Migration 5: versions for the shared read cache.
+--
+-- tournament_cache keeps standings and pairings until what they read
+-- changes. These triggers record every change in cache_versions, so that
+-- a cache shared by several processes sees writes made by any of them.
+
+-- Versions of what the read functions depend on, for tournament_cache's
+-- shared mode: one row per tournament, -1 for the matches and players
+-- tables and -2 for changes that may affect every tournament. Each
+-- statement that writes bumps the versions it affects, whichever client
+-- runs it.
+create table cache_versions(
+	tournament int primary key,
+	version bigint not null default 0
+);
+
+-- Bumps the version given as the trigger's argument.
+create function cache_versions_bump() returns trigger as $$
+begin
+	insert into cache_versions (tournament, version)
+	values (TG_ARGV[0]::int, 1)
+	on conflict (tournament) do update set version = cache_versions.version + 1;
+	return null;
+end;
+$$ language plpgsql;
+
+-- Bumps the version of each tournament among the statement's rows.
+create function cache_versions_changed() returns trigger as $$
+begin
+	insert into cache_versions (tournament, version)
+	select distinct tournament, 1 from changed_rows where tournament is not null
+	on conflict (tournament) do update set version = cache_versions.version + 1;
+	return null;
+end;
+$$ language plpgsql;
+
+create trigger matches_cache_versions after insert or update or delete or truncate on matches
+	for each statement execute procedure cache_versions_bump('-1');
+create trigger players_cache_versions after insert or delete or truncate on players
+	for each statement execute procedure cache_versions_bump('-1');
+-- Player names are part of every tournament's standings.
+create trigger players_cache_versions_update after update on players
+	for each statement execute procedure cache_versions_bump('-2');
+create trigger tournaments_cache_versions after insert or update or delete or truncate on tournaments
+	for each statement execute procedure cache_versions_bump('-2');
+
+create trigger tournamentmatches_cache_versions_insert after insert on tournamentmatches
+	referencing new table as changed_rows
+	for each statement execute procedure cache_versions_changed();
+create trigger tournamentmatches_cache_versions_update after update on tournamentmatches
+	referencing new table as changed_rows
+	for each statement execute procedure cache_versions_changed();
+create trigger tournamentmatches_cache_versions_delete after delete on tournamentmatches
+	referencing old table as changed_rows
+	for each statement execute procedure cache_versions_changed();
+create trigger tournamentmatches_cache_versions_truncate after truncate on tournamentmatches
+	for each statement execute procedure cache_versions_bump('-2');
+
+create trigger playertournaments_cache_versions_insert after insert on playertournaments
+	referencing new table as changed_rows
+	for each statement execute procedure cache_versions_changed();
+create trigger playertournaments_cache_versions_update after update on playertournaments
+	referencing new table as changed_rows
+	for each statement execute procedure cache_versions_changed();
+create trigger playertournaments_cache_versions_delete after delete on playertournaments
+	referencing old table as changed_rows
+	for each statement execute procedure cache_versions_changed();
+create trigger playertournaments_cache_versions_truncate after truncate on playertournaments
+	for each statement execute procedure cache_versions_bump('-2');
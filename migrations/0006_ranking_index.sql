@@ -0,0 +1,9 @@
+-- migrate: no-transaction
+--
+-- Migration 6: index on the ranking order of player_tournament_stats.
+--
+-- playerStandingsTop(), playerStandingsAfter() and playerStandingsAround()
+-- rank by wins, then OMW, then id, all descending but the id. Indexing -player
+-- lets one backward index scan follow that order and seek to a page key.
+create index concurrently if not exists player_tournament_stats_ranking_idx
+	on player_tournament_stats (tournament, wins, omw, (-player));
@@ -0,0 +1,19 @@
+-- Migration 7: per-tournament ranking order.
+--
+-- playerStandingsTiebreaks() computes every tiebreak score in one pass over
+-- a tournament's matches and ranks by the order stored here.
+
+-- Ranking order of each tournament's playerStandingsTiebreaks(), as names
+-- from tournament_tiebreaks.TIEBREAKS, the first deciding. Tournaments
+-- without a row are ranked by wins, then OMW.
+create table tournament_tiebreaks(
+	tournament int primary key references tournaments(id) on delete cascade,
+	tiebreaks text[] not null
+);
+
+create trigger tournament_tiebreaks_cache_versions_insert after insert on tournament_tiebreaks
+	referencing new table as changed_rows
+	for each statement execute procedure cache_versions_changed();
+create trigger tournament_tiebreaks_cache_versions_update after update on tournament_tiebreaks
+	referencing new table as changed_rows
+	for each statement execute procedure cache_versions_changed();
@@ -0,0 +1,158 @@
+-- Migration 8: partition playertournaments and tournamentmatches by
+-- tournament.
+--
+-- Both tables are rebuilt as list-partitioned tables with one partition per
+-- tournament and a default partition, and the rows copied over with their
+-- ids. Tournaments inserted from now on get their partitions from a trigger.
+-- Rows without a tournament cannot be partitioned and are not copied; no
+-- function reads them. The views over the tables are recreated, and
+-- swissPairingsMT now looks for rematches in the tournament's own matches.
+
+create function create_tournament_partitions(t int) returns void as $$
+begin
+	execute format('create table if not exists %I partition of playertournaments for values in (%s)',
+	               'playertournaments_' || t, t);
+	execute format('create table if not exists %I partition of tournamentmatches for values in (%s)',
+	               'tournamentmatches_' || t, t);
+end;
+$$ language plpgsql;
+
+create function tournament_partitions_inserted() returns trigger as $$
+begin
+	perform create_tournament_partitions(new.id);
+	return null;
+end;
+$$ language plpgsql;
+
+drop view swissPairingsMT;
+drop view playerStandingsRankMT;
+drop view playerStandingsMT;
+
+alter table playertournaments rename to playertournaments_unpartitioned;
+alter table tournamentmatches rename to tournamentmatches_unpartitioned;
+
+create table playertournaments(
+	id serial,
+	player int references players(id),
+	tournament int not null references tournaments(id),
+	primary key (tournament, id)
+) partition by list (tournament);
+
+create table playertournaments_default partition of playertournaments default;
+
+create table tournamentmatches(
+	id serial,
+	tournament int not null references tournaments(id),
+	player1 int references players(id),
+	player2 int references players(id),
+	winner int references players(id),
+	primary key (tournament, id)
+) partition by list (tournament);
+
+create table tournamentmatches_default partition of tournamentmatches default;
+
+select create_tournament_partitions(id) from tournaments;
+
+-- No triggers are on the new tables yet: player_tournament_stats already
+-- holds these rows.
+insert into playertournaments (id, player, tournament)
+select id, player, tournament from playertournaments_unpartitioned
+ where tournament is not null;
+insert into tournamentmatches (id, tournament, player1, player2, winner)
+select id, tournament, player1, player2, winner from tournamentmatches_unpartitioned
+ where tournament is not null;
+
+select setval(pg_get_serial_sequence('playertournaments', 'id'),
+              coalesce((select max(id) from playertournaments_unpartitioned), 0) + 1, false);
+select setval(pg_get_serial_sequence('tournamentmatches', 'id'),
+              coalesce((select max(id) from tournamentmatches_unpartitioned), 0) + 1, false);
+
+drop table playertournaments_unpartitioned;
+drop table tournamentmatches_unpartitioned;
+
+create trigger tournaments_partitions_insert after insert on tournaments
+	for each row execute procedure tournament_partitions_inserted();
+
+create trigger playertournaments_stats_insert after insert on playertournaments
+	referencing new table as new_registrations
+	for each statement execute procedure player_tournament_stats_registered();
+create trigger tournamentmatches_stats_insert after insert on tournamentmatches
+	referencing new table as new_matches
+	for each statement execute procedure player_tournament_stats_matches_inserted();
+create trigger tournamentmatches_stats_change after update or delete or truncate on tournamentmatches
+	for each statement execute procedure player_tournament_stats_matches_changed();
+
+create trigger tournamentmatches_cache_versions_insert after insert on tournamentmatches
+	referencing new table as changed_rows
+	for each statement execute procedure cache_versions_changed();
+create trigger tournamentmatches_cache_versions_update after update on tournamentmatches
+	referencing new table as changed_rows
+	for each statement execute procedure cache_versions_changed();
+create trigger tournamentmatches_cache_versions_delete after delete on tournamentmatches
+	referencing old table as changed_rows
+	for each statement execute procedure cache_versions_changed();
+create trigger tournamentmatches_cache_versions_truncate after truncate on tournamentmatches
+	for each statement execute procedure cache_versions_bump('-2');
+
+create trigger playertournaments_cache_versions_insert after insert on playertournaments
+	referencing new table as changed_rows
+	for each statement execute procedure cache_versions_changed();
+create trigger playertournaments_cache_versions_update after update on playertournaments
+	referencing new table as changed_rows
+	for each statement execute procedure cache_versions_changed();
+create trigger playertournaments_cache_versions_delete after delete on playertournaments
+	referencing old table as changed_rows
+	for each statement execute procedure cache_versions_changed();
+create trigger playertournaments_cache_versions_truncate after truncate on playertournaments
+	for each statement execute procedure cache_versions_bump('-2');
+
+create index tournamentmatches_tournament_player1_player2_idx
+	on tournamentmatches (tournament, player1, player2);
+create index tournamentmatches_tournament_player2_player1_idx
+	on tournamentmatches (tournament, player2, player1);
+create index tournamentmatches_tournament_winner_idx
+	on tournamentmatches (tournament, winner);
+create index playertournaments_tournament_player_idx
+	on playertournaments (tournament, player);
+
+create view playerStandingsMT as
+select 	playertournaments.tournament,
+		players.id, 
+		players.name, 
+		player_tournament_stats.wins,
+		player_tournament_stats.omw,
+		player_tournament_stats.matches
+from players
+join playertournaments on players.id = playertournaments.player
+join player_tournament_stats on player_tournament_stats.tournament = playertournaments.tournament
+                            and player_tournament_stats.player = players.id
+order by playertournaments.tournament, wins desc, omw desc;
+
+create view playerStandingsRankMT as
+select 	row_number() over (PARTITION BY tournament ORDER BY wins desc, OMW desc) as rank,
+		playerStandingsMT.*
+from playerStandingsMT
+order by tournament, wins desc, OMW desc;
+
+create view swissPairingsMT as 
+select 	players1.id as id1,
+		players1.name as name1,
+		players2.id as id2,
+		players2.name as name2,
+		players1.rank as rank1,
+		players2.rank as rank2,
+		players1.wins as win1,
+		players2.wins as win2,
+		case 	when exists ( select 1 from tournamentmatches m where m.tournament = players1.tournament
+		                  and m.player1 = players1.id and m.player2 = players2.id) then 1
+				when exists ( select 1 from tournamentmatches m where m.tournament = players1.tournament
+				  and m.player1 = players2.id and m.player2 = players1.id) then 1
+				else 0 end as matchedBefore,
+		players1.tournament
+from playerStandingsRankMT players1 
+left outer join playerStandingsRankMT players2
+  on players1.rank + 1 = players2.rank
+  and mod(players2.rank,2) = 0
+  and players1.tournament = players2.tournament
+where mod(players1.rank,2) = 1
+ order by rank1;
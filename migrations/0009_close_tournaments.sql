@@ -0,0 +1,126 @@
+-- Migration 9: close tournaments.
+--
+-- closeTournament() writes a tournament's final standings to
+-- tournament_results and sets tournaments.closed_at, after which triggers
+-- reject new registrations and matches of the tournament. Its matches can
+-- then be moved out of tournamentmatches into the tournament_archive schema.
+
+alter table tournaments add column closed_at timestamp;
+
+-- Final standings of closed tournaments, written once by closeTournament()
+-- and read instead of the live standings from then on, one row per rank.
+-- The columns after name are those of tournament_tiebreaks.COLUMNS.
+create table tournament_results(
+	tournament int references tournaments(id) on delete cascade,
+	rank int,
+	player int references players(id),
+	name text,
+	wins int not null,
+	draws int not null,
+	points int not null,
+	matches int not null,
+	buchholz int not null,
+	median_buchholz int not null,
+	sonneborn_berger int not null,
+	omw int not null,
+	opponent_points int not null,
+	primary key (tournament, rank)
+);
+
+-- Rejects new or changed registrations and matches of closed tournaments.
+-- The tournaments are locked FOR SHARE first, so a statement that runs
+-- while closeTournament() is closing one waits for it, and then sees it
+-- closed. Rows can still be deleted, so closed tournaments can be removed.
+create function tournament_closed_check() returns trigger as $$
+begin
+	perform 1 from tournaments
+	  where id in (select tournament from changed_rows)
+	  for share;
+	if exists (select 1 from tournaments
+	            where id in (select tournament from changed_rows)
+	              and closed_at is not null) then
+		raise exception 'tournament is closed' using errcode = 'check_violation';
+	end if;
+	return null;
+end;
+$$ language plpgsql;
+
+create trigger playertournaments_closed_insert after insert on playertournaments
+	referencing new table as changed_rows
+	for each statement execute procedure tournament_closed_check();
+create trigger playertournaments_closed_update after update on playertournaments
+	referencing new table as changed_rows
+	for each statement execute procedure tournament_closed_check();
+create trigger tournamentmatches_closed_insert after insert on tournamentmatches
+	referencing new table as changed_rows
+	for each statement execute procedure tournament_closed_check();
+create trigger tournamentmatches_closed_update after update on tournamentmatches
+	referencing new table as changed_rows
+	for each statement execute procedure tournament_closed_check();
+
+-- Archived matches of closed tournaments, one table per tournament.
+create schema tournament_archive;
+
+-- Moves a tournament's matches partition out of tournamentmatches into the
+-- tournament_archive schema, without its foreign keys, so that live queries
+-- and refresh_player_tournament_stats() no longer see its rows. The table
+-- is renamed after the time it is archived, as a tournament id may be
+-- registered again once the tournament is deleted.
+create function archive_tournament_matches(t int) returns void as $$
+declare
+	matchesTable text := 'tournamentmatches_' || t;
+	archivedTable text := matchesTable || '_' || to_char(now(), 'YYYYMMDDHH24MISS');
+	constraintName text;
+begin
+	execute format('alter table tournamentmatches detach partition %I', matchesTable);
+	for constraintName in
+		select conname from pg_constraint
+		 where conrelid = format('%I', matchesTable)::regclass and contype = 'f'
+	loop
+		execute format('alter table %I drop constraint %I', matchesTable, constraintName);
+	end loop;
+	execute format('alter table %I rename to %I', matchesTable, archivedTable);
+	execute format('alter table %I set schema tournament_archive', archivedTable);
+end;
+$$ language plpgsql;
+
+-- Recomputes player_tournament_stats from scratch, in a single scan of
+-- tournamentmatches, after tournament matches are updated or deleted.
+-- Closed tournaments keep their stats, as their matches may be archived.
+create or replace function refresh_player_tournament_stats() returns void as $$
+	with participations as (
+		select m.tournament, p.player, p.opponent, m.winner
+		  from tournamentmatches m
+		 cross join lateral (values (m.player1, m.player2),
+		                            (m.player2, m.player1)) as p(player, opponent)
+		 where p.player is not null
+	), stats as (
+		select tournament,
+		       player,
+		       count(*) filter (where winner = player) as wins,
+		       count(*) filter (where winner is null) as draws,
+		       count(*) as matches
+		  from participations
+		 group by tournament, player
+	), omw as (
+		select o.tournament, o.player, sum(stats.wins) as omw
+		  from (select distinct tournament, player, opponent
+		          from participations
+		         where opponent is not null) o
+		  join stats on stats.tournament = o.tournament
+		            and stats.player = o.opponent
+		 group by o.tournament, o.player
+	)
+	update player_tournament_stats s
+	   set wins = coalesce(stats.wins, 0),
+	       draws = coalesce(stats.draws, 0),
+	       matches = coalesce(stats.matches, 0),
+	       omw = coalesce(omw.omw, 0)
+	  from player_tournament_stats p
+	  left join stats on stats.tournament = p.tournament
+	                 and stats.player = p.player
+	  left join omw on omw.tournament = p.tournament
+	               and omw.player = p.player
+	 where s.tournament = p.tournament and s.player = p.player
+	   and p.tournament not in (select id from tournaments where closed_at is not null);
+$$ language sql;
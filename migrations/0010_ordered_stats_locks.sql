@@ -0,0 +1,165 @@
+-- Migration 10: lock stats rows in key order.
+--
+-- The triggers that add new matches to player_stats and
+-- player_tournament_stats update the rows of the matches' players and of
+-- the winners' opponents. They now lock those rows first, in key order, so
+-- that concurrent reports wait for each other rather than deadlock, and
+-- compute their changes from the results committed before them.
+
+-- Adds a statement's new matches to player_stats. OMW is updated first,
+-- while player_stats still holds the wins from before the statement: each
+-- new win adds one to the OMW of every opponent the winner has played, and
+-- each opponent met for the first time adds the wins they had so far.
+create or replace function player_stats_matches_inserted() returns trigger as $$
+begin
+	-- Locks the rows of the statement's players, then those of the winners'
+	-- opponents, each in key order. Concurrent reports sharing a player then
+	-- wait for each other instead of deadlocking, and each statement below
+	-- reads the others' committed results.
+	perform 1 from player_stats s
+	 where s.player in (select player1 from new_matches
+	                    union
+	                    select player2 from new_matches)
+	 order by s.player
+	   for update;
+	perform 1 from player_stats s
+	 where s.player in (select m.player2 from matches m
+	                     where m.player1 in (select winner from new_matches)
+	                    union
+	                    select m.player1 from matches m
+	                     where m.player2 in (select winner from new_matches))
+	 order by s.player
+	   for update;
+
+	update player_stats s
+	   set omw = s.omw + d.omw
+	  from (select g.player, sum(g.omw) as omw
+	          from (select o.opponent as player, w.wins as omw
+	                  from (select winner, count(*) as wins
+	                          from new_matches
+	                         where winner is not null
+	                         group by winner) w
+	                 cross join lateral (select m.player2 as opponent from matches m
+	                                      where m.player1 = w.winner
+	                                     union
+	                                     select m.player1 from matches m
+	                                      where m.player2 = w.winner) o
+	                 where o.opponent is not null
+	                union all
+	                select p.player, o.wins
+	                  from (select distinct p.player, p.opponent
+	                          from new_matches n
+	                         cross join lateral (values (n.player1, n.player2),
+	                                                    (n.player2, n.player1)) as p(player, opponent)
+	                         where p.player is not null
+	                           and p.opponent is not null) p
+	                  join player_stats o on o.player = p.opponent
+	                 where not exists (select 1 from matches m
+	                                    where ((m.player1 = p.player and m.player2 = p.opponent)
+	                                        or (m.player1 = p.opponent and m.player2 = p.player))
+	                                      and not exists (select 1 from new_matches n
+	                                                       where n.id = m.id))) g
+	         group by g.player) d
+	 where s.player = d.player;
+
+	update player_stats s
+	   set wins = s.wins + n.wins,
+	       draws = s.draws + n.draws,
+	       matches = s.matches + n.matches
+	  from (select p.player,
+	               count(*) filter (where p.winner = p.player) as wins,
+	               count(*) filter (where p.winner is null) as draws,
+	               count(*) as matches
+	          from (select player1 as player, winner from new_matches
+	                union all
+	                select player2 as player, winner from new_matches) p
+	         where p.player is not null
+	         group by p.player) n
+	 where s.player = n.player;
+	return null;
+end;
+$$ language plpgsql;
+
+-- Adds a statement's new tournament matches to player_tournament_stats,
+-- updating OMW incrementally as player_stats_matches_inserted() does, within
+-- each match's tournament.
+create or replace function player_tournament_stats_matches_inserted() returns trigger as $$
+begin
+	insert into player_tournament_stats (tournament, player)
+	select distinct n.tournament, p.player
+	  from new_matches n
+	 cross join lateral (values (n.player1), (n.player2)) as p(player)
+	 where n.tournament is not null and p.player is not null
+	on conflict do nothing;
+
+	-- Locks rows in key order, as player_stats_matches_inserted() does.
+	perform 1 from player_tournament_stats s
+	 where (s.tournament, s.player) in (select tournament, player1 from new_matches
+	                                    union
+	                                    select tournament, player2 from new_matches)
+	 order by s.tournament, s.player
+	   for update;
+	perform 1 from player_tournament_stats s
+	 where (s.tournament, s.player) in (select m.tournament, m.player2 from tournamentmatches m
+	                                     where (m.tournament, m.player1) in
+	                                           (select tournament, winner from new_matches)
+	                                    union
+	                                    select m.tournament, m.player1 from tournamentmatches m
+	                                     where (m.tournament, m.player2) in
+	                                           (select tournament, winner from new_matches))
+	 order by s.tournament, s.player
+	   for update;
+
+	update player_tournament_stats s
+	   set omw = s.omw + d.omw
+	  from (select g.tournament, g.player, sum(g.omw) as omw
+	          from (select w.tournament, o.opponent as player, w.wins as omw
+	                  from (select tournament, winner, count(*) as wins
+	                          from new_matches
+	                         where winner is not null
+	                         group by tournament, winner) w
+	                 cross join lateral (select m.player2 as opponent from tournamentmatches m
+	                                      where m.tournament = w.tournament
+	                                        and m.player1 = w.winner
+	                                     union
+	                                     select m.player1 from tournamentmatches m
+	                                      where m.tournament = w.tournament
+	                                        and m.player2 = w.winner) o
+	                 where o.opponent is not null
+	                union all
+	                select p.tournament, p.player, o.wins
+	                  from (select distinct n.tournament, p.player, p.opponent
+	                          from new_matches n
+	                         cross join lateral (values (n.player1, n.player2),
+	                                                    (n.player2, n.player1)) as p(player, opponent)
+	                         where p.player is not null
+	                           and p.opponent is not null) p
+	                  join player_tournament_stats o on o.tournament = p.tournament
+	                                                and o.player = p.opponent
+	                 where not exists (select 1 from tournamentmatches m
+	                                    where m.tournament = p.tournament
+	                                      and ((m.player1 = p.player and m.player2 = p.opponent)
+	                                        or (m.player1 = p.opponent and m.player2 = p.player))
+	                                      and not exists (select 1 from new_matches n
+	                                                       where n.id = m.id))) g
+	         group by g.tournament, g.player) d
+	 where s.tournament = d.tournament and s.player = d.player;
+
+	update player_tournament_stats s
+	   set wins = s.wins + n.wins,
+	       draws = s.draws + n.draws,
+	       matches = s.matches + n.matches
+	  from (select p.tournament,
+	               p.player,
+	               count(*) filter (where p.winner = p.player) as wins,
+	               count(*) filter (where p.winner is null) as draws,
+	               count(*) as matches
+	          from (select tournament, player1 as player, winner from new_matches
+	                union all
+	                select tournament, player2 as player, winner from new_matches) p
+	         where p.player is not null
+	         group by p.tournament, p.player) n
+	 where s.tournament = n.tournament and s.player = n.player;
+	return null;
+end;
+$$ language plpgsql;
@@ -0,0 +1,32 @@
+-- Migration 11: bump cache versions only once shared mode is in use.
+--
+-- Every write used to update a cache_versions row of its tournament, and of
+-- the matches or the whole database, so all the writers of a tournament
+-- queued on one row even with the read cache disabled. The triggers now do
+-- nothing until tournament_cache.enable(shared=True) adds the row -3.
+
+-- Bumps the version given as the trigger's argument.
+create or replace function cache_versions_bump() returns trigger as $$
+begin
+	if not exists (select 1 from cache_versions where tournament = -3) then
+		return null;
+	end if;
+	insert into cache_versions (tournament, version)
+	values (TG_ARGV[0]::int, 1)
+	on conflict (tournament) do update set version = cache_versions.version + 1;
+	return null;
+end;
+$$ language plpgsql;
+
+-- Bumps the version of each tournament among the statement's rows.
+create or replace function cache_versions_changed() returns trigger as $$
+begin
+	if not exists (select 1 from cache_versions where tournament = -3) then
+		return null;
+	end if;
+	insert into cache_versions (tournament, version)
+	select distinct tournament, 1 from changed_rows where tournament is not null
+	on conflict (tournament) do update set version = cache_versions.version + 1;
+	return null;
+end;
+$$ language plpgsql;
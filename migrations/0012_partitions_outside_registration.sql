@@ -0,0 +1,76 @@
+-- Migration 12: create tournament partitions outside registration.
+--
+-- A trigger on tournaments created each tournament's partitions inside the
+-- transaction that registered it, so concurrent registrations and reports
+-- locked playertournaments and tournamentmatches in different orders and
+-- deadlocked. registerTournament() now creates the partitions first, in a
+-- transaction of its own, and deleteTournaments() drops the partitions of
+-- the deleted tournaments.
+--
+-- Migration 8 gave the rebuilt tables new id sequences, named *_id_seq1,
+-- after dropping the old ones; they get back their usual names.
+
+drop trigger tournaments_partitions_insert on tournaments;
+drop function tournament_partitions_inserted();
+
+-- Creates the playertournaments and tournamentmatches partitions of a
+-- tournament that is not registered yet, if they do not exist. Partition
+-- DDL locks the parent tables, so callers run it outside the transactions
+-- that write to them: an advisory lock serializes it, the parents are
+-- always locked in the same order, and lock_timeout keeps it from holding
+-- one parent while it queues behind writers of the other. A timed out call
+-- can be retried.
+create or replace function create_tournament_partitions(t int) returns void as $$
+begin
+	perform pg_advisory_xact_lock(hashtext('tournament_partitions'));
+	if exists (select 1 from tournaments where id = t) then
+		return;
+	end if;
+	perform set_config('lock_timeout', '100ms', true);
+	if to_regclass(format('%I', 'playertournaments_' || t)) is null then
+		execute format('create table %I partition of playertournaments for values in (%s)',
+		               'playertournaments_' || t, t);
+	end if;
+	if to_regclass(format('%I', 'tournamentmatches_' || t)) is null then
+		execute format('create table %I partition of tournamentmatches for values in (%s)',
+		               'tournamentmatches_' || t, t);
+	end if;
+end;
+$$ language plpgsql;
+
+-- Drops the partitions of tournaments that no longer exist, with the same
+-- locking as create_tournament_partitions().
+create function drop_tournament_partitions() returns void as $$
+declare
+	partitionName text;
+begin
+	perform pg_advisory_xact_lock(hashtext('tournament_partitions'));
+	perform set_config('lock_timeout', '100ms', true);
+	for partitionName in
+		select partitions.relname
+		  from pg_inherits
+		  join pg_class partitions on partitions.oid = pg_inherits.inhrelid
+		 where pg_inherits.inhparent in ('playertournaments'::regclass, 'tournamentmatches'::regclass)
+		   and partitions.relname not in ('playertournaments_default', 'tournamentmatches_default')
+		   and not exists (select 1 from tournaments
+		                    where partitions.relname in ('playertournaments_' || tournaments.id,
+		                                                 'tournamentmatches_' || tournaments.id))
+		 order by pg_inherits.inhparent = 'tournamentmatches'::regclass, partitions.relname
+	loop
+		execute format('drop table %I', partitionName);
+	end loop;
+end;
+$$ language plpgsql;
+
+do $$
+begin
+	if to_regclass('playertournaments_id_seq1') is not null
+	   and to_regclass('playertournaments_id_seq') is null then
+		alter sequence playertournaments_id_seq1 rename to playertournaments_id_seq;
+	end if;
+	if to_regclass('tournamentmatches_id_seq1') is not null
+	   and to_regclass('tournamentmatches_id_seq') is null then
+		alter sequence tournamentmatches_id_seq1 rename to tournamentmatches_id_seq;
+	end if;
+end;
+$$;
@@ -0,0 +1,41 @@
+-- Migration 13: break standings ties by player id.
+--
+-- Players tied on wins and OMW came out of the OMW and MT standings views
+-- in no particular order, so their ranks, and the pairings built from
+-- them, could differ between two reads of the same data. Ties now go to
+-- the lower id, the order the standings pages already use.
+
+create or replace view playerStandingsOMW as
+select 	players.id, 
+		players.name, 
+		player_stats.wins,
+		player_stats.omw,
+		player_stats.matches
+from players
+join player_stats on player_stats.player = players.id
+order by wins desc, omw desc, id;
+
+create or replace view playerStandingsRankOMW as
+select 	row_number() over (ORDER BY wins desc, OMW desc, id) as rank,
+		playerStandingsOMW.*
+from playerStandingsOMW
+order by wins desc, OMW desc, id;
+
+create or replace view playerStandingsMT as
+select 	playertournaments.tournament,
+		players.id, 
+		players.name, 
+		player_tournament_stats.wins,
+		player_tournament_stats.omw,
+		player_tournament_stats.matches
+from players
+join playertournaments on players.id = playertournaments.player
+join player_tournament_stats on player_tournament_stats.tournament = playertournaments.tournament
+                            and player_tournament_stats.player = players.id
+order by playertournaments.tournament, wins desc, omw desc, players.id;
+
+create or replace view playerStandingsRankMT as
+select 	row_number() over (PARTITION BY tournament ORDER BY wins desc, OMW desc, id) as rank,
+		playerStandingsMT.*
+from playerStandingsMT
+order by tournament, wins desc, OMW desc, id;
@@ -0,0 +1,39 @@
+-- Migration 14: archive matches left in the default partition.
+--
+-- A tournament whose partitions could not be created when it was
+-- registered keeps its matches in tournamentmatches_default, and
+-- archive_tournament_matches() failed to detach the partition it does not
+-- have, rolling back closeTournament(). It now copies those rows to the
+-- archive table and deletes them from the default partition.
+
+-- Moves a tournament's matches partition out of tournamentmatches into the
+-- tournament_archive schema, without its foreign keys, so that live queries
+-- and refresh_player_tournament_stats() no longer see its rows. The table
+-- is renamed after the time it is archived, as a tournament id may be
+-- registered again once the tournament is deleted. A tournament registered
+-- without partitions has its matches in the default partition; those rows
+-- are copied to the archive table and deleted from there instead.
+create or replace function archive_tournament_matches(t int) returns void as $$
+declare
+	matchesTable text := 'tournamentmatches_' || t;
+	archivedTable text := matchesTable || '_' || to_char(now(), 'YYYYMMDDHH24MISS');
+	constraintName text;
+begin
+	if to_regclass(format('%I', matchesTable)) is null then
+		execute format('create table tournament_archive.%I as '
+		               'select * from tournamentmatches_default where tournament = %s',
+		               archivedTable, t);
+		delete from tournamentmatches_default where tournament = t;
+		return;
+	end if;
+	execute format('alter table tournamentmatches detach partition %I', matchesTable);
+	for constraintName in
+		select conname from pg_constraint
+		 where conrelid = format('%I', matchesTable)::regclass and contype = 'f'
+	loop
+		execute format('alter table %I drop constraint %I', matchesTable, constraintName);
+	end loop;
+	execute format('alter table %I rename to %I', matchesTable, archivedTable);
+	execute format('alter table %I set schema tournament_archive', archivedTable);
+end;
+$$ language plpgsql;
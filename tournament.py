@@ -4,42 +4,709 @@
 # tournament.py -- implementation of a Swiss-system tournament
 #
 
+import functools
+import io
+import itertools
+import logging
+import multiprocessing
+import os
 import psycopg2
+import psycopg2.errorcodes
+import psycopg2.extensions
+import psycopg2.pool
+import random
+import threading
+import time
+import tournament_cache
+import tournament_matching
+import tournament_stats
+import tournament_tiebreaks
+
+# Connection settings. Each can be overridden from the environment, or by
+# calling configurePool() before the first query is run.
+DSN = os.environ.get("TOURNAMENT_DSN", "dbname=tournament")
+POOL_MINCONN = int(os.environ.get("TOURNAMENT_POOL_MIN", "1"))
+POOL_MAXCONN = int(os.environ.get("TOURNAMENT_POOL_MAX", "10"))
+# Seconds connect() waits for a connection when POOL_MAXCONN are in use.
+POOL_TIMEOUT = float(os.environ.get("TOURNAMENT_POOL_TIMEOUT", "30"))
+# When set, every checkout also runs "SELECT 1" on the connection. This
+# catches connections dropped by the server, at the cost of a round trip.
+POOL_PING = os.environ.get("TOURNAMENT_POOL_PING", "0") == "1"
+
+# Pairing modes of swissPairingsOMW() and swissPairingsMT(), see
+# tournament_matching.
+PAIRING_SWAP = tournament_matching.PAIRING_SWAP
+PAIRING_MATCHING = tournament_matching.PAIRING_MATCHING
+
+# swissPairingsAllTournaments() pairs tournaments of at least this many
+# players in a process pool, and smaller ones in the calling process.
+PARALLEL_PAIRING_PLAYERS = int(
+    os.environ.get("TOURNAMENT_PARALLEL_PAIRING_PLAYERS", "1000"))
+
+# Rows fetched per round trip by iterStandings() and iterPairings(), which
+# also pairs each batch of this many players on its own.
+STREAM_BATCH_SIZE = int(os.environ.get("TOURNAMENT_STREAM_BATCH_SIZE",
+                                       tournament_matching.STREAM_BATCH_SIZE))
+
+_pool = None
+# The _Checkouts of _pool.
+_checkouts = None
+# Connection used for partition DDL only, outside the pool, and its lock.
+_ddlConnection = None
+_ddlLock = threading.Lock()
+# The _Precomputer thread while enablePrecompute() is in effect.
+_precomputer = None
+# True when enablePrecompute() enabled the read cache, for disablePrecompute()
+# to disable it again.
+_precomputeCache = False
+
+_log = logging.getLogger("tournament")
+# Numbers the server-side cursors of the streaming functions.
+_streamIds = itertools.count(1)
+
+
+class TournamentConnection(psycopg2.extensions.connection):
+    """A database connection that remembers its prepared statements.
+
+    Prepared statements live as long as the server session, so a pooled
+    connection only needs to prepare each statement once.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(TournamentConnection, self).__init__(*args, **kwargs)
+        self.prepared = set()
+        # The _Checkouts slot this connection holds while checked out.
+        self.checkouts = None
+
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault("cursor_factory", TournamentCursor)
+        return super(TournamentConnection, self).cursor(*args, **kwargs)
+
+
+class TournamentCursor(psycopg2.extensions.cursor):
+    """A cursor that counts its statements and fetched rows for
+    tournament_stats."""
+
+    def execute(self, query, vars=None):
+        tournament_stats.recordQuery()
+        return super(TournamentCursor, self).execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        tournament_stats.recordQuery()
+        return super(TournamentCursor, self).executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, *args, **kwargs):
+        tournament_stats.recordQuery()
+        return super(TournamentCursor, self).copy_expert(sql, file, *args,
+                                                         **kwargs)
+
+    def fetchone(self):
+        row = super(TournamentCursor, self).fetchone()
+        if row is not None:
+            tournament_stats.recordRows(1)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = super(TournamentCursor, self).fetchmany(*args, **kwargs)
+        tournament_stats.recordRows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super(TournamentCursor, self).fetchall()
+        tournament_stats.recordRows(len(rows))
+        return rows
+
+
+class _Checkouts(object):
+    """Counts the connections checked out of a pool, so that connect() waits
+    for one to be given back instead of failing when all are in use."""
+
+    def __init__(self, size):
+        self.size = size
+        self.used = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, timeout):
+        """Takes a slot. Returns False if none was free within timeout
+        seconds."""
+        deadline = time.time() + timeout
+        with self.condition:
+            while self.used >= self.size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            self.used = self.used + 1
+            return True
+
+    def release(self):
+        with self.condition:
+            self.used = self.used - 1
+            self.condition.notify()
+
+
+def configurePool(dsn=None, minconn=None, maxconn=None, ping=None,
+                  timeout=None):
+    """Changes the connection pool settings.
+
+    Any existing pool is closed; a new one is created on the next connect().
+
+    Args:
+      dsn: libpq connection string, e.g. "dbname=tournament host=db1"
+      minconn: number of connections opened when the pool is created
+      maxconn: maximum number of connections handed out at the same time
+      ping: if True, run "SELECT 1" on every checkout
+      timeout: seconds connect() waits for a connection when maxconn are
+               in use
+    """
+    global DSN, POOL_MINCONN, POOL_MAXCONN, POOL_PING, POOL_TIMEOUT
+    closePool()
+    if dsn is not None:
+        DSN = dsn
+    if minconn is not None:
+        POOL_MINCONN = minconn
+    if maxconn is not None:
+        POOL_MAXCONN = maxconn
+    if ping is not None:
+        POOL_PING = ping
+    if timeout is not None:
+        POOL_TIMEOUT = timeout
+
+
+def closePool():
+    """Closes every connection in the pool, and the partition DDL one."""
+    global _pool, _checkouts, _ddlConnection
+    if _pool is not None:
+        _pool.closeall()
+        _pool = None
+        _checkouts = None
+    with _ddlLock:
+        if _ddlConnection is not None:
+            _ddlConnection.close()
+            _ddlConnection = None
+
+
+def getPool():
+    """Returns the connection pool, creating it on first use."""
+    global _pool, _checkouts
+    if _pool is None:
+        _pool = psycopg2.pool.ThreadedConnectionPool(
+            POOL_MINCONN, POOL_MAXCONN, DSN,
+            connection_factory=TournamentConnection)
+        _checkouts = _Checkouts(POOL_MAXCONN)
+    return _pool
+
+
+def isHealthy(db):
+    """Returns True if the connection can be used to run queries."""
+    if db.closed:
+        return False
+    status = db.get_transaction_status()
+    if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if POOL_PING:
+        try:
+            cursor = db.cursor()
+            cursor.execute("SELECT 1")
+            db.rollback()
+        except psycopg2.Error:
+            return False
+    return True
 
 
 def connect():
-    """Connect to the PostgreSQL database.  Returns a database connection."""
-    return psycopg2.connect("dbname=tournament")
+    """Connect to the PostgreSQL database.  Returns a database connection.
 
+    The connection is checked out of the module connection pool and must be
+    given back with release() rather than closed. While POOL_MAXCONN
+    connections are checked out, this waits up to POOL_TIMEOUT seconds for
+    one to be released, then raises psycopg2.pool.PoolError.
+    """
+    pool = getPool()
+    checkouts = _checkouts
+    if not checkouts.acquire(POOL_TIMEOUT):
+        raise psycopg2.pool.PoolError(
+            "no connection released within %s seconds" % POOL_TIMEOUT)
+    try:
+        # Each broken connection is discarded, so this ends after at most
+        # POOL_MAXCONN retries, or when the pool itself raises.
+        for attempt in range(POOL_MAXCONN + 1):
+            db = pool.getconn()
+            if isHealthy(db):
+                tournament_stats.recordConnection()
+                db.checkouts = checkouts
+                return db
+            pool.putconn(db, close=True)
+    except BaseException:
+        checkouts.release()
+        raise
+    checkouts.release()
+    raise psycopg2.OperationalError("no healthy connection to %s" % DSN)
+
+
+# Standings rows (id, name, wins, omw, matches) of a tournament, completed
+# by the standings_* statements below. They follow the ranking order of
+# player_tournament_stats_ranking_idx: wins, OMW and id, the id ascending.
+_STANDINGS_PAGE = (
+    "SELECT s.player, p.name, s.wins, s.omw, s.matches "
+    "FROM player_tournament_stats s JOIN players p ON p.id = s.player ")
+
+# Standings page rows of a closed tournament, from its final results.
+_RESULTS_PAGE = (
+    "SELECT player, name, wins, omw, matches FROM tournament_results ")
+
+# Standings rows (id, name, wins, omw, matches) of one tournament: those
+# of the tournament_results snapshot, in rank order, once it is closed, or
+# else those of the playerStandingsMT view. The tournament is the query's
+# %(tournament)s parameter.
+_STANDINGS_MT = (
+    "SELECT player, name, wins, omw, matches FROM ("
+    "SELECT rank, player, name, wins, omw, matches FROM tournament_results "
+    "WHERE tournament = %(tournament)s "
+    "UNION ALL "
+    "SELECT NULL, id, name, wins, omw, matches FROM playerStandingsMT "
+    "WHERE tournament = %(tournament)s AND NOT EXISTS ("
+    "SELECT 1 FROM tournament_results WHERE tournament = %(tournament)s)"
+    ") standings ORDER BY rank, wins DESC, omw DESC, player")
+
+# Statements prepared on first use on each connection: name -> (argument
+# types, query). Parameters are referenced as $1, $2, ...
+STATEMENTS = {
+    "register_player":
+        ("text", "INSERT INTO players (name) values($1)"),
+    "count_players":
+        ("", "SELECT COUNT(id) FROM players"),
+    "report_match":
+        ("int, int, int",
+         "INSERT INTO matches (player1,player2,winner) VALUES ($1,$2,$3)"),
+    "matched_before":
+        ("int, int",
+         "SELECT count(*) FROM matches WHERE (player1 = $1 and player2 = $2) "
+         "or (player1 = $2 and player2 = $1)"),
+    "player_standings":
+        ("", "SELECT * FROM playerStandings"),
+    "swiss_pairings":
+        ("", "SELECT id1, name1, id2, name2 FROM swissPairings"),
+    "swiss_pairings_rematch":
+        ("", "SELECT * FROM swissPairings"),
+    "swiss_pairings_draw":
+        ("", "SELECT * FROM swissPairingsDraw"),
+    "swiss_pairings_omw":
+        ("", "SELECT * FROM swissPairingsOMW"),
+    "register_tournament":
+        ("int, text", "INSERT INTO tournaments (id,name) values($1,$2)"),
+    "create_tournament_partitions":
+        ("int", "SELECT create_tournament_partitions($1)"),
+    "drop_tournament_partitions":
+        ("", "SELECT drop_tournament_partitions()"),
+    "register_player_tournament":
+        ("int, int",
+         "INSERT INTO playertournaments (player,tournament) values($1,$2)"),
+    "count_players_tournament":
+        ("int",
+         "SELECT COUNT(player) FROM playertournaments where tournament = $1"),
+    "report_tournament_match":
+        ("int, int, int, int",
+         "INSERT INTO tournamentmatches (tournament,player1,player2,winner) "
+         "VALUES ($1,$2,$3,$4)"),
+    "report_round":
+        ("int[], int[], int[]",
+         "INSERT INTO matches (player1,player2,winner) "
+         "SELECT * FROM unnest($1, $2, $3)"),
+    "report_tournament_round":
+        ("int, int[], int[], int[]",
+         "INSERT INTO tournamentmatches (tournament,player1,player2,winner) "
+         "SELECT $1, * FROM unnest($2, $3, $4)"),
+    "matched_tournament_before":
+        ("int, int, int",
+         "SELECT count(*) FROM tournamentmatches WHERE tournament = $1 "
+         "and ((player1 = $2 and player2 = $3) "
+         "or (player1 = $3 and player2 = $2))"),
+    "played_pairs":
+        ("",
+         "SELECT DISTINCT least(player1, player2), greatest(player1, player2) "
+         "FROM matches "
+         "WHERE player1 IS NOT NULL AND player2 IS NOT NULL"),
+    "played_pairs_tournament":
+        ("int",
+         "SELECT DISTINCT least(player1, player2), greatest(player1, player2) "
+         "FROM tournamentmatches WHERE tournament = $1 "
+         "AND player1 IS NOT NULL AND player2 IS NOT NULL"),
+    "player_standings_mt":
+        ("int", _STANDINGS_MT % {"tournament": "$1"}),
+    "ranked_omw":
+        ("", "SELECT rank, id, name, wins FROM playerStandingsRankOMW "
+             "ORDER BY rank"),
+    "ranked_mt":
+        ("int", "SELECT rank, id, name, wins FROM playerStandingsRankMT "
+                "WHERE tournament = $1 ORDER BY rank"),
+    "ranked_mt_tournaments":
+        ("int[]", "SELECT tournament, rank, id, name, wins "
+                  "FROM playerStandingsRankMT WHERE tournament = ANY($1) "
+                  "ORDER BY tournament, rank"),
+    "played_pairs_tournaments":
+        ("int[]",
+         "SELECT DISTINCT tournament, least(player1, player2), "
+         "greatest(player1, player2) "
+         "FROM tournamentmatches WHERE tournament = ANY($1) "
+         "AND player1 IS NOT NULL AND player2 IS NOT NULL"),
+    "player_standings_omw":
+        ("", "SELECT * FROM playerStandingsOMW"),
+    "swiss_pairings_mt":
+        ("int", "SELECT * FROM swissPairingsMT WHERE tournament = $1"),
+    "standings_top":
+        ("int, int", _STANDINGS_PAGE +
+         "WHERE s.tournament = $1 "
+         "ORDER BY s.wins DESC, s.omw DESC, -s.player DESC LIMIT $2"),
+    "standings_after":
+        ("int, int, int, int, int", _STANDINGS_PAGE +
+         "WHERE s.tournament = $1 AND (s.wins, s.omw, -s.player) < ($2, $3, -$4) "
+         "ORDER BY s.wins DESC, s.omw DESC, -s.player DESC LIMIT $5"),
+    "standings_from":
+        ("int, int, int, int, int", _STANDINGS_PAGE +
+         "WHERE s.tournament = $1 AND (s.wins, s.omw, -s.player) <= ($2, $3, -$4) "
+         "ORDER BY s.wins DESC, s.omw DESC, -s.player DESC LIMIT $5"),
+    "standings_before":
+        ("int, int, int, int, int", _STANDINGS_PAGE +
+         "WHERE s.tournament = $1 AND (s.wins, s.omw, -s.player) > ($2, $3, -$4) "
+         "ORDER BY s.wins, s.omw, -s.player LIMIT $5"),
+    "standings_key":
+        ("int, int",
+         "SELECT wins, omw FROM player_tournament_stats "
+         "WHERE tournament = $1 AND player = $2"),
+    "standings_ahead":
+        ("int, int, int, int",
+         "SELECT count(*) FROM player_tournament_stats "
+         "WHERE tournament = $1 AND (wins, omw, -player) > ($2, $3, -$4)"),
+    "tournament_closed":
+        ("int", "SELECT closed_at IS NOT NULL FROM tournaments WHERE id = $1"),
+    "results_top":
+        ("int, int", _RESULTS_PAGE +
+         "WHERE tournament = $1 ORDER BY rank LIMIT $2"),
+    "results_after":
+        ("int, int, int", _RESULTS_PAGE +
+         "WHERE tournament = $1 AND rank > (SELECT rank FROM tournament_results "
+         "WHERE tournament = $1 AND player = $2) ORDER BY rank LIMIT $3"),
+    "results_rank":
+        ("int, int", "SELECT rank FROM tournament_results "
+                     "WHERE tournament = $1 AND player = $2"),
+    "results_ranks":
+        ("int, int, int", _RESULTS_PAGE +
+         "WHERE tournament = $1 AND rank BETWEEN $2 AND $3 ORDER BY rank"),
+    "tiebreak_order":
+        ("int", "SELECT tiebreaks FROM tournament_tiebreaks "
+                "WHERE tournament = $1"),
+    "set_tiebreak_order":
+        ("int, text[]",
+         "INSERT INTO tournament_tiebreaks (tournament, tiebreaks) "
+         "VALUES ($1, $2) ON CONFLICT (tournament) "
+         "DO UPDATE SET tiebreaks = excluded.tiebreaks"),
+    "player_names":
+        ("", "SELECT id, name FROM players"),
+    "tournament_player_names":
+        ("int",
+         "SELECT players.id, players.name FROM players "
+         "JOIN playertournaments ON players.id = playertournaments.player "
+         "WHERE playertournaments.tournament = $1"),
+    "match_results":
+        ("", "SELECT player1, player2, winner FROM matches"),
+    "tournament_match_results":
+        ("int", "SELECT player1, player2, winner FROM tournamentmatches "
+                "WHERE tournament = $1"),
+    "played_pairs_among":
+        ("int[]",
+         "SELECT DISTINCT least(player1, player2), greatest(player1, player2) "
+         "FROM matches WHERE player1 = ANY($1) AND player2 = ANY($1)"),
+    "played_pairs_tournament_among":
+        ("int, int[]",
+         "SELECT DISTINCT least(player1, player2), greatest(player1, player2) "
+         "FROM tournamentmatches WHERE tournament = $1 "
+         "AND player1 = ANY($2) AND player2 = ANY($2)"),
+    "close_tournament":
+        ("int", "UPDATE tournaments SET closed_at = now() "
+                "WHERE id = $1 AND closed_at IS NULL RETURNING id"),
+    "tournament_results":
+        ("int", "SELECT player, name, wins, draws, points, matches, buchholz, "
+                "median_buchholz, sonneborn_berger, omw, opponent_points "
+                "FROM tournament_results WHERE tournament = $1 ORDER BY rank"),
+    "archive_tournament_matches":
+        ("int", "SELECT archive_tournament_matches($1)"),
+    "round_complete":
+        ("int",
+         "SELECT min(s.matches) = max(s.matches) AND max(s.matches) > 0 "
+         "FROM player_tournament_stats s JOIN tournaments t ON t.id = s.tournament "
+         "WHERE s.tournament = $1 AND t.closed_at IS NULL"),
+    "start_cache_versions":
+        ("", "INSERT INTO cache_versions (tournament, version) VALUES (-3, 1) "
+             "ON CONFLICT (tournament) "
+             "DO UPDATE SET version = cache_versions.version + 1"),
+    "stop_cache_versions":
+        ("", "UPDATE cache_versions SET version = version - 1 "
+             "WHERE tournament = -3 RETURNING version"),
+    "end_cache_versions":
+        ("", "DELETE FROM cache_versions WHERE tournament = -3"),
+    "cache_versions":
+        ("int",
+         "SELECT coalesce(sum(version) FILTER (WHERE tournament = $1), 0), "
+         "coalesce(sum(version) FILTER (WHERE tournament = -2), 0) "
+         "FROM cache_versions WHERE tournament IN ($1, -2)"),
+}
+
+
+def executePrepared(cursor, name, params=()):
+    """Runs one of the STATEMENTS by name, preparing it on first use.
+
+    Args:
+      cursor: a cursor on a connection handed out by connect()
+      name: key of the statement in STATEMENTS
+      params: values for the statement's $1, $2, ... parameters
+    """
+    db = cursor.connection
+    if name not in db.prepared:
+        argtypes, query = STATEMENTS[name]
+        if argtypes:
+            cursor.execute("PREPARE %s (%s) AS %s" % (name, argtypes, query))
+        else:
+            cursor.execute("PREPARE %s AS %s" % (name, query))
+        db.prepared.add(name)
+    if params:
+        placeholders = ",".join(["%s"] * len(params))
+        cursor.execute("EXECUTE %s (%s)" % (name, placeholders), params)
+    else:
+        cursor.execute("EXECUTE %s" % name)
+
+
+def fetchCacheVersions(scope):
+    """Returns the versions of scope and of the whole database from the
+    cache_versions table, for tournament_cache's shared mode.
+
+    Args:
+      scope: a tournament id, or tournament_cache.MATCHES
+    """
+    db = connect()
+    try:
+        cursor = db.cursor()
+        executePrepared(cursor, "cache_versions", (scope,))
+        versions = cursor.fetchone()
+    finally:
+        release(db)
+    return versions
+
+tournament_cache.sharedVersions = fetchCacheVersions
 
+
+def startCacheVersions():
+    """Counts this client in the cache_versions row that makes the triggers
+    keep the versions of tournament_cache's shared mode, adding the row if
+    needed. Writes made before are not counted."""
+    db = connect()
+    try:
+        executePrepared(db.cursor(), "start_cache_versions")
+        db.commit()
+    finally:
+        release(db)
+
+
+def stopCacheVersions():
+    """Counts this client out of the shared mode row again, and removes the
+    row, turning the version triggers off, once no client is left."""
+    db = connect()
+    try:
+        cursor = db.cursor()
+        executePrepared(cursor, "stop_cache_versions")
+        row = cursor.fetchone()
+        if row is not None and row[0] <= 0:
+            executePrepared(cursor, "end_cache_versions")
+        db.commit()
+    finally:
+        release(db)
+
+tournament_cache.startSharedVersions = startCacheVersions
+tournament_cache.stopSharedVersions = stopCacheVersions
+
+
+def _copyValue(value):
+    """Formats a value as a field of COPY's text format."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    elif not isinstance(value, type(u"")):
+        value = u"%s" % (value,)
+    return (value.replace(u"\\", u"\\\\").replace(u"\t", u"\\t")
+            .replace(u"\n", u"\\n").replace(u"\r", u"\\r"))
+
+
+def copyRows(cursor, table, columns, rows):
+    """Loads rows into a table with a single COPY statement.
+
+    Args:
+      cursor: a cursor on a connection handed out by connect()
+      table: name of the table to load
+      columns: list of the column names the rows hold values for
+      rows: list of tuples, one value per column
+    """
+    lines = []
+    for row in rows:
+        lines.append(u"\t".join([_copyValue(value) for value in row]))
+    data = io.StringIO(u"\n".join(lines) + u"\n")
+    query = "COPY %s (%s) FROM STDIN" % (table, ",".join(columns))
+    cursor.copy_expert(query, data)
+
+
+def allocateIds(cursor, table, count):
+    """Takes count values from the serial id sequence of table.
+
+    Returns:
+      A list of count new ids.
+    """
+    query = ("SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+             "FROM generate_series(1, %s)")
+    cursor.execute(query, (table, count))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def release(db):
+    """Gives a connection back to the pool.
+
+    Anything left uncommitted on the connection is rolled back first, so the
+    next caller always starts with a clean transaction.
+    """
+    broken = bool(db.closed)
+    if not broken:
+        status = db.get_transaction_status()
+        if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                db.rollback()
+            except psycopg2.Error:
+                broken = True
+    try:
+        getPool().putconn(db, close=broken)
+    finally:
+        db.checkouts.release()
+
+
+# SQLSTATEs of a transaction aborted because of a concurrent one, which can
+# simply be run again.
+RETRY_SQLSTATES = (psycopg2.errorcodes.SERIALIZATION_FAILURE,
+                   psycopg2.errorcodes.DEADLOCK_DETECTED)
+# Attempts retried() makes in all before letting the error through.
+WRITE_ATTEMPTS = int(os.environ.get("TOURNAMENT_WRITE_ATTEMPTS", "3"))
+
+
+def retried(function):
+    """Decorates a function that writes in a transaction of its own, so that
+    it runs again, after a short random pause, when that transaction is
+    aborted by a serialization failure or a deadlock."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        attempt = 1
+        while True:
+            try:
+                return function(*args, **kwargs)
+            except psycopg2.Error as error:
+                if (error.pgcode not in RETRY_SQLSTATES
+                        or attempt >= WRITE_ATTEMPTS):
+                    raise
+            time.sleep(random.uniform(0, 0.01 * attempt))
+            attempt = attempt + 1
+    return wrapper
+
+
+# SQLSTATEs after which partition DDL is tried again: its lock_timeout ran
+# out, or it deadlocked anyway.
+PARTITION_RETRY_SQLSTATES = (psycopg2.errorcodes.LOCK_NOT_AVAILABLE,
+                             psycopg2.errorcodes.DEADLOCK_DETECTED)
+
+
+def _changePartitions(name, params=()):
+    """Runs one of the partition functions of tournament.sql in a
+    transaction of its own, up to WRITE_ATTEMPTS times.
+
+    The DDL runs on a connection of its own rather than a pooled one, so
+    that a TournamentSession registering a tournament never waits for a
+    second pooled connection while it holds the first.
+
+    Returns:
+      True if it committed, False if every attempt timed out waiting for the
+      parent tables; the rows then stay in, or the partitions wait for, the
+      default partition until a later call.
+    """
+    global _ddlConnection
+    attempt = 1
+    while True:
+        with _ddlLock:
+            if _ddlConnection is None or not isHealthy(_ddlConnection):
+                _ddlConnection = psycopg2.connect(
+                    DSN, connection_factory=TournamentConnection)
+            db = _ddlConnection
+            try:
+                executePrepared(db.cursor(), name, params)
+                db.commit()
+                return True
+            except psycopg2.Error as error:
+                if not db.closed:
+                    db.rollback()
+                if error.pgcode not in PARTITION_RETRY_SQLSTATES:
+                    raise
+        if attempt >= WRITE_ATTEMPTS:
+            return False
+        time.sleep(random.uniform(0, 0.05 * attempt))
+        attempt = attempt + 1
+
+
+def createTournamentPartitions(tournament):
+    """Creates the partitions of a tournament about to be registered. See
+    _changePartitions()."""
+    return _changePartitions("create_tournament_partitions", (tournament,))
+
+
+def dropTournamentPartitions():
+    """Drops the partitions of deleted tournaments. See
+    _changePartitions()."""
+    return _changePartitions("drop_tournament_partitions")
+
+
+@tournament_stats.instrumented
 def deleteMatches():
     """Remove all the match records from the database."""
     db = connect()
-    cursor = db.cursor()
-    query = "DELETE FROM matches"
-    cursor.execute(query)
-    db.commit()
-    db.close()
+    try:
+        cursor = db.cursor()
+        query = "DELETE FROM matches"
+        cursor.execute(query)
+        db.commit()
+        tournament_cache.invalidate(tournament_cache.MATCHES)
+    finally:
+        release(db)
 
+@tournament_stats.instrumented
 def deletePlayers():
     """Remove all the player records from the database."""
     db = connect()
-    cursor = db.cursor()
-    query = "DELETE FROM players"
-    cursor.execute(query)
-    db.commit()
-    db.close()
+    try:
+        cursor = db.cursor()
+        query = "DELETE FROM players"
+        cursor.execute(query)
+        db.commit()
+        tournament_cache.invalidate(tournament_cache.ALL)
+    finally:
+        release(db)
 
+@tournament_stats.instrumented
+@tournament_cache.cached()
 def countPlayers():
     """Returns the number of players currently registered."""
     db = connect()
-    cursor = db.cursor()
-    query = "SELECT COUNT(id) FROM players"
-    cursor.execute(query)
-    playerCount = cursor.fetchall()
-    db.close()
+    try:
+        cursor = db.cursor()
+        executePrepared(cursor, "count_players")
+        playerCount = cursor.fetchall()
+    finally:
+        release(db)
     return int(playerCount[0][0])
 
+@tournament_stats.instrumented
 def registerPlayer(name):
     """Adds a player to the tournament database.
   
@@ -50,12 +717,32 @@ def registerPlayer(name):
       name: the player's full name (need not be unique).
     """
     db = connect()
-    cursor = db.cursor()
-    query = "INSERT INTO players (name) values(%s)"
-    cursor.execute(query,(name,))
-    db.commit()
-    db.close()
+    try:
+        cursor = db.cursor()
+        executePrepared(cursor, "register_player", (name,))
+        db.commit()
+        tournament_cache.invalidate(tournament_cache.MATCHES)
+    finally:
+        release(db)
+
+@tournament_stats.instrumented
+def registerPlayers(names):
+    """Adds many players to the tournament database in one round trip.
+
+    The ids are taken from the players id sequence up front and the rows
+    are then loaded with COPY, so this scales to thousands of players.
+
+    Args:
+      names: list of the players' full names (need not be unique).
+
+    Returns:
+      A list of the ids assigned to the players, in the order of names.
+    """
+    with TournamentSession("READ COMMITTED") as session:
+        return session.registerPlayers(names)
 
+@tournament_stats.instrumented
+@tournament_cache.cached()
 def playerStandings():
     """Returns a list of the players and their win records, sorted by wins.
 
@@ -70,13 +757,16 @@ def playerStandings():
         matches: the number of matches the player has played
     """
     db = connect()
-    cursor = db.cursor()
-    query = "SELECT * FROM playerStandings"
-    cursor.execute(query)
-    standings = cursor.fetchall()
-    db.close()
+    try:
+        cursor = db.cursor()
+        executePrepared(cursor, "player_standings")
+        standings = cursor.fetchall()
+    finally:
+        release(db)
     return standings
 
+@tournament_stats.instrumented
+@tournament_cache.cached()
 def playerStandingsOMW():
     """Returns a list of the players and their win records, sorted by wins and then by OMW.
 
@@ -91,14 +781,160 @@ def playerStandingsOMW():
         OMW: the total number of wins by players they have played against.
         matches: the number of matches the player has played
     """
-    db = connect()
-    cursor = db.cursor()
-    query = "SELECT * FROM playerStandingsOMW"
-    cursor.execute(query)
-    standings = cursor.fetchall()
-    db.close()
-    return standings
+    with TournamentSession() as session:
+        return session.playerStandingsOMW()
+
+@tournament_stats.instrumented
+@tournament_cache.cached("tournament")
+def playerStandingsMT(tournament):
+    """Returns the standings of one tournament, sorted by wins and then by OMW.
+
+    Once the tournament is closed, the rows are read from its final results
+    instead, in their rank order (see closeTournament()).
+
+    Args:
+      tournament: the tournament id
+
+    Returns:
+      A list of tuples, each of which contains (id, name, wins, omw, matches)
+      as in playerStandingsOMW(), counting only the tournament's matches.
+    """
+    with TournamentSession() as session:
+        return session.playerStandingsMT(tournament)
+
+@tournament_stats.instrumented
+@tournament_cache.cached("tournament")
+def playerStandingsTop(tournament, k):
+    """Returns the first k rows of a tournament's standings.
+
+    Unlike playerStandingsMT(), this reads only the k rows, through the
+    index on the ranking order, and lists tied players by id. The pages of a
+    closed tournament follow its final results, in rank order.
+
+    Args:
+      tournament: the tournament id
+      k: number of rows wanted
+
+    Returns:
+      A list of up to k (id, name, wins, omw, matches) tuples.
+    """
+    with TournamentSession() as session:
+        return session.playerStandingsTop(tournament, k)
+
+@tournament_stats.instrumented
+@tournament_cache.cached("tournament")
+def playerStandingsAfter(tournament, after, k):
+    """Returns the page of a tournament's standings that follows a row.
+
+    Pages are keyed by their last row rather than by an offset, so each page
+    costs the same however deep it is:
+
+      page = playerStandingsTop(t, 50)
+      while page:
+          (id, name, wins, omw, matches) = page[-1]
+          page = playerStandingsAfter(t, (wins, omw, id), 50)
+
+    Args:
+      tournament: the tournament id
+      after: (wins, omw, id) of the last row of the previous page; only the
+             id is used once the tournament is closed
+      k: number of rows wanted
+
+    Returns:
+      A list of up to k (id, name, wins, omw, matches) tuples.
+    """
+    with TournamentSession() as session:
+        return session.playerStandingsAfter(tournament, after, k)
+
+@tournament_stats.instrumented
+@tournament_cache.cached("tournament")
+def playerStandingsAround(tournament, player, k):
+    """Returns the rows of a tournament's standings around a player.
+
+    Args:
+      tournament: the tournament id
+      player: the player's id
+      k: number of rows wanted on each side of the player
+
+    Returns:
+      A (rank, rows) tuple: rows holds up to k rows, the player's row and up
+      to k more rows, as (id, name, wins, omw, matches) tuples, and rank is
+      the rank of the first of them. (None, []) if the player is not
+      registered for the tournament.
+    """
+    with TournamentSession() as session:
+        return session.playerStandingsAround(tournament, player, k)
+
+@tournament_stats.instrumented
+def setTiebreakOrder(tournament, order):
+    """Sets the order in which playerStandingsTiebreaks() ranks a tournament.
+
+    Args:
+      tournament: the tournament id
+      order: sequence of names from tournament_tiebreaks.TIEBREAKS, the first
+             deciding, e.g. ("points", "buchholz", "sonneborn_berger")
+    """
+    with TournamentSession("READ COMMITTED") as session:
+        session.setTiebreakOrder(tournament, order)
+
+@tournament_stats.instrumented
+@tournament_cache.cached("tournament")
+def tiebreakOrder(tournament):
+    """Returns the ranking order of a tournament, as a tuple of tiebreak
+    names, tournament_tiebreaks.DEFAULT_ORDER if none was set."""
+    with TournamentSession() as session:
+        return session.tiebreakOrder(tournament)
+
+@tournament_stats.instrumented
+@tournament_cache.cached("tournament")
+def playerStandingsTiebreaks(tournament=None, order=None):
+    """Returns the standings with every tiebreak score.
+
+    The matches are read once and all the scores computed from them, see
+    tournament_tiebreaks. Players are ranked by order, each score descending,
+    and then by id. A closed tournament's rows are its final results, in
+    their rank order unless order is given (see closeTournament()).
+
+    Args:
+      tournament: the tournament id, or None for the matches table
+      order: tiebreak names to rank by; by default the tournament's order
+             (see setTiebreakOrder()), or DEFAULT_ORDER for the matches table
+
+    Returns:
+      A list of tuples laid out as tournament_tiebreaks.COLUMNS:
+      (id, name, wins, draws, points, matches, buchholz, median_buchholz,
+      sonneborn_berger, omw, opponent_points)
+    """
+    with TournamentSession() as session:
+        return session.playerStandingsTiebreaks(tournament, order)
+
+@tournament_stats.instrumented
+def closeTournament(tournament, archive=False):
+    """Closes a tournament and freezes its final standings.
 
+    The rows of playerStandingsTiebreaks(tournament), ranked by the
+    tournament's order, are written to the tournament_results table, and from
+    then on playerStandingsMT(), iterStandings(), playerStandingsTiebreaks()
+    and the standings pages read them from there with a single indexed
+    lookup. Registering players
+    for the tournament or reporting its matches raises IntegrityError.
+
+    Args:
+      tournament: the tournament id
+      archive: if True, also move the tournament's matches out of
+               tournamentmatches, into a table of the tournament_archive
+               schema, so that the live tables only hold open tournaments
+
+    Raises:
+      ValueError: if there is no such tournament or it is already closed
+    """
+    # At READ COMMITTED, the snapshot is read after closing the tournament
+    # has waited for the reports in progress, and so includes them.
+    with TournamentSession("READ COMMITTED") as session:
+        session.closeTournament(tournament, archive)
+
+@tournament_stats.instrumented
+@retried
 def reportMatch(winner, loser):
     """Records the outcome of a single match between two players.
 
@@ -113,12 +949,16 @@ def reportMatch(winner, loser):
     """
 
     db = connect()
-    cursor = db.cursor()
-    query = "INSERT INTO matches (player1,player2,winner) VALUES (%s,%s,%s)"
-    cursor.execute(query,(winner,loser,winner,))
-    db.commit()
-    db.close()
+    try:
+        cursor = db.cursor()
+        executePrepared(cursor, "report_match", (winner,loser,winner,))
+        db.commit()
+        tournament_cache.invalidate(tournament_cache.MATCHES)
+    finally:
+        release(db)
 
+@tournament_stats.instrumented
+@retried
 def reportMatchWithDraw(player1, player2,result):
     """Records the outcome of a single match between two players.
 
@@ -135,17 +975,21 @@ def reportMatchWithDraw(player1, player2,result):
     """
 
     db = connect()
-    cursor = db.cursor()
-    query = "INSERT INTO matches (player1,player2,winner) VALUES (%s,%s,%s)"
-    if(result == 1):
-        cursor.execute(query,(player1,player2,player1,))
-    elif(result == 2):
-        cursor.execute(query,(player1,player2,player2,))
-    elif(result == 0):
-        cursor.execute(query,(player1,player2,None,))
-    db.commit()
-    db.close()
+    try:
+        cursor = db.cursor()
+        if(result == 1):
+            executePrepared(cursor, "report_match", (player1,player2,player1,))
+        elif(result == 2):
+            executePrepared(cursor, "report_match", (player1,player2,player2,))
+        elif(result == 0):
+            executePrepared(cursor, "report_match", (player1,player2,None,))
+        db.commit()
+        tournament_cache.invalidate(tournament_cache.MATCHES)
+    finally:
+        release(db)
 
+@tournament_stats.instrumented
+@retried
 def reportMatchTournamentWithDraw(tournament,player1, player2,result):
     """Records the outcome of a single match between two players.
 
@@ -160,18 +1004,27 @@ def reportMatchTournamentWithDraw(tournament,player1, player2,result):
       This prevents any player from being assigned multiple times,
       until game is over (log2(countPlayers) rounds played.)
     """
-    winner = None
-    if(result == 1):
-        winner = player1
-    elif(result == 2):
-        winner = player2
-    db = connect()
-    cursor = db.cursor()
-    query = "INSERT INTO tournamentmatches (tournament,player1,player2,winner) VALUES (%s,%s,%s,%s)"
-    cursor.execute(query,(tournament,player1,player2,winner,))    
-    db.commit()
-    db.close()
- 
+    with TournamentSession("READ COMMITTED") as session:
+        session.reportMatchTournamentWithDraw(tournament, player1, player2, result)
+
+@tournament_stats.instrumented
+@retried
+def reportRound(tournament, results):
+    """Records the outcomes of a whole round with a single insert.
+
+    Either every result is recorded or, if any of them fails, none is.
+
+    Args:
+      tournament: the tournament id, or None to record the results in matches
+                  as reportMatchWithDraw() does
+      results: list of (player1, player2, result) tuples, encoded as for
+               reportMatchTournamentWithDraw(). player2 may be None for a bye.
+    """
+    with TournamentSession("READ COMMITTED") as session:
+        session.reportRound(tournament, results)
+
+@tournament_stats.instrumented
+@tournament_cache.cached()
 def swissPairings():
     """Returns a list of pairs of players for the next round of a match.
   
@@ -188,13 +1041,16 @@ def swissPairings():
         name2: the second player's name
     """
     db = connect()
-    cursor = db.cursor()
-    query = "SELECT id1, name1, id2, name2 FROM swissPairings"
-    cursor.execute(query)
-    swiss = cursor.fetchall()
-    db.close()
+    try:
+        cursor = db.cursor()
+        executePrepared(cursor, "swiss_pairings")
+        swiss = cursor.fetchall()
+    finally:
+        release(db)
     return swiss
 
+@tournament_stats.instrumented
+@tournament_cache.cached()
 def swissPairingsPreventRematch():
     """Returns a list of pairs of players for the next round of a match.
   
@@ -217,80 +1073,23 @@ def swissPairingsPreventRematch():
 
     """
     db = connect()
-    cursor = db.cursor()
-    query = "SELECT * FROM swissPairings"
-    cursor.execute(query)
-    swiss = cursor.fetchall()
+    try:
+        cursor = db.cursor()
+        executePrepared(cursor, "swiss_pairings_rematch")
+        swiss = cursor.fetchall()
+        played = fetchPlayedPairs(cursor)
+    finally:
+        release(db)
     pairings = []
     for s in swiss:
         pairings.append(list(s))
-    i = 0
-    while(i < len(pairings)):
-        #if two players in the pairing matched before
-        if(pairings[i][8] == 1):
-            j = i - 1
-            isRematchResolved = False
-#perform search on previous pairings:
-#if there exists such a pairing that player1 in the pairing j
-#has equal winnings with the player1 in the pairing i
-#and player2 in the pairing j hase equal winnings with
-#player2 in the pairing i
-#and player1 in the pairing i never matched with player2 in pairing j
-#and player2 in the pairing i never matched with player1 in pairing j
-#then switch player2's of pairing i and pairing j
-            while(j>0):
-                if((pairings[j][7] == pairings[i][7])
-                and (not matchedBefore(pairings[i][0],pairings[j][2]))
-                and (pairings[j][6] == pairings[i][6])
-                and (not matchedBefore(pairings[j][0],pairings[i][0]))):
-                    pid2 = pairings[i][2]
-                    pname2 = pairings[i][3]
-                    prank2 = pairings[i][5]
-                    pwins2 = pairings[i][7]
-                    pairings[i][2] = pairings[j][2]
-                    pairings[i][3] = pairings[j][3]
-                    pairings[i][5] = pairings[j][5]
-                    pairings[i][7] = pairings[j][7]
-                    pairings[j][2] = pid2
-                    pairings[j][3] = pname2
-                    pairings[j][5] = prank2
-                    pairings[j][7] = pwins2
-                    pairings[i][8] = 0
-                    pairings[j][8] = 0
-                    isRematchResolved = True
-                    break
-                j = j - 1
-#if no available pairings found in previous pairings,
-#then search for the subsequent pairings
-            if(not isRematchResolved):
-                j = i + 1
-                while(j < len(pairings)):
-                    if((pairings[j][7] == pairings[i][7])
-                    and (not matchedBefore(pairings[i][0],pairings[j][2]))
-                    and (pairings[j][6] == pairings[i][6])
-                    and (not matchedBefore(pairings[j][0],pairings[i][0]))):
-                        pid2 = pairings[i][2]
-                        pname2 = pairings[i][3]
-                        prank2 = pairings[i][5]
-                        pwins2 = pairings[i][7]
-                        pairings[i][2] = pairings[j][2]
-                        pairings[i][3] = pairings[j][3]
-                        pairings[i][5] = pairings[j][5]
-                        pairings[i][7] = pairings[j][7]
-                        pairings[j][2] = pid2
-                        pairings[j][3] = pname2
-                        pairings[j][5] = prank2
-                        pairings[j][7] = pwins2
-                        pairings[i][8] = 0
-                        pairings[j][8] = 0
-                        isRematchResolved = True
-                        break
-                    j = j + 1
-        i = i + 1
-    db.close()
+    tournament_matching.resolveRematches(
+        pairings, tournament_matching.matchedIn(played), True)
     swiss = tuple(pairings)
     return swiss
 
+@tournament_stats.instrumented
+@tournament_cache.cached()
 def swissPairingsDraw():
     """Returns a list of pairs of players for the next round of a match.
   
@@ -313,75 +1112,25 @@ def swissPairingsDraw():
 
     """
     db = connect()
-    cursor = db.cursor()
-    query = "SELECT * FROM swissPairingsDraw"
-    cursor.execute(query)
-    swiss = cursor.fetchall()
+    try:
+        cursor = db.cursor()
+        executePrepared(cursor, "swiss_pairings_draw")
+        swiss = cursor.fetchall()
+        played = fetchPlayedPairs(cursor)
+    finally:
+        release(db)
     pairings = []
     for s in swiss:
         pairings.append(list(s))
-    i = 0
-    while(i < len(pairings)):
-        #if two players in the pairing matched before
-        if(pairings[i][8] == 1):
-            j = i - 1
-            isRematchResolved = False
-#perform search on previous pairings:
-#if there exists such a pairing that
-#player1 in the pairing i never matched with player2 in pairing j
-#and player2 in the pairing i never matched with player1 in pairing j
-#then switch player2's of pairing i and pairing j
-            while(j>0):
-                if((not matchedBefore(pairings[i][0],pairings[j][2]))
-                and (not matchedBefore(pairings[j][0],pairings[i][2]))):
-                    pid2 = pairings[i][2]
-                    pname2 = pairings[i][3]
-                    prank2 = pairings[i][5]
-                    ppoints2 = pairings[i][7]
-                    pairings[i][2] = pairings[j][2]
-                    pairings[i][3] = pairings[j][3]
-                    pairings[i][5] = pairings[j][5]
-                    pairings[i][7] = pairings[j][7]
-                    pairings[j][2] = pid2
-                    pairings[j][3] = pname2
-                    pairings[j][5] = prank2
-                    pairings[j][7] = ppoints2
-                    pairings[i][8] = 0
-                    pairings[j][8] = 0
-                    isRematchResolved = True
-                    break
-                j = j - 1
-#if no available pairings found in previous pairings,
-#then search for the subsequent pairings
-            if(not isRematchResolved):
-                j = i + 1
-                while(j < len(pairings)):
-                    if((not matchedBefore(pairings[i][0],pairings[j][2]))
-                    and (not matchedBefore(pairings[j][0],pairings[i][2]))):
-                        pid2 = pairings[i][2]
-                        pname2 = pairings[i][3]
-                        prank2 = pairings[i][5]
-                        ppoints2 = pairings[i][7]
-                        pairings[i][2] = pairings[j][2]
-                        pairings[i][3] = pairings[j][3]
-                        pairings[i][5] = pairings[j][5]
-                        pairings[i][7] = pairings[j][7]
-                        pairings[j][2] = pid2
-                        pairings[j][3] = pname2
-                        pairings[j][5] = prank2
-                        pairings[j][7] = ppoints2
-                        pairings[i][8] = 0
-                        pairings[j][8] = 0
-                        isRematchResolved = True
-                        break
-                    j = j + 1
-        i = i + 1
-    db.close()
+    tournament_matching.resolveRematches(
+        pairings, tournament_matching.matchedIn(played), False)
     swiss = tuple(pairings)
     return swiss
 
 
-def swissPairingsOMW():
+@tournament_stats.instrumented
+@tournament_cache.cached()
+def swissPairingsOMW(mode=PAIRING_SWAP):
     """Returns a list of pairs of players for the next round of a match.
   
     Assuming that there are an even number of players registered, each player
@@ -389,6 +1138,9 @@ def swissPairingsOMW():
     player with an equal or nearly-equal win record, that is, a player adjacent
     to him or her in the standings.
   
+    Args:
+      mode: PAIRING_SWAP or PAIRING_MATCHING, see their definitions
+
     Returns:
       A list of tuples, each of which contains (id1, name1, id2, name2,rank1,rank2,wins1,wins2,matchedBefore)
         id1: the first player's unique id
@@ -402,82 +1154,36 @@ def swissPairingsOMW():
         matchedBefore: is 1 if two players matched before, 0 otherwise
 
     """
+    tournament_matching.checkPairingMode(mode)
+    if(mode == PAIRING_MATCHING):
+        db = connect()
+        try:
+            cursor = db.cursor()
+            executePrepared(cursor, "ranked_omw")
+            ranked = cursor.fetchall()
+            played = fetchPlayedPairs(cursor)
+        finally:
+            release(db)
+        return tournament_matching.pairByMatching(ranked, played)
     db = connect()
-    cursor = db.cursor()
-    query = "SELECT * FROM swissPairingsOMW"
-    cursor.execute(query)
-    swiss = cursor.fetchall()
+    try:
+        cursor = db.cursor()
+        executePrepared(cursor, "swiss_pairings_omw")
+        swiss = cursor.fetchall()
+        played = fetchPlayedPairs(cursor)
+    finally:
+        release(db)
     pairings = []
     for s in swiss:
         pairings.append(list(s))
-    i = 0
-    while(i < len(pairings)):
-        #if two players in the pairing matched before
-        if(pairings[i][8] == 1):
-            j = i - 1
-            isRematchResolved = False
-#perform search on previous pairings:
-#if there exists such a pairing that player1 in the pairing j
-#has equal winnings with the player1 in the pairing i
-#and player2 in the pairing j hase equal winnings with
-#player2 in the pairing i
-#and player1 in the pairing i never matched with player2 in pairing j
-#and player2 in the pairing i never matched with player1 in pairing j
-#then switch player2's of pairing i and pairing j
-            while(j>0):
-                if((pairings[j][7] == pairings[i][7])
-                and (not matchedBefore(pairings[i][0],pairings[j][2]))
-                and (pairings[j][6] == pairings[i][6])
-                and (not matchedBefore(pairings[j][0],pairings[i][0]))):
-                    pid2 = pairings[i][2]
-                    pname2 = pairings[i][3]
-                    prank2 = pairings[i][5]
-                    pwins2 = pairings[i][7]
-                    pairings[i][2] = pairings[j][2]
-                    pairings[i][3] = pairings[j][3]
-                    pairings[i][5] = pairings[j][5]
-                    pairings[i][7] = pairings[j][7]
-                    pairings[j][2] = pid2
-                    pairings[j][3] = pname2
-                    pairings[j][5] = prank2
-                    pairings[j][7] = pwins2
-                    pairings[i][8] = 0
-                    pairings[j][8] = 0
-                    isRematchResolved = True
-                    break
-                j = j - 1
-#if no available pairings found in previous pairings,
-#then search for the subsequent pairings
-            if(not isRematchResolved):
-                j = i + 1
-                while(j < len(pairings)):
-                    if((pairings[j][7] == pairings[i][7])
-                    and (not matchedBefore(pairings[i][0],pairings[j][2]))
-                    and (pairings[j][6] == pairings[i][6])
-                    and (not matchedBefore(pairings[j][0],pairings[i][0]))):
-                        pid2 = pairings[i][2]
-                        pname2 = pairings[i][3]
-                        prank2 = pairings[i][5]
-                        pwins2 = pairings[i][7]
-                        pairings[i][2] = pairings[j][2]
-                        pairings[i][3] = pairings[j][3]
-                        pairings[i][5] = pairings[j][5]
-                        pairings[i][7] = pairings[j][7]
-                        pairings[j][2] = pid2
-                        pairings[j][3] = pname2
-                        pairings[j][5] = prank2
-                        pairings[j][7] = pwins2
-                        pairings[i][8] = 0
-                        pairings[j][8] = 0
-                        isRematchResolved = True
-                        break
-                    j = j + 1
-        i = i + 1
-    db.close()
+    tournament_matching.resolveRematches(
+        pairings, tournament_matching.matchedIn(played), True)
     swiss = tuple(pairings)
     return swiss
 
-def swissPairingsMT(tournament):
+@tournament_stats.instrumented
+@tournament_cache.cached("tournament")
+def swissPairingsMT(tournament, mode=PAIRING_SWAP):
     """Returns a list of pairs of players for the next round of a match.
   
     Assuming that there are an even number of players registered, each player
@@ -485,6 +1191,10 @@ def swissPairingsMT(tournament):
     player with an equal or nearly-equal win record, that is, a player adjacent
     to him or her in the standings.
   
+    Args:
+      tournament: the tournament id
+      mode: PAIRING_SWAP or PAIRING_MATCHING, see their definitions
+
     Returns:
       A list of tuples, each of which contains (id1, name1, id2, name2,rank1,rank2,wins1,wins2,matchedBefore)
         id1: the first player's unique id
@@ -498,119 +1208,162 @@ def swissPairingsMT(tournament):
         matchedBefore: is 1 if two players matched before, 0 otherwise
 
     """
-    db = connect()
-    cursor = db.cursor()
-    query = "SELECT * FROM swissPairingsMT WHERE tournament = %s"
-    cursor.execute(query,(tournament,))
-    swiss = cursor.fetchall()
-    pairings = []
-    for s in swiss:
-        pairings.append(list(s))
-    i = 0
-    while(i < len(pairings)):
-        #if two players in the pairing matched before
-        if(pairings[i][8] == 1):
-            j = i - 1
-            isRematchResolved = False
-#perform search on previous pairings:
-#if there exists such a pairing that player1 in the pairing j
-#has equal winnings with the player1 in the pairing i
-#and player2 in the pairing j hase equal winnings with
-#player2 in the pairing i
-#and player1 in the pairing i never matched with player2 in pairing j
-#and player2 in the pairing i never matched with player1 in pairing j
-#then switch player2's of pairing i and pairing j
-            while(j>0):
-                if((pairings[j][7] == pairings[i][7])
-                and (not matchedTournamentBefore(tournament,pairings[i][0],pairings[j][2]))
-                and (pairings[j][6] == pairings[i][6])
-                and (not matchedTournamentBefore(tournament,pairings[j][0],pairings[i][0]))):
-                    pid2 = pairings[i][2]
-                    pname2 = pairings[i][3]
-                    prank2 = pairings[i][5]
-                    pwins2 = pairings[i][7]
-                    pairings[i][2] = pairings[j][2]
-                    pairings[i][3] = pairings[j][3]
-                    pairings[i][5] = pairings[j][5]
-                    pairings[i][7] = pairings[j][7]
-                    pairings[j][2] = pid2
-                    pairings[j][3] = pname2
-                    pairings[j][5] = prank2
-                    pairings[j][7] = pwins2
-                    pairings[i][8] = 0
-                    pairings[j][8] = 0
-                    isRematchResolved = True
-                    break
-                j = j - 1
-#if no available pairings found in previous pairings,
-#then search for the subsequent pairings
-            if(not isRematchResolved):
-                j = i + 1
-                while(j < len(pairings)):
-                    if((pairings[j][7] == pairings[i][7])
-                    and (not matchedTournamentBefore(tournament,pairings[i][0],pairings[j][2]))
-                    and (pairings[j][6] == pairings[i][6])
-                    and (not matchedTournamentBefore(tournament,pairings[j][0],pairings[i][0]))):
-                        pid2 = pairings[i][2]
-                        pname2 = pairings[i][3]
-                        prank2 = pairings[i][5]
-                        pwins2 = pairings[i][7]
-                        pairings[i][2] = pairings[j][2]
-                        pairings[i][3] = pairings[j][3]
-                        pairings[i][5] = pairings[j][5]
-                        pairings[i][7] = pairings[j][7]
-                        pairings[j][2] = pid2
-                        pairings[j][3] = pname2
-                        pairings[j][5] = prank2
-                        pairings[j][7] = pwins2
-                        pairings[i][8] = 0
-                        pairings[j][8] = 0
-                        isRematchResolved = True
-                        break
-                    j = j + 1
-        i = i + 1
-    db.close()
-    swiss = tuple(pairings)
-    return swiss
+    with TournamentSession() as session:
+        return session.swissPairingsMT(tournament, mode)
+
+@tournament_stats.instrumented
+def swissPairingsAllTournaments(tournaments=None, mode=PAIRING_SWAP,
+                                processes=None):
+    """Returns the pairings for the next round of many tournaments at once.
+
+    The standings and played pairs of every tournament are read with one
+    query each, then each tournament is paired as swissPairingsMT() would,
+    those of PARALLEL_PAIRING_PLAYERS players or more in a process pool.
+
+    Args:
+      tournaments: list of tournament ids, or None for every tournament
+      mode: PAIRING_SWAP or PAIRING_MATCHING, see their definitions
+      processes: size of the process pool, by default the number of CPUs
+
+    Returns:
+      A dict of tournament id -> pairings, laid out as swissPairingsMT().
+    """
+    tournament_matching.checkPairingMode(mode)
+    with TournamentSession() as session:
+        work = session.rankedTournaments(tournaments)
+    jobs = [(t, ranked, played, mode) for (t, ranked, played) in work]
+    large = [job for job in jobs if len(job[1]) >= PARALLEL_PAIRING_PLAYERS]
+    small = [job for job in jobs if len(job[1]) < PARALLEL_PAIRING_PLAYERS]
+    pairings = dict(map(tournament_matching.pairTournament, small))
+    if len(large) > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            pairings.update(pool.map(tournament_matching.pairTournament,
+                                     large, 1))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        pairings.update(map(tournament_matching.pairTournament, large))
+    return pairings
 
+@tournament_stats.instrumented
+@tournament_cache.cached()
 def matchedBefore(id1,id2):
     """Checks whether two player has matched before.
     Returns true if they mathced before, false otherwise
     """
     db = connect()
-    cursor = db.cursor()
-    query = "SELECT count(*) FROM matches WHERE (player1 = %s and player2 = %s) or ( player1 = %s and player2 = %s) "
-    cursor.execute(query,(id1,id2,id2,id1,))
-    mathcesBefore = cursor.fetchall()
-    db.close()
+    try:
+        cursor = db.cursor()
+        executePrepared(cursor, "matched_before", (id1,id2,))
+        mathcesBefore = cursor.fetchall()
+    finally:
+        release(db)
     return (int(mathcesBefore[0][0]) > 0)
 
+@tournament_stats.instrumented
+@tournament_cache.cached("tournament")
 def matchedTournamentBefore(tournament,id1,id2):
     """Checks whether two player has matched before.
     Returns true if they mathced before, false otherwise
     """
-    db = connect()
-    cursor = db.cursor()
-    query = "SELECT count(*) FROM tournamentmatches WHERE tournament = %s and ((player1 = %s and player2 = %s) or ( player1 = %s and player2 = %s)) "
-    cursor.execute(query,(tournament,id1,id2,id2,id1,))
-    mathcesBefore = cursor.fetchall()
-    db.close()
-    return (int(mathcesBefore[0][0]) > 0)
+    with TournamentSession() as session:
+        return session.matchedTournamentBefore(tournament, id1, id2)
+
+def iterStandings(tournament=None, batchSize=None):
+    """Yields the standings one row at a time, for exports of large fields.
+
+    The rows are those of playerStandingsOMW(), or of playerStandingsMT() for
+    a tournament, read from a server-side cursor batchSize rows at a time,
+    so memory does not grow with the number of players. The connection is
+    held, in one snapshot, until the generator is exhausted or closed.
+
+    Args:
+      tournament: the tournament id, or None for the matches table
+      batchSize: rows per fetch, STREAM_BATCH_SIZE by default
+    """
+    with TournamentSession() as session:
+        rows = session.iterStandings(tournament, batchSize)
+        try:
+            for row in rows:
+                yield row
+        finally:
+            rows.close()
 
+def iterPairings(tournament=None, mode=PAIRING_SWAP, batchSize=None):
+    """Yields the pairings for the next round one at a time.
+
+    Players are read in rank order from a server-side cursor and paired
+    batchSize players at a time, as swissPairingsOMW() (or swissPairingsMT()
+    for a tournament) pairs the whole field, checking rematches against the
+    pairs played within the batch. Swaps and matching therefore stay within
+    a batch; with a batch of the whole field the pairings are the same.
+
+    Args:
+      tournament: the tournament id, or None for the matches table
+      mode: PAIRING_SWAP or PAIRING_MATCHING
+      batchSize: players per fetch, STREAM_BATCH_SIZE by default, rounded
+                 up to an even number
+
+    Yields:
+      Lists laid out as the rows of swissPairingsOMW() or swissPairingsMT().
+    """
+    tournament_matching.checkPairingMode(mode)
+    with TournamentSession() as session:
+        pairings = session.iterPairings(tournament, mode, batchSize)
+        try:
+            for pairing in pairings:
+                yield pairing
+        finally:
+            pairings.close()
+
+def fetchBatches(cursor, batchSize=None):
+    """Yields the rows of the cursor's result in lists of up to batchSize
+    (STREAM_BATCH_SIZE by default) rows."""
+    batchSize = batchSize or STREAM_BATCH_SIZE
+    while True:
+        rows = cursor.fetchmany(batchSize)
+        if not rows:
+            return
+        yield rows
+
+def fetchPlayedPairs(cursor, tournament=None):
+    """Returns every pair of players who have played each other.
+
+    Loading all pairs in one query lets the pairing functions check for
+    rematches in memory instead of running matchedBefore() for each
+    candidate swap.
+
+    Args:
+      cursor: a cursor on a connection handed out by connect()
+      tournament: the tournament id, or None for the matches table
+
+    Returns:
+      A set of (id1, id2) tuples with id1 < id2.
+    """
+    if tournament is None:
+        executePrepared(cursor, "played_pairs")
+    else:
+        executePrepared(cursor, "played_pairs_tournament", (tournament,))
+    return set(cursor.fetchall())
+
+@tournament_stats.instrumented
 def registerTournament(id,name):
     """Adds a tournament to the tournament database.
+
+    The tournament's own partitions of playertournaments and
+    tournamentmatches are created first, in a transaction of their own.
   
     Args:
       id: id of the tournament must be unique
       name: the tournament's full name (need not be unique).
     """
-    db = connect()
-    cursor = db.cursor()
-    query = "INSERT INTO tournaments (id,name) values(%s,%s)"
-    cursor.execute(query,(id,name,))
-    db.commit()
-    db.close()
+    with TournamentSession("READ COMMITTED") as session:
+        session.registerTournament(id, name)
 
+@tournament_stats.instrumented
+@retried
 def registerPlayerTournament(player, tournament):
     """Adds a player to the tournament database.
   
@@ -620,47 +1373,635 @@ def registerPlayerTournament(player, tournament):
     Args:
       name: the player's full name (need not be unique).
     """
-    db = connect()
-    cursor = db.cursor()
-    query = "INSERT INTO playertournaments (player,tournament) values(%s,%s)"
-    cursor.execute(query,(player, tournament,))
-    db.commit()
-    db.close()    
+    with TournamentSession("READ COMMITTED") as session:
+        session.registerPlayerTournament(player, tournament)
+
 
+@tournament_stats.instrumented
+@retried
+def registerPlayersTournament(pairs):
+    """Adds many players to tournaments in one round trip.
 
+    Args:
+      pairs: list of (player, tournament) tuples.
+
+    Returns:
+      A list of the ids of the new playertournaments rows, in the order of
+      pairs.
+    """
+    with TournamentSession("READ COMMITTED") as session:
+        return session.registerPlayersTournament(pairs)
+
+
+@tournament_stats.instrumented
+@tournament_cache.cached("tournament")
 def countPlayersTournament(tournament):
     """Returns the number of players currently registered for the tournament."""
-    db = connect()
-    cursor = db.cursor()
-    query = "SELECT COUNT(player) FROM playertournaments where tournament = %s"
-    cursor.execute(query,(tournament,))
-    playerCount = cursor.fetchall()
-    db.close()
-    return int(playerCount[0][0])
+    with TournamentSession() as session:
+        return session.countPlayersTournament(tournament)
 
+@tournament_stats.instrumented
 def deletePlayerTournaments():
     """Remove all the player tournament records from the database."""
     db = connect()
-    cursor = db.cursor()
-    query = "DELETE FROM playertournaments"
-    cursor.execute(query)
-    db.commit()
-    db.close()
+    try:
+        cursor = db.cursor()
+        query = "DELETE FROM playertournaments"
+        cursor.execute(query)
+        db.commit()
+        tournament_cache.invalidate(tournament_cache.ALL)
+    finally:
+        release(db)
 
+@tournament_stats.instrumented
 def deleteTournaments():
-    """Remove all the player tournament records from the database."""
+    """Remove all the tournaments, and then their partitions, from the
+    database."""
     db = connect()
-    cursor = db.cursor()
-    query = "DELETE FROM tournaments"
-    cursor.execute(query)
-    db.commit()
-    db.close()    
+    try:
+        cursor = db.cursor()
+        query = "DELETE FROM tournaments"
+        cursor.execute(query)
+        db.commit()
+        tournament_cache.invalidate(tournament_cache.ALL)
+    finally:
+        release(db)
+    dropTournamentPartitions()
     
+@tournament_stats.instrumented
 def deleteTournamentMatches():
     """Remove all the match records from the database."""
     db = connect()
-    cursor = db.cursor()
-    query = "DELETE FROM tournamentmatches"
-    cursor.execute(query)
-    db.commit()
-    db.close()
+    try:
+        cursor = db.cursor()
+        query = "DELETE FROM tournamentmatches"
+        cursor.execute(query)
+        db.commit()
+        tournament_cache.invalidate(tournament_cache.ALL)
+    finally:
+        release(db)
+
+
+def enablePrecompute(modes=(PAIRING_SWAP,), shared=False):
+    """Starts pairing each tournament's next round as soon as its current
+    round is complete, in a background thread.
+
+    After every commit that changes a tournament, through
+    reportMatchTournamentWithDraw(), reportRound() or a TournamentSession,
+    the thread checks whether each registered player has played as many
+    matches as the others. If so it calls swissPairingsMT(tournament), or
+    swissPairingsMT(tournament, mode) for the other modes, which leaves the
+    pairings in the read cache: the same call made afterwards returns them
+    without a query. A result changed since bumps the tournament's cache
+    version, and the pairings are then computed again by that call.
+
+    The pairings are cached in this process only, so the pairing calls have
+    to be made by the process that reports the results. If the read cache
+    is disabled, it is enabled for swissPairingsMT() alone until
+    disablePrecompute(); the other read functions keep querying the
+    database. Pass shared=True when other processes or clients also report
+    results, so that their writes invalidate the precomputed pairings too.
+
+    Args:
+      modes: the pairing modes to precompute
+      shared: enable the read cache in shared mode; see tournament_cache
+
+    Raises:
+      ValueError: if the read cache is enabled for other functions only.
+    """
+    global _precomputer, _precomputeCache
+    modes = tuple(modes)
+    for mode in modes:
+        tournament_matching.checkPairingMode(mode)
+    disablePrecompute()
+    if not tournament_cache.enabled():
+        tournament_cache.enable(shared=shared, functions=["swissPairingsMT"])
+        _precomputeCache = True
+    elif not tournament_cache.enabled("swissPairingsMT"):
+        raise ValueError("the read cache is enabled without swissPairingsMT")
+    _precomputer = _Precomputer(modes)
+    _precomputer.start()
+
+
+def disablePrecompute():
+    """Stops precomputing pairings. A pairing in progress is finished; the
+    pending tournaments are dropped. The read cache is disabled again if
+    enablePrecompute() enabled it."""
+    global _precomputer, _precomputeCache
+    if _precomputer is not None:
+        _precomputer.stop()
+        _precomputer = None
+    if _precomputeCache:
+        _precomputeCache = False
+        tournament_cache.disable()
+
+
+def waitForPrecompute(timeout=None):
+    """Waits until the background thread has paired every tournament
+    scheduled so far.
+
+    Returns:
+      False if timeout seconds passed first, True otherwise.
+    """
+    precomputer = _precomputer
+    if precomputer is None:
+        return True
+    return precomputer.wait(timeout)
+
+
+@tournament_stats.instrumented
+def precomputeRound(tournament, modes=(PAIRING_SWAP,)):
+    """Pairs a tournament's next round in each mode, into the read cache, if
+    its current round is complete. See enablePrecompute().
+
+    Returns:
+      True if the round was complete.
+    """
+    db = connect()
+    try:
+        cursor = db.cursor()
+        executePrepared(cursor, "round_complete", (tournament,))
+        complete = cursor.fetchone()[0]
+    finally:
+        release(db)
+    if not complete:
+        return False
+    for mode in modes:
+        if mode == PAIRING_SWAP:
+            swissPairingsMT(tournament)
+        else:
+            swissPairingsMT(tournament, mode)
+    return True
+
+
+def _committed(*scopes):
+    """Passes the version scopes a committed transaction changed on to the
+    read cache and to the precomputing thread. Called by
+    TournamentSession.commit() and after the writes of tournament_async."""
+    tournament_cache.invalidate(*scopes)
+    precomputer = _precomputer
+    if precomputer is not None:
+        precomputer.schedule([scope for scope in scopes
+                              if scope not in (tournament_cache.MATCHES,
+                                               tournament_cache.ALL)])
+
+
+# Columns of the tournament_results rows made by _resultRows().
+_RESULT_COLUMNS = (("tournament", "rank", "player")
+                   + tournament_tiebreaks.COLUMNS[1:])
+
+
+def _resultRows(tournament, order, names, matches):
+    """Ranks a tournament being closed into its tournament_results rows.
+
+    Args:
+      tournament: the tournament id
+      order: its tiebreak order, or None for the default one
+      names: dict of its players' ids to their names
+      matches: its (player1, player2, winner) match results
+
+    Returns:
+      A list of tuples laid out as _RESULT_COLUMNS, in rank order.
+    """
+    scores = tournament_tiebreaks.computeTiebreaks(matches, names)
+    rows = tournament_tiebreaks.standingsRows(
+        scores, names, order or tournament_tiebreaks.DEFAULT_ORDER)
+    return [(tournament, rank) + tuple(row)
+            for (rank, row) in enumerate(rows, 1)]
+
+
+class _Precomputer(threading.Thread):
+
+    def __init__(self, modes):
+        super(_Precomputer, self).__init__()
+        self.daemon = True
+        self.modes = modes
+        self.condition = threading.Condition()
+        # Tournaments to check, in the order of their commits.
+        self.pending = []
+        self.busy = False
+        self.stopped = False
+
+    def schedule(self, tournaments):
+        with self.condition:
+            for tournament in tournaments:
+                if tournament not in self.pending:
+                    self.pending.append(tournament)
+            self.condition.notify_all()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.pending = []
+            self.condition.notify_all()
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        with self.condition:
+            while (self.pending or self.busy) and not self.stopped:
+                if deadline is None:
+                    self.condition.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self.condition.wait(remaining)
+            return True
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                tournament = self.pending.pop(0)
+                self.busy = True
+            try:
+                precomputeRound(tournament, self.modes)
+            except Exception:
+                # The pairing call then computes the pairings itself.
+                _log.exception("precomputing the pairings of tournament %s "
+                               "failed", tournament)
+            finally:
+                with self.condition:
+                    self.busy = False
+                    self.condition.notify_all()
+
+
+class TournamentSession(object):
+    """Runs several operations on one connection and in one transaction.
+
+    The session is committed when the with block ends normally and rolled
+    back if it raises, so a whole round can be reported, ranked and paired
+    with a single commit:
+
+      with TournamentSession() as session:
+          for (player1, player2, result) in results:
+              session.reportMatchTournamentWithDraw(t, player1, player2, result)
+          pairings = session.swissPairingsMT(t)
+
+    By default the transaction runs at REPEATABLE READ, so standings and
+    pairings read within it see the same snapshot of the other sessions'
+    results. The module's write functions, which make a single change each,
+    run their sessions at READ COMMITTED instead: concurrent reports then
+    wait for the rows they share rather than failing to serialize.
+    """
+
+    def __init__(self, isolationLevel="REPEATABLE READ"):
+        self.isolationLevel = isolationLevel
+        self.db = None
+        self.cursor = None
+        # tournament_cache scopes written since the last commit.
+        self.changed = set()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        try:
+            if excType is None:
+                self.commit()
+        finally:
+            self.close()
+        return False
+
+    def open(self):
+        """Checks a connection out of the pool for this session."""
+        db = connect()
+        try:
+            if self.isolationLevel is not None:
+                db.set_session(isolation_level=self.isolationLevel)
+            self.cursor = db.cursor()
+        except BaseException:
+            release(db)
+            raise
+        self.db = db
+
+    def commit(self):
+        self.db.commit()
+        _committed(*self.changed)
+        self.changed.clear()
+
+    def rollback(self):
+        self.db.rollback()
+        self.changed.clear()
+
+    def close(self):
+        """Rolls back anything uncommitted and gives the connection back."""
+        if self.db is None:
+            return
+        db = self.db
+        self.db = None
+        self.cursor = None
+        self.changed.clear()
+        try:
+            if not db.closed and self.isolationLevel is not None:
+                db.rollback()
+                db.set_session(isolation_level="DEFAULT")
+        finally:
+            release(db)
+
+    def registerPlayer(self, name):
+        """Adds a player to the tournament database. See registerPlayer()."""
+        executePrepared(self.cursor, "register_player", (name,))
+        self.changed.add(tournament_cache.MATCHES)
+
+    def registerTournament(self, id, name):
+        """Adds a tournament. See registerTournament().
+
+        The partitions are created on a connection kept for partition DDL,
+        outside the pool, which waits for the parent tables only briefly: a
+        session that has already written registrations or matches gets the
+        default partition for this tournament instead.
+        """
+        createTournamentPartitions(id)
+        executePrepared(self.cursor, "register_tournament", (id, name))
+        self.changed.add(id)
+
+    def registerPlayerTournament(self, player, tournament):
+        """Adds a player to a tournament. See registerPlayerTournament()."""
+        executePrepared(self.cursor, "register_player_tournament", (player, tournament))
+        self.changed.add(tournament)
+
+    def registerPlayers(self, names):
+        """Adds many players at once. See registerPlayers()."""
+        if not names:
+            return []
+        ids = allocateIds(self.cursor, "players", len(names))
+        copyRows(self.cursor, "players", ("id", "name"), zip(ids, names))
+        self.changed.add(tournament_cache.MATCHES)
+        return ids
+
+    def registerPlayersTournament(self, pairs):
+        """Adds many players to tournaments at once. See registerPlayersTournament()."""
+        if not pairs:
+            return []
+        ids = allocateIds(self.cursor, "playertournaments", len(pairs))
+        rows = [(id, player, tournament)
+                for (id, (player, tournament)) in zip(ids, pairs)]
+        copyRows(self.cursor, "playertournaments",
+                 ("id", "player", "tournament"), rows)
+        self.changed.update(tournament for (player, tournament) in pairs)
+        return ids
+
+    def countPlayersTournament(self, tournament):
+        """Returns the number of players registered for the tournament."""
+        executePrepared(self.cursor, "count_players_tournament", (tournament,))
+        return int(self.cursor.fetchone()[0])
+
+    def reportMatchTournamentWithDraw(self, tournament, player1, player2, result):
+        """Records the outcome of a single match between two players.
+
+        See reportMatchTournamentWithDraw() for the meaning of result.
+        """
+        winner = None
+        if(result == 1):
+            winner = player1
+        elif(result == 2):
+            winner = player2
+        executePrepared(self.cursor, "report_tournament_match",
+                (tournament, player1, player2, winner))
+        self.changed.add(tournament)
+
+    def reportRound(self, tournament, results):
+        """Records the outcomes of a whole round. See reportRound()."""
+        if not results:
+            return
+        players1 = []
+        players2 = []
+        winners = []
+        for (player1, player2, result) in results:
+            players1.append(player1)
+            players2.append(player2)
+            winners.append(
+                tournament_matching.winnerOf(player1, player2, result))
+        if tournament is None:
+            executePrepared(self.cursor, "report_round",
+                    (players1, players2, winners))
+            self.changed.add(tournament_cache.MATCHES)
+        else:
+            executePrepared(self.cursor, "report_tournament_round",
+                    (tournament, players1, players2, winners))
+            self.changed.add(tournament)
+
+    def playerStandingsOMW(self):
+        """Returns the standings sorted by wins and OMW. See playerStandingsOMW()."""
+        executePrepared(self.cursor, "player_standings_omw")
+        return self.cursor.fetchall()
+
+    def playerStandingsMT(self, tournament):
+        """Returns the standings of one tournament. See playerStandingsMT()."""
+        executePrepared(self.cursor, "player_standings_mt", (tournament,))
+        return self.cursor.fetchall()
+
+    def playerStandingsTop(self, tournament, k):
+        """Returns the first k standings rows. See playerStandingsTop()."""
+        if self._closed(tournament):
+            executePrepared(self.cursor, "results_top", (tournament, k))
+        else:
+            executePrepared(self.cursor, "standings_top", (tournament, k))
+        return self.cursor.fetchall()
+
+    def playerStandingsAfter(self, tournament, after, k):
+        """Returns the k standings rows after a row. See playerStandingsAfter()."""
+        (wins, omw, id) = after
+        if self._closed(tournament):
+            executePrepared(self.cursor, "results_after", (tournament, id, k))
+        else:
+            executePrepared(self.cursor, "standings_after",
+                            (tournament, wins, omw, id, k))
+        return self.cursor.fetchall()
+
+    def playerStandingsAround(self, tournament, player, k):
+        """Returns the standings rows around a player. See playerStandingsAround()."""
+        if self._closed(tournament):
+            executePrepared(self.cursor, "results_rank", (tournament, player))
+            row = self.cursor.fetchone()
+            if row is None:
+                return (None, [])
+            rank = max(1, row[0] - k)
+            executePrepared(self.cursor, "results_ranks",
+                            (tournament, rank, row[0] + k))
+            return (rank, self.cursor.fetchall())
+        executePrepared(self.cursor, "standings_key", (tournament, player))
+        key = self.cursor.fetchone()
+        if key is None:
+            return (None, [])
+        (wins, omw) = key
+        executePrepared(self.cursor, "standings_before",
+                        (tournament, wins, omw, player, k))
+        rows = self.cursor.fetchall()
+        rows.reverse()
+        # Counting the players ahead reads only index entries.
+        executePrepared(self.cursor, "standings_ahead",
+                        (tournament, wins, omw, player))
+        rank = int(self.cursor.fetchone()[0]) + 1 - len(rows)
+        executePrepared(self.cursor, "standings_from",
+                        (tournament, wins, omw, player, k + 1))
+        rows.extend(self.cursor.fetchall())
+        return (rank, rows)
+
+    def _closed(self, tournament):
+        """Returns True if the tournament is closed."""
+        executePrepared(self.cursor, "tournament_closed", (tournament,))
+        row = self.cursor.fetchone()
+        return row is not None and row[0]
+
+    def setTiebreakOrder(self, tournament, order):
+        """Sets a tournament's ranking order. See setTiebreakOrder()."""
+        order = tournament_tiebreaks.checkOrder(order)
+        executePrepared(self.cursor, "set_tiebreak_order",
+                        (tournament, list(order)))
+        self.changed.add(tournament)
+
+    def tiebreakOrder(self, tournament):
+        """Returns a tournament's ranking order. See tiebreakOrder()."""
+        executePrepared(self.cursor, "tiebreak_order", (tournament,))
+        row = self.cursor.fetchone()
+        if row is None:
+            return tournament_tiebreaks.DEFAULT_ORDER
+        return tuple(row[0])
+
+    def playerStandingsTiebreaks(self, tournament=None, order=None):
+        """Returns the standings with every tiebreak score. See
+        playerStandingsTiebreaks()."""
+        if tournament is not None:
+            executePrepared(self.cursor, "tournament_results", (tournament,))
+            rows = self.cursor.fetchall()
+            if rows:
+                if order is None:
+                    return rows
+                return tournament_tiebreaks.rankRows(rows, order)
+        if tournament is None:
+            executePrepared(self.cursor, "player_names")
+            names = dict(self.cursor.fetchall())
+            executePrepared(self.cursor, "match_results")
+            matches = self.cursor.fetchall()
+        else:
+            (order, names, matches) = self._tiebreakInputs(tournament, order)
+        scores = tournament_tiebreaks.computeTiebreaks(matches, names)
+        return tournament_tiebreaks.standingsRows(
+            scores, names, order or tournament_tiebreaks.DEFAULT_ORDER)
+
+    def _tiebreakInputs(self, tournament, order=None):
+        """Reads a tournament's tiebreak order, unless order is given, its
+        players' names and its match results, as (order, names, matches)."""
+        if order is None:
+            order = self.tiebreakOrder(tournament)
+        executePrepared(self.cursor, "tournament_player_names", (tournament,))
+        names = dict(self.cursor.fetchall())
+        executePrepared(self.cursor, "tournament_match_results", (tournament,))
+        return (order, names, self.cursor.fetchall())
+
+    def closeTournament(self, tournament, archive=False):
+        """Closes a tournament. See closeTournament()."""
+        executePrepared(self.cursor, "close_tournament", (tournament,))
+        if self.cursor.fetchone() is None:
+            raise ValueError("tournament %r does not exist or is already closed"
+                             % (tournament,))
+        (order, names, matches) = self._tiebreakInputs(tournament)
+        copyRows(self.cursor, "tournament_results", _RESULT_COLUMNS,
+                 _resultRows(tournament, order, names, matches))
+        if archive:
+            executePrepared(self.cursor, "archive_tournament_matches",
+                            (tournament,))
+        self.changed.add(tournament)
+
+    def rankedTournaments(self, tournaments=None):
+        """Reads the standings and played pairs of many tournaments.
+
+        Args:
+          tournaments: list of tournament ids, or None for every tournament
+
+        Returns:
+          A list of (tournament, ranked, played) tuples, one per tournament,
+          ranked being its (rank, id, name, wins) rows in rank order and
+          played its set of played pairs, as from fetchPlayedPairs().
+        """
+        if tournaments is None:
+            self.cursor.execute("SELECT id FROM tournaments ORDER BY id")
+            tournaments = [row[0] for row in self.cursor.fetchall()]
+        tournaments = list(tournaments)
+        ranked = dict((t, []) for t in tournaments)
+        played = dict((t, set()) for t in tournaments)
+        executePrepared(self.cursor, "ranked_mt_tournaments", (tournaments,))
+        for (t, rank, id, name, wins) in self.cursor.fetchall():
+            ranked[t].append((rank, id, name, wins))
+        executePrepared(self.cursor, "played_pairs_tournaments", (tournaments,))
+        for (t, id1, id2) in self.cursor.fetchall():
+            played[t].add((id1, id2))
+        return [(t, ranked[t], played[t]) for t in tournaments]
+
+    def _streamCursor(self, query, params=None):
+        """Runs query on a new server-side cursor and returns the cursor."""
+        cursor = self.db.cursor("stream_%d" % next(_streamIds))
+        cursor.execute(query, params)
+        return cursor
+
+    def iterStandings(self, tournament=None, batchSize=None):
+        """Yields the standings one row at a time. See iterStandings()."""
+        if tournament is None:
+            cursor = self._streamCursor("SELECT * FROM playerStandingsOMW")
+        else:
+            cursor = self._streamCursor(_STANDINGS_MT,
+                                        {"tournament": tournament})
+        try:
+            for rows in fetchBatches(cursor, batchSize):
+                for row in rows:
+                    yield row
+        finally:
+            cursor.close()
+
+    def iterPairings(self, tournament=None, mode=PAIRING_SWAP, batchSize=None):
+        """Yields the pairings one at a time. See iterPairings()."""
+        tournament_matching.checkPairingMode(mode)
+        batchSize = batchSize or STREAM_BATCH_SIZE
+        batchSize = batchSize + batchSize % 2
+        if tournament is None:
+            cursor = self._streamCursor(
+                "SELECT rank, id, name, wins FROM playerStandingsRankOMW "
+                "ORDER BY rank")
+        else:
+            cursor = self._streamCursor(
+                "SELECT rank, id, name, wins FROM playerStandingsRankMT "
+                "WHERE tournament = %s ORDER BY rank", (tournament,))
+        try:
+            for ranked in fetchBatches(cursor, batchSize):
+                ids = [row[1] for row in ranked]
+                if tournament is None:
+                    executePrepared(self.cursor, "played_pairs_among", (ids,))
+                else:
+                    executePrepared(self.cursor,
+                                    "played_pairs_tournament_among",
+                                    (tournament, ids))
+                played = set(self.cursor.fetchall())
+                (_, pairings) = tournament_matching.pairTournament(
+                    (tournament, ranked, played, mode))
+                for pairing in pairings:
+                    yield pairing
+        finally:
+            cursor.close()
+
+    def matchedTournamentBefore(self, tournament, id1, id2):
+        """Returns True if the two players met before in the tournament."""
+        executePrepared(self.cursor, "matched_tournament_before", (tournament, id1, id2))
+        return (int(self.cursor.fetchone()[0]) > 0)
+
+    def swissPairingsMT(self, tournament, mode=PAIRING_SWAP):
+        """Returns the pairings for the next round. See swissPairingsMT()."""
+        tournament_matching.checkPairingMode(mode)
+        if(mode == PAIRING_MATCHING):
+            executePrepared(self.cursor, "ranked_mt", (tournament,))
+            ranked = self.cursor.fetchall()
+            played = fetchPlayedPairs(self.cursor, tournament)
+            return tournament_matching.pairByMatching(ranked, played, tournament)
+        executePrepared(self.cursor, "swiss_pairings_mt", (tournament,))
+        pairings = []
+        for s in self.cursor.fetchall():
+            pairings.append(list(s))
+        played = fetchPlayedPairs(self.cursor, tournament)
+        tournament_matching.resolveRematches(
+            pairings, tournament_matching.matchedIn(played), True)
+        return tuple(pairings)
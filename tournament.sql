@@ -23,18 +23,164 @@ create table matches(
 	winner int references players(id)
 );
 
+-- Standings of each player in matches, kept current by the triggers below
+-- so that the standings views do not rescan matches on every read.
+--   wins: matches won
+--   draws: matches with no winner
+--   matches: matches played
+--   omw: total wins of the distinct opponents played
+create table player_stats(
+	player int primary key references players(id) on delete cascade,
+	wins int not null default 0,
+	draws int not null default 0,
+	matches int not null default 0,
+	omw int not null default 0
+);
+
+create function player_stats_players_inserted() returns trigger as $$
+begin
+	insert into player_stats (player)
+	select id from new_players;
+	return null;
+end;
+$$ language plpgsql;
+
+create trigger players_stats_insert after insert on players
+	referencing new table as new_players
+	for each statement execute procedure player_stats_players_inserted();
+
+-- Adds a statement's new matches to player_stats. OMW is updated first,
+-- while player_stats still holds the wins from before the statement: each
+-- new win adds one to the OMW of every opponent the winner has played, and
+-- each opponent met for the first time adds the wins they had so far.
+create function player_stats_matches_inserted() returns trigger as $$
+begin
+	-- Locks the rows of the statement's players, then those of the winners'
+	-- opponents, each in key order. Concurrent reports sharing a player then
+	-- wait for each other instead of deadlocking, and each statement below
+	-- reads the others' committed results.
+	perform 1 from player_stats s
+	 where s.player in (select player1 from new_matches
+	                    union
+	                    select player2 from new_matches)
+	 order by s.player
+	   for update;
+	perform 1 from player_stats s
+	 where s.player in (select m.player2 from matches m
+	                     where m.player1 in (select winner from new_matches)
+	                    union
+	                    select m.player1 from matches m
+	                     where m.player2 in (select winner from new_matches))
+	 order by s.player
+	   for update;
+
+	update player_stats s
+	   set omw = s.omw + d.omw
+	  from (select g.player, sum(g.omw) as omw
+	          from (select o.opponent as player, w.wins as omw
+	                  from (select winner, count(*) as wins
+	                          from new_matches
+	                         where winner is not null
+	                         group by winner) w
+	                 cross join lateral (select m.player2 as opponent from matches m
+	                                      where m.player1 = w.winner
+	                                     union
+	                                     select m.player1 from matches m
+	                                      where m.player2 = w.winner) o
+	                 where o.opponent is not null
+	                union all
+	                select p.player, o.wins
+	                  from (select distinct p.player, p.opponent
+	                          from new_matches n
+	                         cross join lateral (values (n.player1, n.player2),
+	                                                    (n.player2, n.player1)) as p(player, opponent)
+	                         where p.player is not null
+	                           and p.opponent is not null) p
+	                  join player_stats o on o.player = p.opponent
+	                 where not exists (select 1 from matches m
+	                                    where ((m.player1 = p.player and m.player2 = p.opponent)
+	                                        or (m.player1 = p.opponent and m.player2 = p.player))
+	                                      and not exists (select 1 from new_matches n
+	                                                       where n.id = m.id))) g
+	         group by g.player) d
+	 where s.player = d.player;
+
+	update player_stats s
+	   set wins = s.wins + n.wins,
+	       draws = s.draws + n.draws,
+	       matches = s.matches + n.matches
+	  from (select p.player,
+	               count(*) filter (where p.winner = p.player) as wins,
+	               count(*) filter (where p.winner is null) as draws,
+	               count(*) as matches
+	          from (select player1 as player, winner from new_matches
+	                union all
+	                select player2 as player, winner from new_matches) p
+	         where p.player is not null
+	         group by p.player) n
+	 where s.player = n.player;
+	return null;
+end;
+$$ language plpgsql;
+
+create trigger matches_stats_insert after insert on matches
+	referencing new table as new_matches
+	for each statement execute procedure player_stats_matches_inserted();
+
+-- Recomputes player_stats from scratch, in a single scan of matches. Used
+-- after matches are updated or deleted, which only happens when results
+-- are corrected or cleared.
+create function refresh_player_stats() returns void as $$
+	with participations as (
+		select p.player, p.opponent, m.winner
+		  from matches m
+		 cross join lateral (values (m.player1, m.player2),
+		                            (m.player2, m.player1)) as p(player, opponent)
+		 where p.player is not null
+	), stats as (
+		select player,
+		       count(*) filter (where winner = player) as wins,
+		       count(*) filter (where winner is null) as draws,
+		       count(*) as matches
+		  from participations
+		 group by player
+	), omw as (
+		select o.player, sum(stats.wins) as omw
+		  from (select distinct player, opponent
+		          from participations
+		         where opponent is not null) o
+		  join stats on stats.player = o.opponent
+		 group by o.player
+	)
+	update player_stats s
+	   set wins = coalesce(stats.wins, 0),
+	       draws = coalesce(stats.draws, 0),
+	       matches = coalesce(stats.matches, 0),
+	       omw = coalesce(omw.omw, 0)
+	  from player_stats p
+	  left join stats on stats.player = p.player
+	  left join omw on omw.player = p.player
+	 where s.player = p.player;
+$$ language sql;
+
+create function player_stats_matches_changed() returns trigger as $$
+begin
+	perform refresh_player_stats();
+	return null;
+end;
+$$ language plpgsql;
+
+create trigger matches_stats_change after update or delete or truncate on matches
+	for each statement execute procedure player_stats_matches_changed();
+
 --Create VIEWs for Initial Requirements
 create view playerStandings as
 select 	players.id, 
 		players.name, 
-		(select count(matches.winner)
-			from matches 
-			where players.id = matches.winner) as wins,
-		(select count(*)
-			from matches 
-			where players.id = matches.player1
-			   or players.id = matches.player2) as matches
+		player_stats.wins,
+		player_stats.matches
 from players
+join player_stats on player_stats.player = players.id
 order by wins desc;
 
 create view playerStandingsRank as
@@ -66,20 +212,10 @@ where mod(players1.rank,2) = 1
 create view playerStandingsDraw as
 select 	players.id, 
 		players.name, 
-		(select count(matches.winner)
-			from matches 
-			where players.id = matches.winner) * 3
-		+
-		(select count(*)
-			from matches 
-			where winner is null
-			  and (players.id = matches.player1
-			   or  players.id = matches.player2)) as points,
-		(select count(*)
-			from matches 
-			where players.id = matches.player1
-			   or players.id = matches.player2) as matches
+		player_stats.wins * 3 + player_stats.draws as points,
+		player_stats.matches
 from players
+join player_stats on player_stats.player = players.id
 order by points desc;
 
 create view playerStandingsRankDraw as
@@ -111,31 +247,18 @@ where mod(players1.rank,2) = 1
 create view playerStandingsOMW as
 select 	players.id, 
 		players.name, 
-		(select count(matches.winner)
-			from matches 
-			where players.id = matches.winner) as wins,
-		(select count(m.winner)
-			 from matches m,
-			 (select m.player1 as opponentId
-			from matches m
-			where m.player2 = players.id
-			union 
-			select m.player2 as opponentId
-			from matches m
-			where m.player1 = players.id) OM
-			 where m.winner = OM.opponentId) as omw,
-		(select count(*)
-			from matches 
-			where players.id = matches.player1
-			   or players.id = matches.player2) as matches
+		player_stats.wins,
+		player_stats.omw,
+		player_stats.matches
 from players
-order by wins desc, omw desc;
+join player_stats on player_stats.player = players.id
+order by wins desc, omw desc, id;
 
 create view playerStandingsRankOMW as
-select 	row_number() over (ORDER BY wins desc, OMW desc) as rank,
+select 	row_number() over (ORDER BY wins desc, OMW desc, id) as rank,
 		playerStandingsOMW.*
 from playerStandingsOMW
-order by wins desc, OMW desc;
+order by wins desc, OMW desc, id;
 
 create view swissPairingsOMW as 
 select 	players1.id as id1,
@@ -159,58 +282,440 @@ where mod(players1.rank,2) = 1
  -- Create TABLEs Multiple Tournaments
 create table tournaments(
 	id int primary key,
-	name text
+	name text,
+	closed_at timestamp
 );
 
+-- Registrations and matches are partitioned by tournament, so that reading
+-- one tournament only scans its own partition. registerTournament() creates
+-- a tournament's partitions before it inserts the tournament, in a
+-- transaction of its own; rows of a tournament without one land in the
+-- default partition.
 create table playertournaments(
-	id serial primary key,
+	id serial,
 	player int references players(id),
-	tournament int references tournaments(id)
-);
+	tournament int not null references tournaments(id),
+	primary key (tournament, id)
+) partition by list (tournament);
+
+create table playertournaments_default partition of playertournaments default;
 
 create table tournamentmatches(
-	id serial primary key,
-	tournament int references tournaments(id),
+	id serial,
+	tournament int not null references tournaments(id),
 	player1 int references players(id),
 	player2 int references players(id),
-	winner int references players(id)
+	winner int references players(id),
+	primary key (tournament, id)
+) partition by list (tournament);
+
+create table tournamentmatches_default partition of tournamentmatches default;
+
+-- Creates the playertournaments and tournamentmatches partitions of a
+-- tournament that is not registered yet, if they do not exist. Partition
+-- DDL locks the parent tables, so callers run it outside the transactions
+-- that write to them: an advisory lock serializes it, the parents are
+-- always locked in the same order, and lock_timeout keeps it from holding
+-- one parent while it queues behind writers of the other. A timed out call
+-- can be retried.
+create function create_tournament_partitions(t int) returns void as $$
+begin
+	perform pg_advisory_xact_lock(hashtext('tournament_partitions'));
+	if exists (select 1 from tournaments where id = t) then
+		return;
+	end if;
+	perform set_config('lock_timeout', '100ms', true);
+	if to_regclass(format('%I', 'playertournaments_' || t)) is null then
+		execute format('create table %I partition of playertournaments for values in (%s)',
+		               'playertournaments_' || t, t);
+	end if;
+	if to_regclass(format('%I', 'tournamentmatches_' || t)) is null then
+		execute format('create table %I partition of tournamentmatches for values in (%s)',
+		               'tournamentmatches_' || t, t);
+	end if;
+end;
+$$ language plpgsql;
+
+-- Drops the partitions of tournaments that no longer exist, with the same
+-- locking as create_tournament_partitions().
+create function drop_tournament_partitions() returns void as $$
+declare
+	partitionName text;
+begin
+	perform pg_advisory_xact_lock(hashtext('tournament_partitions'));
+	perform set_config('lock_timeout', '100ms', true);
+	for partitionName in
+		select partitions.relname
+		  from pg_inherits
+		  join pg_class partitions on partitions.oid = pg_inherits.inhrelid
+		 where pg_inherits.inhparent in ('playertournaments'::regclass, 'tournamentmatches'::regclass)
+		   and partitions.relname not in ('playertournaments_default', 'tournamentmatches_default')
+		   and not exists (select 1 from tournaments
+		                    where partitions.relname in ('playertournaments_' || tournaments.id,
+		                                                 'tournamentmatches_' || tournaments.id))
+		 order by pg_inherits.inhparent = 'tournamentmatches'::regclass, partitions.relname
+	loop
+		execute format('drop table %I', partitionName);
+	end loop;
+end;
+$$ language plpgsql;
+
+-- Standings of each player in each tournament, kept current by the
+-- triggers below in the same way as player_stats.
+create table player_tournament_stats(
+	tournament int references tournaments(id) on delete cascade,
+	player int references players(id) on delete cascade,
+	wins int not null default 0,
+	draws int not null default 0,
+	matches int not null default 0,
+	omw int not null default 0,
+	primary key (tournament, player)
 );
 
+create function player_tournament_stats_registered() returns trigger as $$
+begin
+	insert into player_tournament_stats (tournament, player)
+	select distinct tournament, player from new_registrations
+	 where tournament is not null and player is not null
+	on conflict do nothing;
+	return null;
+end;
+$$ language plpgsql;
+
+create trigger playertournaments_stats_insert after insert on playertournaments
+	referencing new table as new_registrations
+	for each statement execute procedure player_tournament_stats_registered();
+
+-- Adds a statement's new tournament matches to player_tournament_stats,
+-- updating OMW incrementally as player_stats_matches_inserted() does, within
+-- each match's tournament.
+create function player_tournament_stats_matches_inserted() returns trigger as $$
+begin
+	insert into player_tournament_stats (tournament, player)
+	select distinct n.tournament, p.player
+	  from new_matches n
+	 cross join lateral (values (n.player1), (n.player2)) as p(player)
+	 where n.tournament is not null and p.player is not null
+	on conflict do nothing;
+
+	-- Locks rows in key order, as player_stats_matches_inserted() does.
+	perform 1 from player_tournament_stats s
+	 where (s.tournament, s.player) in (select tournament, player1 from new_matches
+	                                    union
+	                                    select tournament, player2 from new_matches)
+	 order by s.tournament, s.player
+	   for update;
+	perform 1 from player_tournament_stats s
+	 where (s.tournament, s.player) in (select m.tournament, m.player2 from tournamentmatches m
+	                                     where (m.tournament, m.player1) in
+	                                           (select tournament, winner from new_matches)
+	                                    union
+	                                    select m.tournament, m.player1 from tournamentmatches m
+	                                     where (m.tournament, m.player2) in
+	                                           (select tournament, winner from new_matches))
+	 order by s.tournament, s.player
+	   for update;
+
+	update player_tournament_stats s
+	   set omw = s.omw + d.omw
+	  from (select g.tournament, g.player, sum(g.omw) as omw
+	          from (select w.tournament, o.opponent as player, w.wins as omw
+	                  from (select tournament, winner, count(*) as wins
+	                          from new_matches
+	                         where winner is not null
+	                         group by tournament, winner) w
+	                 cross join lateral (select m.player2 as opponent from tournamentmatches m
+	                                      where m.tournament = w.tournament
+	                                        and m.player1 = w.winner
+	                                     union
+	                                     select m.player1 from tournamentmatches m
+	                                      where m.tournament = w.tournament
+	                                        and m.player2 = w.winner) o
+	                 where o.opponent is not null
+	                union all
+	                select p.tournament, p.player, o.wins
+	                  from (select distinct n.tournament, p.player, p.opponent
+	                          from new_matches n
+	                         cross join lateral (values (n.player1, n.player2),
+	                                                    (n.player2, n.player1)) as p(player, opponent)
+	                         where p.player is not null
+	                           and p.opponent is not null) p
+	                  join player_tournament_stats o on o.tournament = p.tournament
+	                                                and o.player = p.opponent
+	                 where not exists (select 1 from tournamentmatches m
+	                                    where m.tournament = p.tournament
+	                                      and ((m.player1 = p.player and m.player2 = p.opponent)
+	                                        or (m.player1 = p.opponent and m.player2 = p.player))
+	                                      and not exists (select 1 from new_matches n
+	                                                       where n.id = m.id))) g
+	         group by g.tournament, g.player) d
+	 where s.tournament = d.tournament and s.player = d.player;
+
+	update player_tournament_stats s
+	   set wins = s.wins + n.wins,
+	       draws = s.draws + n.draws,
+	       matches = s.matches + n.matches
+	  from (select p.tournament,
+	               p.player,
+	               count(*) filter (where p.winner = p.player) as wins,
+	               count(*) filter (where p.winner is null) as draws,
+	               count(*) as matches
+	          from (select tournament, player1 as player, winner from new_matches
+	                union all
+	                select tournament, player2 as player, winner from new_matches) p
+	         where p.player is not null
+	         group by p.tournament, p.player) n
+	 where s.tournament = n.tournament and s.player = n.player;
+	return null;
+end;
+$$ language plpgsql;
+
+create trigger tournamentmatches_stats_insert after insert on tournamentmatches
+	referencing new table as new_matches
+	for each statement execute procedure player_tournament_stats_matches_inserted();
+
+-- Recomputes player_tournament_stats from scratch, in a single scan of
+-- tournamentmatches, after tournament matches are updated or deleted.
+-- Closed tournaments keep their stats, as their matches may be archived.
+create function refresh_player_tournament_stats() returns void as $$
+	with participations as (
+		select m.tournament, p.player, p.opponent, m.winner
+		  from tournamentmatches m
+		 cross join lateral (values (m.player1, m.player2),
+		                            (m.player2, m.player1)) as p(player, opponent)
+		 where p.player is not null
+	), stats as (
+		select tournament,
+		       player,
+		       count(*) filter (where winner = player) as wins,
+		       count(*) filter (where winner is null) as draws,
+		       count(*) as matches
+		  from participations
+		 group by tournament, player
+	), omw as (
+		select o.tournament, o.player, sum(stats.wins) as omw
+		  from (select distinct tournament, player, opponent
+		          from participations
+		         where opponent is not null) o
+		  join stats on stats.tournament = o.tournament
+		            and stats.player = o.opponent
+		 group by o.tournament, o.player
+	)
+	update player_tournament_stats s
+	   set wins = coalesce(stats.wins, 0),
+	       draws = coalesce(stats.draws, 0),
+	       matches = coalesce(stats.matches, 0),
+	       omw = coalesce(omw.omw, 0)
+	  from player_tournament_stats p
+	  left join stats on stats.tournament = p.tournament
+	                 and stats.player = p.player
+	  left join omw on omw.tournament = p.tournament
+	               and omw.player = p.player
+	 where s.tournament = p.tournament and s.player = p.player
+	   and p.tournament not in (select id from tournaments where closed_at is not null);
+$$ language sql;
+
+create function player_tournament_stats_matches_changed() returns trigger as $$
+begin
+	perform refresh_player_tournament_stats();
+	return null;
+end;
+$$ language plpgsql;
+
+create trigger tournamentmatches_stats_change after update or delete or truncate on tournamentmatches
+	for each statement execute procedure player_tournament_stats_matches_changed();
+
+-- Versions of what the read functions depend on, for tournament_cache's
+-- shared mode: one row per tournament, -1 for the matches and players
+-- tables and -2 for changes that may affect every tournament. Once a client
+-- has enabled shared mode, which adds the row -3, each statement that
+-- writes bumps the versions it affects, whichever client runs it. Until
+-- then writers leave the table alone.
+create table cache_versions(
+	tournament int primary key,
+	version bigint not null default 0
+);
+
+-- Bumps the version given as the trigger's argument.
+create function cache_versions_bump() returns trigger as $$
+begin
+	if not exists (select 1 from cache_versions where tournament = -3) then
+		return null;
+	end if;
+	insert into cache_versions (tournament, version)
+	values (TG_ARGV[0]::int, 1)
+	on conflict (tournament) do update set version = cache_versions.version + 1;
+	return null;
+end;
+$$ language plpgsql;
+
+-- Bumps the version of each tournament among the statement's rows.
+create function cache_versions_changed() returns trigger as $$
+begin
+	if not exists (select 1 from cache_versions where tournament = -3) then
+		return null;
+	end if;
+	insert into cache_versions (tournament, version)
+	select distinct tournament, 1 from changed_rows where tournament is not null
+	on conflict (tournament) do update set version = cache_versions.version + 1;
+	return null;
+end;
+$$ language plpgsql;
+
+create trigger matches_cache_versions after insert or update or delete or truncate on matches
+	for each statement execute procedure cache_versions_bump('-1');
+create trigger players_cache_versions after insert or delete or truncate on players
+	for each statement execute procedure cache_versions_bump('-1');
+-- Player names are part of every tournament's standings.
+create trigger players_cache_versions_update after update on players
+	for each statement execute procedure cache_versions_bump('-2');
+create trigger tournaments_cache_versions after insert or update or delete or truncate on tournaments
+	for each statement execute procedure cache_versions_bump('-2');
+
+create trigger tournamentmatches_cache_versions_insert after insert on tournamentmatches
+	referencing new table as changed_rows
+	for each statement execute procedure cache_versions_changed();
+create trigger tournamentmatches_cache_versions_update after update on tournamentmatches
+	referencing new table as changed_rows
+	for each statement execute procedure cache_versions_changed();
+create trigger tournamentmatches_cache_versions_delete after delete on tournamentmatches
+	referencing old table as changed_rows
+	for each statement execute procedure cache_versions_changed();
+create trigger tournamentmatches_cache_versions_truncate after truncate on tournamentmatches
+	for each statement execute procedure cache_versions_bump('-2');
+
+create trigger playertournaments_cache_versions_insert after insert on playertournaments
+	referencing new table as changed_rows
+	for each statement execute procedure cache_versions_changed();
+create trigger playertournaments_cache_versions_update after update on playertournaments
+	referencing new table as changed_rows
+	for each statement execute procedure cache_versions_changed();
+create trigger playertournaments_cache_versions_delete after delete on playertournaments
+	referencing old table as changed_rows
+	for each statement execute procedure cache_versions_changed();
+create trigger playertournaments_cache_versions_truncate after truncate on playertournaments
+	for each statement execute procedure cache_versions_bump('-2');
+
+-- Ranking order of each tournament's playerStandingsTiebreaks(), as names
+-- from tournament_tiebreaks.TIEBREAKS, the first deciding. Tournaments
+-- without a row are ranked by wins, then OMW.
+create table tournament_tiebreaks(
+	tournament int primary key references tournaments(id) on delete cascade,
+	tiebreaks text[] not null
+);
+
+create trigger tournament_tiebreaks_cache_versions_insert after insert on tournament_tiebreaks
+	referencing new table as changed_rows
+	for each statement execute procedure cache_versions_changed();
+create trigger tournament_tiebreaks_cache_versions_update after update on tournament_tiebreaks
+	referencing new table as changed_rows
+	for each statement execute procedure cache_versions_changed();
+
+-- Final standings of closed tournaments, written once by closeTournament()
+-- and read instead of the live standings from then on, one row per rank.
+-- The columns after name are those of tournament_tiebreaks.COLUMNS.
+create table tournament_results(
+	tournament int references tournaments(id) on delete cascade,
+	rank int,
+	player int references players(id),
+	name text,
+	wins int not null,
+	draws int not null,
+	points int not null,
+	matches int not null,
+	buchholz int not null,
+	median_buchholz int not null,
+	sonneborn_berger int not null,
+	omw int not null,
+	opponent_points int not null,
+	primary key (tournament, rank)
+);
+
+-- Rejects new or changed registrations and matches of closed tournaments.
+-- The tournaments are locked FOR SHARE first, so a statement that runs
+-- while closeTournament() is closing one waits for it, and then sees it
+-- closed. Rows can still be deleted, so closed tournaments can be removed.
+create function tournament_closed_check() returns trigger as $$
+begin
+	perform 1 from tournaments
+	  where id in (select tournament from changed_rows)
+	  for share;
+	if exists (select 1 from tournaments
+	            where id in (select tournament from changed_rows)
+	              and closed_at is not null) then
+		raise exception 'tournament is closed' using errcode = 'check_violation';
+	end if;
+	return null;
+end;
+$$ language plpgsql;
+
+create trigger playertournaments_closed_insert after insert on playertournaments
+	referencing new table as changed_rows
+	for each statement execute procedure tournament_closed_check();
+create trigger playertournaments_closed_update after update on playertournaments
+	referencing new table as changed_rows
+	for each statement execute procedure tournament_closed_check();
+create trigger tournamentmatches_closed_insert after insert on tournamentmatches
+	referencing new table as changed_rows
+	for each statement execute procedure tournament_closed_check();
+create trigger tournamentmatches_closed_update after update on tournamentmatches
+	referencing new table as changed_rows
+	for each statement execute procedure tournament_closed_check();
+
+-- Archived matches of closed tournaments, one table per tournament.
+create schema tournament_archive;
+
+-- Moves a tournament's matches partition out of tournamentmatches into the
+-- tournament_archive schema, without its foreign keys, so that live queries
+-- and refresh_player_tournament_stats() no longer see its rows. The table
+-- is renamed after the time it is archived, as a tournament id may be
+-- registered again once the tournament is deleted. A tournament registered
+-- without partitions has its matches in the default partition; those rows
+-- are copied to the archive table and deleted from there instead.
+create function archive_tournament_matches(t int) returns void as $$
+declare
+	matchesTable text := 'tournamentmatches_' || t;
+	archivedTable text := matchesTable || '_' || to_char(now(), 'YYYYMMDDHH24MISS');
+	constraintName text;
+begin
+	if to_regclass(format('%I', matchesTable)) is null then
+		execute format('create table tournament_archive.%I as '
+		               'select * from tournamentmatches_default where tournament = %s',
+		               archivedTable, t);
+		delete from tournamentmatches_default where tournament = t;
+		return;
+	end if;
+	execute format('alter table tournamentmatches detach partition %I', matchesTable);
+	for constraintName in
+		select conname from pg_constraint
+		 where conrelid = format('%I', matchesTable)::regclass and contype = 'f'
+	loop
+		execute format('alter table %I drop constraint %I', matchesTable, constraintName);
+	end loop;
+	execute format('alter table %I rename to %I', matchesTable, archivedTable);
+	execute format('alter table %I set schema tournament_archive', archivedTable);
+end;
+$$ language plpgsql;
+
  --Create VIEWs for Multiple Tournaments
 create view playerStandingsMT as
 select 	playertournaments.tournament,
 		players.id, 
 		players.name, 
-		(select count(tournamentmatches.winner)
-			from tournamentmatches 
-			where players.id = tournamentmatches.winner
-			  and tournamentmatches.tournament = playertournaments.tournament) as wins,
-		(select count(m.winner)
-			 from tournamentmatches m,
-			 (select m.player1 as opponentId
-			from tournamentmatches m
-			where m.player2 = players.id
-			  and m.tournament = playertournaments.tournament
-			union 
-			select m.player2 as opponentId
-			from tournamentmatches m
-			where m.player1 = players.id
-			  and m.tournament = playertournaments.tournament) OM
-			 where m.winner = OM.opponentId) as omw,
-		(select count(*)
-			from tournamentmatches m
-			where m.tournament = playertournaments.tournament
-			  and (players.id = m.player1
-			   or players.id = m.player2)) as matches
+		player_tournament_stats.wins,
+		player_tournament_stats.omw,
+		player_tournament_stats.matches
 from players
 join playertournaments on players.id = playertournaments.player
-order by playertournaments.tournament, wins desc, omw desc;
+join player_tournament_stats on player_tournament_stats.tournament = playertournaments.tournament
+                            and player_tournament_stats.player = players.id
+order by playertournaments.tournament, wins desc, omw desc, players.id;
 
 create view playerStandingsRankMT as
-select 	row_number() over (PARTITION BY tournament ORDER BY wins desc, OMW desc) as rank,
+select 	row_number() over (PARTITION BY tournament ORDER BY wins desc, OMW desc, id) as rank,
 		playerStandingsMT.*
 from playerStandingsMT
-order by tournament, wins desc, OMW desc;
+order by tournament, wins desc, OMW desc, id;
 
 create view swissPairingsMT as 
 select 	players1.id as id1,
@@ -221,8 +726,10 @@ select 	players1.id as id1,
 		players2.rank as rank2,
 		players1.wins as win1,
 		players2.wins as win2,
-		case 	when exists ( select 1 from matches where player1 = players1.id and player2 = players2.id) then 1
-				when exists ( select 1 from matches where player1 = players2.id and player2 = players1.id) then 1
+		case 	when exists ( select 1 from tournamentmatches m where m.tournament = players1.tournament
+		                  and m.player1 = players1.id and m.player2 = players2.id) then 1
+				when exists ( select 1 from tournamentmatches m where m.tournament = players1.tournament
+				  and m.player1 = players2.id and m.player2 = players1.id) then 1
 				else 0 end as matchedBefore,
 		players1.tournament
 from playerStandingsRankMT players1 
@@ -231,4 +738,45 @@ left outer join playerStandingsRankMT players2
   and mod(players2.rank,2) = 0
   and players1.tournament = players2.tournament
 where mod(players1.rank,2) = 1
- order by rank1;
\ No newline at end of file
+ order by rank1;
+
+ -- Create INDEXes (see migrations/0002_indexes.sql)
+create index matches_player1_player2_idx on matches (player1, player2);
+create index matches_player2_player1_idx on matches (player2, player1);
+create index matches_winner_idx on matches (winner);
+create index tournamentmatches_tournament_player1_player2_idx
+	on tournamentmatches (tournament, player1, player2);
+create index tournamentmatches_tournament_player2_player1_idx
+	on tournamentmatches (tournament, player2, player1);
+create index tournamentmatches_tournament_winner_idx
+	on tournamentmatches (tournament, winner);
+create index playertournaments_tournament_player_idx
+	on playertournaments (tournament, player);
+-- Ranking order of the standings pages (see migrations/0006_ranking_index.sql)
+create index player_tournament_stats_ranking_idx
+	on player_tournament_stats (tournament, wins, omw, (-player));
+
+ -- Schema version. A database created by this script already includes
+ -- every migration in migrations/; tournament_migrate.py applies the ones
+ -- missing from an older database.
+create table schema_migrations(
+	version int primary key,
+	name text,
+	applied_at timestamp default now()
+);
+
+insert into schema_migrations (version, name) values
+	(1, 'player_stats'),
+	(2, 'indexes'),
+	(3, 'set_based_standings'),
+	(4, 'incremental_omw'),
+	(5, 'cache_versions'),
+	(6, 'ranking_index'),
+	(7, 'tournament_tiebreaks'),
+	(8, 'partition_by_tournament'),
+	(9, 'close_tournaments'),
+	(10, 'ordered_stats_locks'),
+	(11, 'cache_versions_opt_in'),
+	(12, 'partitions_outside_registration'),
+	(13, 'standings_id_order'),
+	(14, 'archive_default_partition');
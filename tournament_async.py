@@ -0,0 +1,684 @@
+#!/usr/bin/env python3
+# -*- coding: cp1254 -*-
+#
+# tournament_async.py -- asyncio version of the tournament API
+#
+# Requires Python 3.7 or later and aiopg. Every function of tournament.py
+# listed in tournament_engine.API is a coroutine here, with the same
+# arguments and results, so one event loop can pair and report for many
+# tournaments at once:
+#
+#   async def nextRound(tournament, results):
+#       await tournament_async.reportRound(tournament, results)
+#       return await tournament_async.swissPairingsMT(tournament)
+#
+#   await asyncio.gather(*[nextRound(t, results[t]) for t in tournaments])
+#
+# Connections come from an aiopg pool, created on first use from the same
+# settings as the tournament.py pool (tournament.DSN, POOL_MINCONN and
+# POOL_MAXCONN).
+
+import asyncio
+import concurrent.futures
+import functools
+import random
+import weakref
+
+import aiopg
+import psycopg2
+
+import tournament as blocking
+import tournament_cache
+import tournament_matching
+import tournament_tiebreaks
+from tournament_matching import PAIRING_SWAP, PAIRING_MATCHING
+
+_pool = None
+_poolLock = None
+# aiopg connection -> names of the tournament.STATEMENTS prepared on it.
+_prepared = weakref.WeakKeyDictionary()
+
+
+async def getPool():
+    """Returns the aiopg pool, creating it on first use."""
+    global _pool, _poolLock
+    if _poolLock is None:
+        _poolLock = asyncio.Lock()
+    async with _poolLock:
+        if _pool is None:
+            _pool = await aiopg.create_pool(blocking.DSN,
+                                            minsize=blocking.POOL_MINCONN,
+                                            maxsize=blocking.POOL_MAXCONN)
+    return _pool
+
+
+async def closePool():
+    """Closes every connection of the pool."""
+    global _pool
+    if _pool is not None:
+        pool = _pool
+        _pool = None
+        pool.close()
+        await pool.wait_closed()
+
+
+class _Cursor(object):
+    """Checks a connection out of the pool and opens a cursor on it.
+
+    aiopg connections are in autocommit mode, so when isolationLevel is
+    given the block runs in an explicit transaction, committed when it ends
+    normally and rolled back if it raises.
+    """
+
+    def __init__(self, isolationLevel=None):
+        self.isolationLevel = isolationLevel
+        self.pool = None
+        self.connection = None
+        self.cursor = None
+
+    async def __aenter__(self):
+        self.pool = await getPool()
+        self.connection = await self.pool.acquire()
+        try:
+            self.cursor = await self.connection.cursor()
+            if self.isolationLevel is not None:
+                await self.cursor.execute(
+                    "BEGIN ISOLATION LEVEL %s" % self.isolationLevel)
+        except BaseException:
+            await self.pool.release(self.connection)
+            raise
+        return self.cursor
+
+    async def __aexit__(self, excType, excValue, traceback):
+        try:
+            if self.isolationLevel is not None and not self.connection.closed:
+                if excType is None:
+                    await self.cursor.execute("COMMIT")
+                else:
+                    await self.cursor.execute("ROLLBACK")
+        finally:
+            self.cursor.close()
+            await self.pool.release(self.connection)
+        return False
+
+
+async def executePrepared(cursor, name, params=()):
+    """Runs one of tournament.STATEMENTS by name, preparing it on first use
+    on the cursor's connection."""
+    prepared = _prepared.setdefault(cursor.connection, set())
+    if name not in prepared:
+        argtypes, query = blocking.STATEMENTS[name]
+        if argtypes:
+            await cursor.execute("PREPARE %s (%s) AS %s"
+                                 % (name, argtypes, query))
+        else:
+            await cursor.execute("PREPARE %s AS %s" % (name, query))
+        prepared.add(name)
+    if params:
+        placeholders = ",".join(["%s"] * len(params))
+        await cursor.execute("EXECUTE %s (%s)" % (name, placeholders), params)
+    else:
+        await cursor.execute("EXECUTE %s" % name)
+
+
+def _retried(function):
+    """Decorates a coroutine that writes in a transaction of its own, so that
+    it runs again, after a short random pause, when that transaction is
+    aborted by a serialization failure or a deadlock. See
+    tournament.retried()."""
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        attempt = 1
+        while True:
+            try:
+                return await function(*args, **kwargs)
+            except psycopg2.Error as error:
+                if (error.pgcode not in blocking.RETRY_SQLSTATES
+                        or attempt >= blocking.WRITE_ATTEMPTS):
+                    raise
+            await asyncio.sleep(random.uniform(0, 0.01 * attempt))
+            attempt = attempt + 1
+    return wrapper
+
+
+async def _execute(query, params=None):
+    async with _Cursor() as cursor:
+        await cursor.execute(query, params)
+
+
+async def _fetchPrepared(name, params=()):
+    async with _Cursor() as cursor:
+        await executePrepared(cursor, name, params)
+        return await cursor.fetchall()
+
+
+async def _changePartitions(name, params=()):
+    """Runs a partition function in a transaction of its own. See
+    tournament._changePartitions()."""
+    attempt = 1
+    while True:
+        try:
+            async with _Cursor("READ COMMITTED") as cursor:
+                await executePrepared(cursor, name, params)
+            return True
+        except psycopg2.Error as error:
+            if error.pgcode not in blocking.PARTITION_RETRY_SQLSTATES:
+                raise
+        if attempt >= blocking.WRITE_ATTEMPTS:
+            return False
+        await asyncio.sleep(random.uniform(0, 0.05 * attempt))
+        attempt = attempt + 1
+
+
+async def _fetchPlayedPairs(cursor, tournament=None):
+    if tournament is None:
+        await executePrepared(cursor, "played_pairs")
+    else:
+        await executePrepared(cursor, "played_pairs_tournament",
+                              (tournament,))
+    return set(await cursor.fetchall())
+
+
+async def _allocateIds(cursor, table, count):
+    await cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+                         "FROM generate_series(1, %s)", (table, count))
+    return [row[0] for row in await cursor.fetchall()]
+
+
+async def deleteMatches():
+    """Remove all the match records from the database."""
+    await _execute("DELETE FROM matches")
+    blocking._committed(tournament_cache.MATCHES)
+
+
+async def deletePlayers():
+    """Remove all the player records from the database."""
+    await _execute("DELETE FROM players")
+    blocking._committed(tournament_cache.ALL)
+
+
+async def deletePlayerTournaments():
+    """Remove all the player tournament records from the database."""
+    await _execute("DELETE FROM playertournaments")
+    blocking._committed(tournament_cache.ALL)
+
+
+async def deleteTournaments():
+    """Remove all the tournaments, and then their partitions, from the
+    database."""
+    await _execute("DELETE FROM tournaments")
+    blocking._committed(tournament_cache.ALL)
+    await _changePartitions("drop_tournament_partitions")
+
+
+async def deleteTournamentMatches():
+    """Remove all the tournament match records from the database."""
+    await _execute("DELETE FROM tournamentmatches")
+    blocking._committed(tournament_cache.ALL)
+
+
+async def countPlayers():
+    """Returns the number of players currently registered."""
+    rows = await _fetchPrepared("count_players")
+    return int(rows[0][0])
+
+
+async def registerPlayer(name):
+    """Adds a player. See tournament.registerPlayer()."""
+    async with _Cursor() as cursor:
+        await executePrepared(cursor, "register_player", (name,))
+    blocking._committed(tournament_cache.MATCHES)
+
+
+async def registerPlayers(names):
+    """Adds many players at once and returns their ids, in the order of
+    names. Async connections cannot COPY, so the rows are inserted from
+    arrays."""
+    if not names:
+        return []
+    async with _Cursor() as cursor:
+        ids = await _allocateIds(cursor, "players", len(names))
+        await cursor.execute("INSERT INTO players (id, name) "
+                             "SELECT * FROM unnest(%s::int[], %s::text[])",
+                             (ids, list(names)))
+    blocking._committed(tournament_cache.MATCHES)
+    return ids
+
+
+async def registerTournament(id, name):
+    """Adds a tournament. See tournament.registerTournament()."""
+    await _changePartitions("create_tournament_partitions", (id,))
+    async with _Cursor() as cursor:
+        await executePrepared(cursor, "register_tournament", (id, name))
+    blocking._committed(id)
+
+
+@_retried
+async def registerPlayerTournament(player, tournament):
+    """Adds a player to a tournament."""
+    async with _Cursor() as cursor:
+        await executePrepared(cursor, "register_player_tournament",
+                              (player, tournament))
+    blocking._committed(tournament)
+
+
+@_retried
+async def registerPlayersTournament(pairs):
+    """Adds many players to tournaments at once. Returns the ids
+    of the new playertournaments rows, in the order of pairs."""
+    if not pairs:
+        return []
+    async with _Cursor() as cursor:
+        ids = await _allocateIds(cursor, "playertournaments", len(pairs))
+        await cursor.execute(
+            "INSERT INTO playertournaments (id, player, tournament) "
+            "SELECT * FROM unnest(%s::int[], %s::int[], %s::int[])",
+            (ids, [pair[0] for pair in pairs], [pair[1] for pair in pairs]))
+    blocking._committed(*set(pair[1] for pair in pairs))
+    return ids
+
+
+async def countPlayersTournament(tournament):
+    """Returns the number of players registered for the tournament."""
+    async with _Cursor() as cursor:
+        await executePrepared(cursor, "count_players_tournament",
+                              (tournament,))
+        return int((await cursor.fetchone())[0])
+
+
+async def playerStandings():
+    """Returns (id, name, wins, matches) rows sorted by wins."""
+    return await _fetchPrepared("player_standings")
+
+
+async def playerStandingsOMW():
+    """Returns (id, name, wins, omw, matches) rows sorted by wins and OMW."""
+    async with _Cursor() as cursor:
+        await executePrepared(cursor, "player_standings_omw")
+        return await cursor.fetchall()
+
+
+async def playerStandingsMT(tournament):
+    """Returns the standings of one tournament. See
+    tournament.playerStandingsMT()."""
+    async with _Cursor() as cursor:
+        await executePrepared(cursor, "player_standings_mt", (tournament,))
+        return await cursor.fetchall()
+
+
+async def _closed(cursor, tournament):
+    await executePrepared(cursor, "tournament_closed", (tournament,))
+    row = await cursor.fetchone()
+    return row is not None and row[0]
+
+
+async def playerStandingsTop(tournament, k):
+    """See tournament.playerStandingsTop()."""
+    async with _Cursor("REPEATABLE READ") as cursor:
+        if await _closed(cursor, tournament):
+            await executePrepared(cursor, "results_top", (tournament, k))
+        else:
+            await executePrepared(cursor, "standings_top", (tournament, k))
+        return await cursor.fetchall()
+
+
+async def playerStandingsAfter(tournament, after, k):
+    """See tournament.playerStandingsAfter()."""
+    (wins, omw, id) = after
+    async with _Cursor("REPEATABLE READ") as cursor:
+        if await _closed(cursor, tournament):
+            await executePrepared(cursor, "results_after", (tournament, id, k))
+        else:
+            await executePrepared(cursor, "standings_after",
+                                  (tournament, wins, omw, id, k))
+        return await cursor.fetchall()
+
+
+async def playerStandingsAround(tournament, player, k):
+    """See tournament.playerStandingsAround()."""
+    async with _Cursor("REPEATABLE READ") as cursor:
+        if await _closed(cursor, tournament):
+            await executePrepared(cursor, "results_rank", (tournament, player))
+            row = await cursor.fetchone()
+            if row is None:
+                return (None, [])
+            rank = max(1, row[0] - k)
+            await executePrepared(cursor, "results_ranks",
+                                  (tournament, rank, row[0] + k))
+            return (rank, await cursor.fetchall())
+        await executePrepared(cursor, "standings_key", (tournament, player))
+        key = await cursor.fetchone()
+        if key is None:
+            return (None, [])
+        (wins, omw) = key
+        await executePrepared(cursor, "standings_before",
+                              (tournament, wins, omw, player, k))
+        rows = list(reversed(await cursor.fetchall()))
+        await executePrepared(cursor, "standings_ahead",
+                              (tournament, wins, omw, player))
+        rank = int((await cursor.fetchone())[0]) + 1 - len(rows)
+        await executePrepared(cursor, "standings_from",
+                              (tournament, wins, omw, player, k + 1))
+        rows.extend(await cursor.fetchall())
+        return (rank, rows)
+
+
+async def setTiebreakOrder(tournament, order):
+    """See tournament.setTiebreakOrder()."""
+    order = tournament_tiebreaks.checkOrder(order)
+    async with _Cursor() as cursor:
+        await executePrepared(cursor, "set_tiebreak_order",
+                              (tournament, list(order)))
+    blocking._committed(tournament)
+
+
+async def tiebreakOrder(tournament):
+    """See tournament.tiebreakOrder()."""
+    async with _Cursor() as cursor:
+        await executePrepared(cursor, "tiebreak_order", (tournament,))
+        row = await cursor.fetchone()
+    if row is None:
+        return tournament_tiebreaks.DEFAULT_ORDER
+    return tuple(row[0])
+
+
+async def playerStandingsTiebreaks(tournament=None, order=None):
+    """See tournament.playerStandingsTiebreaks(). The scores are computed in
+    the default executor, off the event loop."""
+    async with _Cursor("REPEATABLE READ") as cursor:
+        if tournament is not None:
+            await executePrepared(cursor, "tournament_results", (tournament,))
+            rows = await cursor.fetchall()
+            if rows:
+                if order is None:
+                    return rows
+                return tournament_tiebreaks.rankRows(rows, order)
+        if tournament is None:
+            await executePrepared(cursor, "player_names")
+            names = dict(await cursor.fetchall())
+            await executePrepared(cursor, "match_results")
+            matches = await cursor.fetchall()
+        else:
+            (order, names, matches) = await _tiebreakInputs(cursor, tournament,
+                                                            order)
+
+    def rank():
+        scores = tournament_tiebreaks.computeTiebreaks(matches, names)
+        return tournament_tiebreaks.standingsRows(
+            scores, names, order or tournament_tiebreaks.DEFAULT_ORDER)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, rank)
+
+
+async def _tiebreakInputs(cursor, tournament, order=None):
+    """See tournament.TournamentSession._tiebreakInputs()."""
+    if order is None:
+        await executePrepared(cursor, "tiebreak_order", (tournament,))
+        row = await cursor.fetchone()
+        if row is not None:
+            order = tuple(row[0])
+    await executePrepared(cursor, "tournament_player_names", (tournament,))
+    names = dict(await cursor.fetchall())
+    await executePrepared(cursor, "tournament_match_results", (tournament,))
+    return (order, names, await cursor.fetchall())
+
+
+# tournament._RESULT_COLUMNS as unnest() arrays: the name is the only text.
+_RESULT_ARRAYS = ", ".join(
+    "%%s::%s[]" % ("text" if column == "name" else "int")
+    for column in blocking._RESULT_COLUMNS)
+
+
+async def closeTournament(tournament, archive=False):
+    """Closes a tournament and freezes its final standings. See
+    tournament.closeTournament(). The rows are ranked by the same code as
+    the blocking version, tournament._resultRows()."""
+    async with _Cursor("READ COMMITTED") as cursor:
+        await executePrepared(cursor, "close_tournament", (tournament,))
+        if await cursor.fetchone() is None:
+            raise ValueError("tournament %r does not exist or is already "
+                             "closed" % (tournament,))
+        (order, names, matches) = await _tiebreakInputs(cursor, tournament)
+        rows = blocking._resultRows(tournament, order, names, matches)
+        if rows:
+            await cursor.execute(
+                "INSERT INTO tournament_results (%s) SELECT * FROM unnest(%s)"
+                % (", ".join(blocking._RESULT_COLUMNS), _RESULT_ARRAYS),
+                [list(column) for column in zip(*rows)])
+        if archive:
+            await executePrepared(cursor, "archive_tournament_matches",
+                                  (tournament,))
+    blocking._committed(tournament)
+
+
+@_retried
+async def reportMatch(winner, loser):
+    """Records a win. loser may be None for a bye."""
+    async with _Cursor() as cursor:
+        await executePrepared(cursor, "report_match", (winner, loser, winner))
+    blocking._committed(tournament_cache.MATCHES)
+
+
+async def reportMatchWithDraw(player1, player2, result):
+    """Records a match. See tournament.reportMatchWithDraw()."""
+    if result in (0, 1, 2):
+        await reportRound(None, [(player1, player2, result)])
+
+
+@_retried
+async def reportMatchTournamentWithDraw(tournament, player1, player2, result):
+    """Records a tournament match. See
+    tournament.reportMatchTournamentWithDraw()."""
+    winner = None
+    if(result == 1):
+        winner = player1
+    elif(result == 2):
+        winner = player2
+    async with _Cursor() as cursor:
+        await executePrepared(cursor, "report_tournament_match",
+                              (tournament, player1, player2, winner))
+    blocking._committed(tournament)
+
+
+@_retried
+async def reportRound(tournament, results):
+    """Records the outcomes of a whole round with a single insert. See
+    tournament.reportRound()."""
+    if not results:
+        return
+    players1 = []
+    players2 = []
+    winners = []
+    for (player1, player2, result) in results:
+        players1.append(player1)
+        players2.append(player2)
+        winners.append(tournament_matching.winnerOf(player1, player2, result))
+    async with _Cursor() as cursor:
+        if tournament is None:
+            await executePrepared(cursor, "report_round",
+                                  (players1, players2, winners))
+        else:
+            await executePrepared(cursor, "report_tournament_round",
+                                  (tournament, players1, players2, winners))
+    if tournament is None:
+        blocking._committed(tournament_cache.MATCHES)
+    else:
+        blocking._committed(tournament)
+
+
+async def _resolvedPairings(select, sameWins, tournament=None):
+    """Reads a swissPairings view with select(cursor) and the played pairs
+    in one snapshot, then swaps pairings to avoid rematches as the
+    functions of tournament.py do."""
+    async with _Cursor("REPEATABLE READ") as cursor:
+        await select(cursor)
+        pairings = [list(row) for row in await cursor.fetchall()]
+        played = await _fetchPlayedPairs(cursor, tournament)
+    tournament_matching.resolveRematches(
+        pairings, tournament_matching.matchedIn(played), sameWins)
+    return tuple(pairings)
+
+
+def _selectPrepared(name):
+    def select(cursor):
+        return executePrepared(cursor, name)
+    return select
+
+
+async def _pairedByMatching(statement, params, tournament=None):
+    """Pairs by maximum weight matching, off the event loop."""
+    async with _Cursor("REPEATABLE READ") as cursor:
+        await executePrepared(cursor, statement, params)
+        ranked = await cursor.fetchall()
+        played = await _fetchPlayedPairs(cursor, tournament)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, tournament_matching.pairByMatching,
+                                      ranked, played, tournament)
+
+
+async def swissPairings():
+    """Returns (id1, name1, id2, name2) pairings. See
+    tournament.swissPairings()."""
+    return await _fetchPrepared("swiss_pairings")
+
+
+async def swissPairingsPreventRematch():
+    """See tournament.swissPairingsPreventRematch()."""
+    return await _resolvedPairings(_selectPrepared("swiss_pairings_rematch"), True)
+
+
+async def swissPairingsDraw():
+    """See tournament.swissPairingsDraw()."""
+    return await _resolvedPairings(_selectPrepared("swiss_pairings_draw"), False)
+
+
+async def swissPairingsOMW(mode=PAIRING_SWAP):
+    """See tournament.swissPairingsOMW()."""
+    tournament_matching.checkPairingMode(mode)
+    if(mode == PAIRING_MATCHING):
+        return await _pairedByMatching("ranked_omw", ())
+    return await _resolvedPairings(_selectPrepared("swiss_pairings_omw"), True)
+
+
+async def swissPairingsMT(tournament, mode=PAIRING_SWAP):
+    """See tournament.swissPairingsMT()."""
+    tournament_matching.checkPairingMode(mode)
+    if(mode == PAIRING_MATCHING):
+        return await _pairedByMatching("ranked_mt", (tournament,),
+                                       tournament)
+
+    def select(cursor):
+        return executePrepared(cursor, "swiss_pairings_mt", (tournament,))
+    return await _resolvedPairings(select, True, tournament)
+
+
+async def swissPairingsAllTournaments(tournaments=None, mode=PAIRING_SWAP,
+                                      processes=None):
+    """See tournament.swissPairingsAllTournaments(). Tournaments of
+    tournament.PARALLEL_PAIRING_PLAYERS players or more are paired in a
+    process pool, the others in the default executor."""
+    tournament_matching.checkPairingMode(mode)
+    async with _Cursor("REPEATABLE READ") as cursor:
+        if tournaments is None:
+            await cursor.execute("SELECT id FROM tournaments ORDER BY id")
+            tournaments = [row[0] for row in await cursor.fetchall()]
+        tournaments = list(tournaments)
+        ranked = dict((t, []) for t in tournaments)
+        played = dict((t, set()) for t in tournaments)
+        await executePrepared(cursor, "ranked_mt_tournaments", (tournaments,))
+        for (t, rank, id, name, wins) in await cursor.fetchall():
+            ranked[t].append((rank, id, name, wins))
+        await executePrepared(cursor, "played_pairs_tournaments",
+                              (tournaments,))
+        for (t, id1, id2) in await cursor.fetchall():
+            played[t].add((id1, id2))
+    loop = asyncio.get_running_loop()
+    jobs = [(t, ranked[t], played[t], mode) for t in tournaments]
+    large = [job for job in jobs
+             if len(job[1]) >= blocking.PARALLEL_PAIRING_PLAYERS]
+    small = [job for job in jobs
+             if len(job[1]) < blocking.PARALLEL_PAIRING_PLAYERS]
+    futures = [loop.run_in_executor(None, tournament_matching.pairTournament,
+                                    job) for job in small]
+    if large:
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            futures.extend([loop.run_in_executor(
+                executor, tournament_matching.pairTournament, job)
+                for job in large])
+            return dict(await asyncio.gather(*futures))
+    return dict(await asyncio.gather(*futures))
+
+
+async def _fetchBatches(cursor, query, params, batchSize):
+    """Declares a server-side cursor for query and yields its rows in lists
+    of up to batchSize rows. Must run in a transaction."""
+    name = "stream_%d" % next(blocking._streamIds)
+    await cursor.execute("DECLARE %s NO SCROLL CURSOR FOR %s" % (name, query),
+                         params)
+    while True:
+        await cursor.execute("FETCH FORWARD %d FROM %s" % (batchSize, name))
+        rows = await cursor.fetchall()
+        if not rows:
+            return
+        yield rows
+
+
+async def iterStandings(tournament=None, batchSize=None):
+    """Yields the standings one row at a time. See
+    tournament.iterStandings()."""
+    batchSize = batchSize or blocking.STREAM_BATCH_SIZE
+    if tournament is None:
+        (query, params) = ("SELECT * FROM playerStandingsOMW", None)
+    else:
+        (query, params) = (blocking._STANDINGS_MT,
+                           {"tournament": tournament})
+    async with _Cursor("REPEATABLE READ") as cursor:
+        async for rows in _fetchBatches(cursor, query, params, batchSize):
+            for row in rows:
+                yield row
+
+
+async def iterPairings(tournament=None, mode=PAIRING_SWAP, batchSize=None):
+    """Yields the pairings one at a time, pairing batchSize players at a
+    time. See tournament.iterPairings()."""
+    tournament_matching.checkPairingMode(mode)
+    batchSize = batchSize or blocking.STREAM_BATCH_SIZE
+    batchSize = batchSize + batchSize % 2
+    if tournament is None:
+        (query, params) = ("SELECT rank, id, name, wins "
+                           "FROM playerStandingsRankOMW ORDER BY rank", None)
+    else:
+        (query, params) = ("SELECT rank, id, name, wins "
+                           "FROM playerStandingsRankMT WHERE tournament = %s "
+                           "ORDER BY rank", (tournament,))
+    loop = asyncio.get_running_loop()
+    async with _Cursor("REPEATABLE READ") as cursor:
+        # Each batch is fetched in full before its played pairs are read on
+        # the same cursor.
+        async for ranked in _fetchBatches(cursor, query, params, batchSize):
+            ids = [row[1] for row in ranked]
+            if tournament is None:
+                await executePrepared(cursor, "played_pairs_among", (ids,))
+            else:
+                await executePrepared(cursor, "played_pairs_tournament_among",
+                                      (tournament, ids))
+            played = set(await cursor.fetchall())
+            (_, pairings) = await loop.run_in_executor(
+                None, tournament_matching.pairTournament,
+                (tournament, ranked, played, mode))
+            for pairing in pairings:
+                yield pairing
+
+
+async def matchedBefore(id1, id2):
+    """Returns True if the two players met before in matches."""
+    rows = await _fetchPrepared("matched_before", (id1, id2))
+    return int(rows[0][0]) > 0
+
+
+async def matchedTournamentBefore(tournament, id1, id2):
+    """Returns True if the two players met before in the tournament."""
+    async with _Cursor() as cursor:
+        await executePrepared(cursor, "matched_tournament_before",
+                              (tournament, id1, id2))
+        return int((await cursor.fetchone())[0]) > 0
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: cp1254 -*-
+#
+# Test cases for tournament_async.py. Like tournament_test.py, these delete
+# every player, tournament and match in the database.
+
+import asyncio
+import random
+import tournament
+import tournament_async
+import tournament_cache
+
+
+async def clear():
+    await tournament_async.deleteMatches()
+    await tournament_async.deleteTournamentMatches()
+    await tournament_async.deletePlayerTournaments()
+    await tournament_async.deleteTournaments()
+    await tournament_async.deletePlayers()
+
+
+async def testRegister():
+    await clear()
+    ids = await tournament_async.registerPlayers(["Player %s" % i for i in range(20)])
+    await tournament_async.registerPlayer("Player 20")
+    count = await tournament_async.countPlayers()
+    if count != 21:
+        raise ValueError("After registering 21 players, countPlayers() should return 21, not %s." % count)
+    if len(set(ids)) != 20:
+        raise ValueError("registerPlayers() should return one id per player.")
+    print("1. Players can be registered and counted.")
+
+
+async def playTournament(t, ids, rounds):
+    await tournament_async.registerTournament(t, "Tournament %s" % t)
+    await tournament_async.registerPlayersTournament([(id, t) for id in ids])
+    for r in range(rounds):
+        pairings = await tournament_async.swissPairingsMT(t, tournament_async.PAIRING_MATCHING)
+        results = [(p[0], p[2], random.randint(0, 2) if p[2] is not None else 1) for p in pairings]
+        await tournament_async.reportRound(t, results)
+    return await tournament_async.playerStandingsMT(t)
+
+
+async def testConcurrentTournaments():
+    await clear()
+    ids = await tournament_async.registerPlayers(["Player %s" % i for i in range(33)])
+    standings = await asyncio.gather(*[playTournament(t, ids, 5) for t in range(8)])
+    for t in range(8):
+        if await tournament_async.countPlayersTournament(t) != len(ids):
+            raise ValueError("Every player should be registered in tournament %s." % t)
+        if set(standings[t]) != set(tournament.playerStandingsMT(t)):
+            raise ValueError("Async standings should match the blocking module.")
+        if sum([row[4] for row in standings[t]]) != 5 * len(ids):
+            raise ValueError("Each player should have played 5 matches, counting byes.")
+    print("2. Eight tournaments can be played concurrently on one event loop.")
+
+
+async def testCacheAndClose():
+    await clear()
+    ids = await tournament_async.registerPlayers(["Player %s" % i for i in range(8)])
+    await tournament_async.registerTournament(0, "Tournament 0")
+    await tournament_async.registerPlayersTournament([(id, 0) for id in ids])
+    tournament_cache.enable()
+    try:
+        standings = tournament.playerStandingsMT(0)
+        await tournament_async.reportRound(0, [(ids[0], ids[1], 1), (ids[2], ids[3], 2)])
+        if tournament.playerStandingsMT(0) == standings:
+            raise ValueError("Async writes should invalidate the cached standings.")
+        expected = tournament.playerStandingsTiebreaks(0)
+        await tournament_async.closeTournament(0)
+        rows = tournament.playerStandingsTiebreaks(0)
+    finally:
+        tournament_cache.disable()
+    if [tuple(row) for row in rows] != [tuple(row) for row in expected]:
+        raise ValueError("Async closeTournament() should freeze the same results as the blocking one.")
+    print("3. Async writes invalidate the cache, and closing freezes the same results.")
+
+
+async def main():
+    try:
+        await testRegister()
+        await testConcurrentTournaments()
+        await testCacheAndClose()
+    finally:
+        await tournament_async.closePool()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
+    print("Success!  All async tests pass!")
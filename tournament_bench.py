@@ -0,0 +1,582 @@
+#!/usr/bin/env python
+# -*- coding: cp1254 -*-
+#
+# tournament_bench.py -- benchmarks for tournament.py
+#
+# WARNING: like tournament_test.py, this deletes every player, tournament
+# and match in the database it runs against.
+#
+# Usage:
+#   python tournament_bench.py views [matches ...]
+#   python tournament_bench.py field [--players N] [--tournaments T]
+#       [--rounds R] [--draws P] [--seed S] [--memory] [--skip FUNCTION ...]
+#   python tournament_bench.py load [--concurrency N ...] [--duration S]
+#       [--players N] [--tournaments T] [--mix R,S,P] [--processes] [--seed S]
+#   python tournament_bench.py matching [players ...] [--rounds R] [--seed S]
+#
+# "field" writes one JSON object per line, one line per timed call; see
+# benchField(). "load" writes one line per function and concurrency level;
+# see benchLoad(). "matching" needs no database and writes one line per
+# round; see benchMatching().
+
+import argparse
+import json
+import math
+import multiprocessing
+import multiprocessing.pool
+import psycopg2
+import random
+import sys
+import threading
+import time
+import tournament
+import tournament_engine
+import tournament_matching
+from tournament import *
+
+timer = getattr(time, "perf_counter", time.time)
+
+# The playerStandingsMT view as it was before it was rewritten to scan
+# tournamentmatches once, kept as the baseline for benchViews().
+CORRELATED_STANDINGS_MT = """
+select 	playertournaments.tournament,
+		players.id,
+		players.name,
+		(select count(tournamentmatches.winner)
+			from tournamentmatches
+			where players.id = tournamentmatches.winner
+			  and tournamentmatches.tournament = playertournaments.tournament) as wins,
+		(select count(m.winner)
+			 from tournamentmatches m,
+			 (select m.player1 as opponentId
+			from tournamentmatches m
+			where m.player2 = players.id
+			  and m.tournament = playertournaments.tournament
+			union
+			select m.player2 as opponentId
+			from tournamentmatches m
+			where m.player1 = players.id
+			  and m.tournament = playertournaments.tournament) OM
+			 where m.winner = OM.opponentId) as omw,
+		(select count(*)
+			from tournamentmatches m
+			where m.tournament = playertournaments.tournament
+			  and (players.id = m.player1
+			   or players.id = m.player2)) as matches
+from players
+join playertournaments on players.id = playertournaments.player
+order by playertournaments.tournament, wins desc, omw desc
+"""
+
+
+def clearDatabase(backend=tournament):
+    backend.deleteMatches()
+    backend.deleteTournamentMatches()
+    backend.deletePlayerTournaments()
+    backend.deleteTournaments()
+    backend.deletePlayers()
+
+
+def generateMatches(matchCount, playersPerTournament=64, seed=0):
+    """Fills the database with random tournaments holding matchCount matches.
+
+    Each tournament has playersPerTournament players, who play
+    log2(players) rounds of randomly drawn pairings.
+
+    Returns:
+      The list of tournament ids created.
+    """
+    rng = random.Random(seed)
+    clearDatabase()
+    rounds = max(1, playersPerTournament.bit_length() - 1)
+    perTournament = rounds * (playersPerTournament // 2)
+    tournamentCount = max(1, (matchCount + perTournament - 1) // perTournament)
+    ids = registerPlayers(["Player %s" % i
+                           for i in range(playersPerTournament)])
+    tournaments = list(range(tournamentCount))
+    reported = 0
+    for t in tournaments:
+        registerTournament(t, "Tournament %s" % t)
+        registerPlayersTournament([(id, t) for id in ids])
+        for r in range(rounds):
+            order = list(ids)
+            rng.shuffle(order)
+            results = []
+            for i in range(0, len(order) - 1, 2):
+                if reported + len(results) >= matchCount:
+                    break
+                results.append((order[i], order[i + 1], rng.randint(0, 2)))
+            reportRound(t, results)
+            reported = reported + len(results)
+    return tournaments
+
+
+def timeQuery(query, repeat=3):
+    """Runs query repeat times and returns the best wall time in seconds."""
+    best = None
+    db = connect()
+    try:
+        cursor = db.cursor()
+        for i in range(repeat):
+            start = time.time()
+            cursor.execute(query)
+            cursor.fetchall()
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+    finally:
+        release(db)
+    return best
+
+
+def benchViews(sizes=(1000, 10000, 100000)):
+    """Times the playerStandingsMT view against its correlated predecessor.
+
+    Returns:
+      A list of (matches, correlated seconds, single scan seconds) rows.
+    """
+    results = []
+    for size in sizes:
+        generateMatches(size)
+        correlated = timeQuery(CORRELATED_STANDINGS_MT)
+        singleScan = timeQuery("SELECT * FROM playerStandingsMT")
+        results.append((size, correlated, singleScan))
+    return results
+
+
+def randomResult(rng, draws):
+    """Returns a random result code: 0 (a draw) with probability draws,
+    otherwise 1 or 2 with equal probability."""
+    if rng.random() < draws:
+        return 0
+    return rng.randint(1, 2)
+
+
+def roundResults(pairings, rng, draws):
+    """Returns (player1, player2, result) tuples for the rows of a
+    swissPairings view. A player without an opponent wins a bye."""
+    results = []
+    for pairing in pairings:
+        if pairing[2] is None:
+            results.append((pairing[0], None, 1))
+        else:
+            results.append((pairing[0], pairing[2], randomResult(rng, draws)))
+    return results
+
+
+def benchField(backend=tournament, players=1000, tournaments=1, rounds=None,
+               draws=0.1, seed=0, skip=()):
+    """Plays a synthetic Swiss event and times every API function on it.
+
+    players players are registered and entered in each of the tournaments.
+    Each round, every swissPairings* variant and standings function is
+    timed, then the round is reported: the matches table one match at a
+    time with reportMatchWithDraw(), each tournament with reportRound().
+    An odd number of players gives one bye per round.
+
+    Args:
+      backend: the tournament module, or a tournament_engine.TournamentEngine
+      players: number of players
+      tournaments: number of tournaments
+      rounds: number of rounds, by default log2(players) rounded up
+      draws: probability of a draw in each match
+      seed: seed of the random results
+      skip: names of functions not to time, e.g. ["swissPairingsOMW/matching"]
+
+    Yields:
+      A dict per timed call: function, round (0 for registration), calls,
+      rows returned and seconds, with the parameters of the run.
+    """
+    rng = random.Random(seed)
+    if rounds is None:
+        rounds = max(1, (players - 1).bit_length())
+    params = {"backend": _backendName(backend), "players": players,
+              "tournaments": tournaments, "rounds": rounds, "draws": draws}
+
+    def timed(name, round, function, *args):
+        start = timer()
+        result = function(*args)
+        seconds = timer() - start
+        record = dict(params, function=name, round=round, calls=1,
+                      rows=len(result) if result is not None else 0,
+                      seconds=seconds)
+        return result, record
+
+    clearDatabase(backend)
+    ids, record = timed("registerPlayers", 0, backend.registerPlayers,
+                        ["Player %s" % i for i in range(players)])
+    yield record
+    for t in range(tournaments):
+        backend.registerTournament(t, "Tournament %s" % t)
+    pairs = [(id, t) for t in range(tournaments) for id in ids]
+    yield timed("registerPlayersTournament", 0,
+                backend.registerPlayersTournament, pairs)[1]
+
+    single = [("swissPairings", backend.swissPairings, ()),
+              ("swissPairingsPreventRematch",
+               backend.swissPairingsPreventRematch, ()),
+              ("swissPairingsDraw", backend.swissPairingsDraw, ()),
+              ("swissPairingsOMW/matching", backend.swissPairingsOMW,
+               (PAIRING_MATCHING,)),
+              ("playerStandings", backend.playerStandings, ()),
+              ("playerStandingsOMW", backend.playerStandingsOMW, ())]
+    for r in range(1, rounds + 1):
+        for (name, function, args) in single:
+            if name not in skip:
+                yield timed(name, r, function, *args)[1]
+        pairings, record = timed("swissPairingsOMW/swap", r,
+                                 backend.swissPairingsOMW)
+        yield record
+        results = roundResults(pairings, rng, draws)
+        if "reportMatchWithDraw" not in skip:
+            start = timer()
+            for (player1, player2, result) in results:
+                backend.reportMatchWithDraw(player1, player2, result)
+            yield dict(params, function="reportMatchWithDraw", round=r,
+                       calls=len(results), rows=0, seconds=timer() - start)
+        else:
+            backend.reportRound(None, results)
+
+        for t in range(tournaments):
+            perTournament = [("playerStandingsMT", backend.playerStandingsMT,
+                              (t,)),
+                             ("swissPairingsMT/matching",
+                              backend.swissPairingsMT, (t, PAIRING_MATCHING))]
+            for (name, function, args) in perTournament:
+                if name not in skip:
+                    yield dict(timed(name, r, function, *args)[1],
+                               tournament=t)
+            pairings, record = timed("swissPairingsMT/swap", r,
+                                     backend.swissPairingsMT, t)
+            yield dict(record, tournament=t)
+            results = roundResults(pairings, rng, draws)
+            yield dict(timed("reportRound", r, backend.reportRound, t,
+                             results)[1], tournament=t)
+
+
+# The functions benchLoad() clients call, in the order of their weights in
+# the mix.
+LOAD_FUNCTIONS = ("reportMatchTournamentWithDraw", "playerStandingsMT",
+                  "swissPairingsMT")
+
+# Backends of the database other than the sampling one, by what they wait
+# on: heavyweight locks (row and table locks) and lightweight locks.
+LOCK_WAITS_QUERY = """
+SELECT count(*) FILTER (WHERE wait_event_type = 'Lock'),
+       count(*) FILTER (WHERE wait_event_type = 'LWLock')
+  FROM pg_stat_activity
+ WHERE datname = current_database() AND pid <> pg_backend_pid()
+"""
+
+DEADLOCKS_QUERY = ("SELECT deadlocks FROM pg_stat_database "
+                   "WHERE datname = current_database()")
+
+
+def benchMatching(sizes=(1000, 10000), rounds=None, seed=0):
+    """Times tournament_matching.pairByMatching() on its own, without a
+    database, over a simulated Swiss event of each size.
+
+    Each round the field is ranked by wins, then id, paired by
+    pairByMatching() and played with random results, so later rounds hold
+    more rematches to avoid. An odd size gives one bye per round.
+
+    Args:
+      sizes: numbers of players
+      rounds: number of rounds, by default log2(players) rounded up
+      seed: seed of the random results
+
+    Yields:
+      A dict per round: players, round, seconds, the neighbour pairs of the
+      ranking that were rematches, and the rematches left in the pairings.
+    """
+    for players in sizes:
+        rng = random.Random(seed)
+        count = rounds or max(1, (players - 1).bit_length())
+        wins = dict((id, 0) for id in range(1, players + 1))
+        played = set()
+        for r in range(1, count + 1):
+            order = sorted(wins, key=lambda id: (-wins[id], id))
+            ranked = [(rank, id, "Player %s" % id, wins[id])
+                      for (rank, id) in enumerate(order, 1)]
+            neighbours = sum(1 for k in range(0, players - 1, 2)
+                             if (min(order[k], order[k + 1]),
+                                 max(order[k], order[k + 1])) in played)
+            start = timer()
+            pairings = tournament_matching.pairByMatching(ranked, played)
+            seconds = timer() - start
+            yield {"players": players, "round": r, "seconds": seconds,
+                   "neighbour_rematches": neighbours,
+                   "rematches": sum(pairing[8] for pairing in pairings)}
+            for pairing in pairings:
+                (id1, id2) = (pairing[0], pairing[2])
+                if id2 is None:
+                    wins[id1] = wins[id1] + 1
+                    continue
+                played.add((min(id1, id2), max(id1, id2)))
+                winner = id1 if rng.randint(1, 2) == 1 else id2
+                wins[winner] = wins[winner] + 1
+
+
+def percentile(values, fraction):
+    """Returns the nearest-rank percentile of a sorted list, None if empty."""
+    if not values:
+        return None
+    index = int(math.ceil(fraction * len(values))) - 1
+    return values[min(max(index, 0), len(values) - 1)]
+
+
+def _loadClient(args):
+    """Runs one benchLoad() client: calls the LOAD_FUNCTIONS, picked at
+    random by weight, from start until deadline (both time.time() values).
+
+    Returns:
+      A dict of function name -> (list of seconds per successful call,
+      dict of exception class name -> calls that raised it).
+    """
+    (tournaments, players, mix, start, deadline, seed) = args
+    rng = random.Random(seed)
+    total = float(sum(mix))
+    results = dict((name, ([], {})) for name in LOAD_FUNCTIONS)
+    time.sleep(max(0, start - time.time()))
+    while time.time() < deadline:
+        t = rng.choice(tournaments)
+        pick = rng.random() * total
+        index = 0
+        while index < len(mix) - 1 and pick >= mix[index]:
+            pick = pick - mix[index]
+            index = index + 1
+        name = LOAD_FUNCTIONS[index]
+        (latencies, errors) = results[name]
+        begin = timer()
+        try:
+            if index == 0:
+                (player1, player2) = rng.sample(players, 2)
+                reportMatchTournamentWithDraw(t, player1, player2,
+                                              rng.randint(0, 2))
+            elif index == 1:
+                playerStandingsMT(t)
+            else:
+                swissPairingsMT(t)
+        except psycopg2.Error as error:
+            errorName = type(error).__name__
+            errors[errorName] = errors.get(errorName, 0) + 1
+            continue
+        latencies.append(timer() - begin)
+    return results
+
+
+class _LockMonitor(threading.Thread):
+    """Samples LOCK_WAITS_QUERY every interval seconds from start (a
+    time.time() value) on a connection of its own, and counts the deadlocks
+    detected meanwhile."""
+
+    def __init__(self, start, interval):
+        super(_LockMonitor, self).__init__()
+        self.daemon = True
+        self.startTime = start
+        self.interval = interval
+        self.samples = []
+        self.deadlocks = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        db = psycopg2.connect(tournament.DSN)
+        try:
+            db.autocommit = True
+            cursor = db.cursor()
+            cursor.execute(DEADLOCKS_QUERY)
+            deadlocks = cursor.fetchone()[0]
+            self.stopped.wait(max(0, self.startTime - time.time()))
+            while not self.stopped.wait(self.interval):
+                cursor.execute(LOCK_WAITS_QUERY)
+                self.samples.append(cursor.fetchone())
+            # The statistics collector reports with some delay.
+            time.sleep(1)
+            cursor.execute("SELECT pg_stat_clear_snapshot()")
+            cursor.execute(DEADLOCKS_QUERY)
+            self.deadlocks = cursor.fetchone()[0] - deadlocks
+        finally:
+            db.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def summary(self):
+        """Returns the mean and maximum number of backends waiting on
+        locks, and on lightweight locks, over the samples."""
+        count = max(len(self.samples), 1)
+        locks = [sample[0] for sample in self.samples] or [0]
+        lightweight = [sample[1] for sample in self.samples] or [0]
+        return {"lock_waits_mean": sum(locks) / float(count),
+                "lock_waits_max": max(locks),
+                "lwlock_waits_mean": sum(lightweight) / float(count),
+                "lwlock_waits_max": max(lightweight),
+                "deadlocks": self.deadlocks}
+
+
+def benchLoad(levels=(1, 2, 4, 8, 16, 32), duration=10.0, players=64,
+              tournaments=1, mix=(8, 1, 1), processes=False, seed=0,
+              interval=0.1):
+    """Runs concurrent clients against the database and measures how
+    throughput, latency and lock waits change with their number.
+
+    At each level the database is cleared and players players entered in
+    each of the tournaments. Then concurrency clients, threads sharing the
+    connection pool or processes with a pool each, call the LOAD_FUNCTIONS
+    for duration seconds, each call picked at random in the proportions of
+    mix and for a random tournament. Reports pair two random players with a
+    random result, so they follow no pairings, and
+    reportMatchTournamentWithDraw() commits each of them on its own, as
+    table terminals do.
+
+    Args:
+      levels: numbers of concurrent clients to run, one level after another
+      duration: seconds each level runs for
+      players: number of players in each tournament
+      tournaments: number of tournaments the clients share
+      mix: relative weights of the LOAD_FUNCTIONS
+      processes: if True, run the clients as processes instead of threads
+      seed: seed of the clients' random choices
+      interval: seconds between two samples of the lock waits
+
+    Yields:
+      A dict per level and function, and one with function "all" per level:
+      calls completed, errors by exception class, throughput in calls per
+      second, latency percentiles p50, p95 and p99 and max in seconds, and
+      the lock waits of the level, see _LockMonitor.summary().
+    """
+    mix = tuple(mix)
+    if len(mix) != len(LOAD_FUNCTIONS) or sum(mix) <= 0:
+        raise ValueError("mix needs one weight per function of %s"
+                         % (LOAD_FUNCTIONS,))
+    params = {"clients": "processes" if processes else "threads",
+              "players": players, "tournaments": tournaments,
+              "duration": duration, "mix": list(mix)}
+    for concurrency in levels:
+        if not processes:
+            # Each thread holds a connection for the length of a call.
+            configurePool(maxconn=max(tournament.POOL_MAXCONN,
+                                      concurrency))
+        clearDatabase()
+        ids = registerPlayers(["Player %s" % i for i in range(players)])
+        for t in range(tournaments):
+            registerTournament(t, "Tournament %s" % t)
+        registerPlayersTournament([(id, t) for t in range(tournaments)
+                                   for id in ids])
+        if processes:
+            # Forked clients must not share the parent's connections.
+            closePool()
+            pool = multiprocessing.Pool(concurrency)
+        else:
+            pool = multiprocessing.pool.ThreadPool(concurrency)
+        start = time.time() + 1
+        clients = [(list(range(tournaments)), ids, mix, start,
+                    start + duration, seed * 1000003 + client)
+                   for client in range(concurrency)]
+        monitor = _LockMonitor(start, interval)
+        monitor.start()
+        try:
+            results = pool.map(_loadClient, clients)
+        finally:
+            monitor.stop()
+            pool.close()
+            pool.join()
+        locks = monitor.summary()
+        merged = dict((name, ([], {})) for name in LOAD_FUNCTIONS + ("all",))
+        for result in results:
+            for (name, (latencies, errors)) in result.items():
+                for merge in (merged[name], merged["all"]):
+                    merge[0].extend(latencies)
+                    for (errorName, count) in errors.items():
+                        merge[1][errorName] = merge[1].get(errorName, 0) + count
+        for name in LOAD_FUNCTIONS + ("all",):
+            (latencies, errors) = merged[name]
+            latencies.sort()
+            record = dict(params, concurrency=concurrency, function=name,
+                          calls=len(latencies), errors=errors,
+                          throughput=len(latencies) / float(duration),
+                          p50=percentile(latencies, 0.5),
+                          p95=percentile(latencies, 0.95),
+                          p99=percentile(latencies, 0.99),
+                          max=latencies[-1] if latencies else None)
+            record.update(locks)
+            yield record
+
+
+def _backendName(backend):
+    if backend is tournament:
+        return "postgresql"
+    return type(backend).__name__
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks for tournament.py")
+    commands = parser.add_subparsers(dest="command")
+    views = commands.add_parser("views", help="compare the standings views")
+    views.add_argument("sizes", nargs="*", type=int,
+                       default=[1000, 10000, 100000], metavar="matches")
+    field = commands.add_parser("field", help="time every function on a "
+                                "synthetic event, as JSON lines")
+    field.add_argument("--players", type=int, default=1000)
+    field.add_argument("--tournaments", type=int, default=1)
+    field.add_argument("--rounds", type=int, default=None)
+    field.add_argument("--draws", type=float, default=0.1,
+                       help="probability of a draw")
+    field.add_argument("--seed", type=int, default=0)
+    field.add_argument("--memory", action="store_true",
+                       help="run on the in-memory engine, not PostgreSQL")
+    field.add_argument("--skip", nargs="*", default=[], metavar="FUNCTION")
+    load = commands.add_parser("load", help="run concurrent clients and "
+                               "report throughput, latency and lock waits, "
+                               "as JSON lines")
+    load.add_argument("--concurrency", nargs="+", type=int,
+                      default=[1, 2, 4, 8, 16, 32], metavar="N")
+    load.add_argument("--duration", type=float, default=10.0,
+                      help="seconds per concurrency level")
+    load.add_argument("--players", type=int, default=64)
+    load.add_argument("--tournaments", type=int, default=1)
+    load.add_argument("--mix", default="8,1,1",
+                      help="weights of reports, standings and pairings")
+    load.add_argument("--processes", action="store_true",
+                      help="run the clients as processes, not threads")
+    load.add_argument("--seed", type=int, default=0)
+    matching = commands.add_parser("matching", help="time the matching "
+                                   "pairing alone, without a database, as "
+                                   "JSON lines")
+    matching.add_argument("sizes", nargs="*", type=int,
+                          default=[1000, 10000], metavar="players")
+    matching.add_argument("--rounds", type=int, default=None)
+    matching.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.command == "views":
+        sys.stdout.write("%10s %14s %14s %8s\n"
+                         % ("matches", "correlated s", "single scan s",
+                            "speedup"))
+        for (size, correlated, singleScan) in benchViews(args.sizes):
+            sys.stdout.write("%10d %14.4f %14.4f %7.1fx\n"
+                             % (size, correlated, singleScan,
+                                correlated / max(singleScan, 1e-9)))
+    elif args.command == "field":
+        backend = tournament
+        if args.memory:
+            backend = tournament_engine.TournamentEngine()
+        for record in benchField(backend, args.players, args.tournaments,
+                                 args.rounds, args.draws, args.seed,
+                                 args.skip):
+            sys.stdout.write(json.dumps(record, sort_keys=True) + "\n")
+            sys.stdout.flush()
+    elif args.command == "load":
+        mix = [float(weight) for weight in args.mix.split(",")]
+        for record in benchLoad(args.concurrency, args.duration, args.players,
+                                args.tournaments, mix, args.processes,
+                                args.seed):
+            sys.stdout.write(json.dumps(record, sort_keys=True) + "\n")
+            sys.stdout.flush()
+    elif args.command == "matching":
+        for record in benchMatching(args.sizes, args.rounds, args.seed):
+            sys.stdout.write(json.dumps(record, sort_keys=True) + "\n")
+            sys.stdout.flush()
+    else:
+        parser.print_usage(sys.stderr)
+        sys.exit(2)
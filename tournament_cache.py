@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: cp1254 -*-
+#
+# tournament_cache.py -- versioned read cache for the tournament API
+#
+# Standings and pairings only change when something is written, so while
+# the cache is enabled the read functions of tournament.py keep their
+# results, keyed by function, arguments and the version of what they read:
+#
+#   import tournament_cache
+#   tournament_cache.enable(maxsize=4096)            # this process only
+#   tournament_cache.enable(maxsize=4096, shared=True)
+#   tournament_cache.enable(functions=["swissPairingsMT"])  # these only
+#
+# Each tournament has a version, and so do the matches table (MATCHES) and
+# the database as a whole (ALL). Writes made through tournament.py bump the
+# versions of what they change once they are committed. That is enough
+# when this process makes every write. With shared=True the versions kept
+# in the cache_versions table by triggers are checked as well, one small
+# query per cached read, so writes made by other processes or other clients
+# invalidate the cache too. The triggers only keep those versions while
+# some client has shared mode enabled on the database; otherwise writers do
+# not touch the table.
+
+import functools
+import threading
+from collections import OrderedDict
+
+# Version scopes besides tournament ids. They match the scopes of the
+# cache_versions table.
+MATCHES = -1
+ALL = -2
+# Row of cache_versions whose presence turns the version triggers on. Its
+# version counts the clients with shared mode enabled.
+SHARED_MODE = -3
+
+_enabled = False
+_shared = False
+# Names of the functions cached, or None for all of them.
+_functions = None
+_maxsize = 1024
+_lock = threading.Lock()
+_entries = OrderedDict()
+_versions = {}
+_hits = 0
+_misses = 0
+
+# Set by tournament.py: function(scope) returning the shared versions of
+# scope and ALL, as a tuple.
+sharedVersions = None
+# Set by tournament.py: function() counting this client in the SHARED_MODE
+# row, called when shared mode is enabled, and function() counting it out
+# again, which removes the row after the last client, called when shared
+# mode ends.
+startSharedVersions = None
+stopSharedVersions = None
+
+
+def enable(maxsize=1024, shared=False, functions=None):
+    """Starts caching the read functions.
+
+    Args:
+      maxsize: number of results kept; the least recently used go first
+      shared: if True, also check the versions in the database on each read
+      functions: names of the read functions to cache, or None for all
+    """
+    global _enabled, _shared, _maxsize, _functions
+    wasShared = _enabled and _shared
+    if shared and not wasShared and startSharedVersions is not None:
+        startSharedVersions()
+    if wasShared and not shared and stopSharedVersions is not None:
+        stopSharedVersions()
+    with _lock:
+        _maxsize = maxsize
+        _shared = shared
+        _functions = None if functions is None else frozenset(functions)
+        _enabled = True
+        _evict()
+
+
+def enabled(function=None):
+    """Returns True while the cache is enabled, for the named read function
+    if function is given."""
+    functions = _functions
+    return _enabled and (function is None or functions is None
+                         or function in functions)
+
+
+def disable():
+    """Stops caching and forgets every cached result."""
+    global _enabled
+    wasShared = _enabled and _shared
+    _enabled = False
+    clear()
+    if wasShared and stopSharedVersions is not None:
+        stopSharedVersions()
+
+
+def clear():
+    """Forgets every cached result."""
+    with _lock:
+        _entries.clear()
+
+
+def info():
+    """Returns a dict of hits, misses, size and maxsize."""
+    with _lock:
+        return {"hits": _hits, "misses": _misses, "size": len(_entries),
+                "maxsize": _maxsize}
+
+
+def invalidate(*scopes):
+    """Bumps the versions of scopes: tournament ids, MATCHES or ALL."""
+    with _lock:
+        for scope in scopes:
+            _versions[scope] = _versions.get(scope, 0) + 1
+
+
+def _evict():
+    while len(_entries) > _maxsize:
+        _entries.popitem(last=False)
+
+
+def _copy(result):
+    """Copies the rows of a cached list or tuple, so that callers can
+    change the pairings they get back without changing the cache."""
+    if isinstance(result, (list, tuple)):
+        return type(result)([list(row) if isinstance(row, list) else row
+                             for row in result])
+    return result
+
+
+def cached(tournamentArgument=None):
+    """Decorates a read function of tournament.py.
+
+    Args:
+      tournamentArgument: name of the argument holding the tournament id
+                          the function reads (None there meaning the
+                          matches table), or None if it always reads the
+                          matches table
+    """
+    def decorate(function):
+        name = function.__name__
+        position = None
+        if tournamentArgument is not None:
+            position = function.__code__.co_varnames.index(tournamentArgument)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            global _hits, _misses
+            if not enabled(name):
+                return function(*args, **kwargs)
+            scope = None
+            if position is not None:
+                if position < len(args):
+                    scope = args[position]
+                else:
+                    scope = kwargs.get(tournamentArgument)
+            if scope is None:
+                scope = MATCHES
+            with _lock:
+                version = (_versions.get(ALL, 0), _versions.get(scope, 0))
+            if _shared:
+                version = version + tuple(sharedVersions(scope))
+            key = (name, args, tuple(sorted(kwargs.items())))
+            try:
+                hash(key)
+            except TypeError:
+                # Lists among the arguments: not cached.
+                return function(*args, **kwargs)
+            with _lock:
+                entry = _entries.get(key)
+                if entry is not None and entry[0] == version:
+                    del _entries[key]
+                    _entries[key] = entry
+                    _hits = _hits + 1
+                    return _copy(entry[1])
+                _misses = _misses + 1
+            # The version is read before the result, so a write committed
+            # in between leaves an entry that is never served.
+            result = function(*args, **kwargs)
+            with _lock:
+                _entries.pop(key, None)
+                _entries[key] = (version, result)
+                _evict()
+            return _copy(result)
+        return wrapper
+    return decorate
@@ -0,0 +1,479 @@
+#!/usr/bin/env python
+# -*- coding: cp1254 -*-
+#
+# tournament_engine.py -- in-memory backend for the tournament API
+#
+# A backend is any object with the functions listed in API. The tournament
+# module is the PostgreSQL backend; TournamentEngine keeps everything in
+# memory, for simulations and dry runs that should not touch a database:
+#
+#   import tournament, tournament_engine
+#   backend = tournament_engine.TournamentEngine()   # or: backend = tournament
+#   ids = backend.registerPlayers(["Ann", "Bob", "Cem", "Dan"])
+#   backend.reportRound(None, [(ids[0], ids[1], 1), (ids[2], ids[3], 0)])
+#   pairings = backend.swissPairingsOMW()
+
+from array import array
+from collections import defaultdict
+import tournament_matching
+import tournament_tiebreaks
+from tournament_matching import PAIRING_SWAP, PAIRING_MATCHING
+
+# The functions every backend provides, with the arguments and results
+# documented in tournament.py.
+API = (
+    "deleteMatches", "deletePlayers", "countPlayers", "registerPlayer",
+    "registerPlayers", "playerStandings", "playerStandingsOMW",
+    "playerStandingsMT", "reportMatch", "reportMatchWithDraw",
+    "reportMatchTournamentWithDraw", "reportRound", "swissPairings",
+    "swissPairingsPreventRematch", "swissPairingsDraw", "swissPairingsOMW",
+    "swissPairingsMT", "swissPairingsAllTournaments", "matchedBefore", "matchedTournamentBefore",
+    "registerTournament", "registerPlayerTournament",
+    "registerPlayersTournament", "countPlayersTournament",
+    "deletePlayerTournaments", "deleteTournaments", "deleteTournamentMatches",
+    "iterStandings", "iterPairings", "playerStandingsTop",
+    "playerStandingsAfter", "playerStandingsAround", "setTiebreakOrder",
+    "tiebreakOrder", "playerStandingsTiebreaks", "closeTournament",
+)
+
+
+class MatchStore(object):
+    """The matches of the matches table or of one tournament.
+
+    The matches are kept in three integer arrays, 0 standing for a missing
+    player2 or winner, and the standings are updated as each match is added,
+    as the player_stats triggers do in the database: a win adds one to the
+    OMW of each of the winner's opponents, and a first match against an
+    opponent adds that opponent's wins so far.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """Removes every match and resets the standings."""
+        self.players1 = array("l")
+        self.players2 = array("l")
+        self.winners = array("l")
+        self.wins = defaultdict(int)
+        self.draws = defaultdict(int)
+        self.matches = defaultdict(int)
+        self.omw = defaultdict(int)
+        self.opponents = defaultdict(list)
+        self.played = set()
+
+    def __len__(self):
+        return len(self.players1)
+
+    def add(self, player1, player2, winner):
+        """Records one match. player2 and winner may be None."""
+        self.players1.append(player1)
+        self.players2.append(player2 or 0)
+        self.winners.append(winner or 0)
+        wins = self.wins
+        omw = self.omw
+        self.matches[player1] += 1
+        if winner is None:
+            self.draws[player1] += 1
+        if player2 is not None:
+            self.matches[player2] += 1
+            if winner is None:
+                self.draws[player2] += 1
+            pair = (player1, player2) if player1 < player2 else (player2, player1)
+            if pair not in self.played:
+                self.played.add(pair)
+                self.opponents[player1].append(player2)
+                self.opponents[player2].append(player1)
+                omw[player1] += wins.get(player2, 0)
+                omw[player2] += wins.get(player1, 0)
+        if winner is not None:
+            wins[winner] += 1
+            for opponent in self.opponents.get(winner, ()):
+                omw[opponent] += 1
+
+    def stats(self, player):
+        """Returns (wins, draws, matches, omw) of a player."""
+        return (self.wins.get(player, 0), self.draws.get(player, 0),
+                self.matches.get(player, 0), self.omw.get(player, 0))
+
+    def hasPlayed(self, player1, player2):
+        return tournament_matching.matchedIn(self.played)(player1, player2)
+
+
+class TournamentEngine(object):
+    """The tournament API, kept in memory.
+
+    Every function of API is a method with the same arguments and results as
+    in tournament.py, so code written against a backend runs unchanged on
+    either. Players get serial ids from 1, as in the database. Where the
+    database would reject a row with an IntegrityError (an unknown player or
+    tournament, a duplicate tournament id, deleting referenced rows), the
+    engine raises ValueError and changes nothing.
+
+    Players tied in the standings are listed by id, where the database
+    leaves their order undefined.
+    """
+
+    def __init__(self):
+        self.names = {}
+        self.lastPlayerId = 0
+        self.results = MatchStore()
+        self.tournaments = {}
+        self.registrations = {}
+        self.lastRegistrationId = 0
+        self.tournamentResults = {}
+        self.tiebreakOrders = {}
+        # Closed tournament -> its final playerStandingsTiebreaks() rows.
+        self.closedResults = {}
+        # Closed tournament -> its archived MatchStore.
+        self.archivedResults = {}
+
+    def _checkPlayer(self, player, optional=False):
+        if player is None and optional:
+            return
+        if player not in self.names:
+            raise ValueError("unknown player %r" % (player,))
+
+    def _checkTournament(self, tournament):
+        if tournament not in self.tournaments:
+            raise ValueError("unknown tournament %r" % (tournament,))
+
+    def _checkOpen(self, tournament):
+        self._checkTournament(tournament)
+        if tournament in self.closedResults:
+            raise ValueError("tournament %r is closed" % (tournament,))
+
+    def _store(self, tournament):
+        if tournament is None:
+            return self.results
+        store = self.tournamentResults.get(tournament)
+        if store is None:
+            store = self.tournamentResults[tournament] = MatchStore()
+        return store
+
+    def deleteMatches(self):
+        """Remove all the match records."""
+        self.results.clear()
+
+    def deletePlayers(self):
+        """Remove all the player records."""
+        if (len(self.results) or any(self.registrations.values())
+                or any(self.tournamentResults.values())
+                or any(self.closedResults.values())):
+            raise ValueError("players still have matches or registrations")
+        self.names.clear()
+
+    def countPlayers(self):
+        """Returns the number of players currently registered."""
+        return len(self.names)
+
+    def registerPlayer(self, name):
+        """Adds a player. See tournament.registerPlayer()."""
+        self.registerPlayers([name])
+
+    def registerPlayers(self, names):
+        """Adds many players. See tournament.registerPlayers()."""
+        ids = list(range(self.lastPlayerId + 1,
+                         self.lastPlayerId + 1 + len(names)))
+        self.names.update(zip(ids, names))
+        self.lastPlayerId = self.lastPlayerId + len(names)
+        return ids
+
+    def _ranked(self, players, store, key):
+        """Returns [(rank, id, name, stats)] sorted by key(stats), then id."""
+        rows = [(key(store.stats(id)), id) for id in players]
+        rows.sort()
+        return [(rank, id, self.names[id], store.stats(id))
+                for (rank, (_, id)) in enumerate(rows, 1)]
+
+    def playerStandings(self):
+        """Returns (id, name, wins, matches) rows. See tournament.playerStandings()."""
+        return [(id, name, stats[0], stats[2]) for (rank, id, name, stats)
+                in self._ranked(self.names, self.results, _byWins)]
+
+    def playerStandingsOMW(self):
+        """Returns (id, name, wins, omw, matches) rows sorted by wins and OMW."""
+        return [(id, name, stats[0], stats[3], stats[2])
+                for (rank, id, name, stats)
+                in self._ranked(self.names, self.results, _byWinsOMW)]
+
+    def playerStandingsMT(self, tournament):
+        """Returns the standings of one tournament. See tournament.playerStandingsMT()."""
+        if tournament in self.closedResults:
+            return [(row[0], row[1], row[2], row[_OMW], row[_MATCHES])
+                    for row in self.closedResults[tournament]]
+        return [(id, name, stats[0], stats[3], stats[2])
+                for (rank, id, name, stats)
+                in self._ranked(self.registrations.get(tournament, []),
+                                self._store(tournament), _byWinsOMW)]
+
+    def playerStandingsTop(self, tournament, k):
+        """Returns the first k rows of playerStandingsMT()."""
+        return self.playerStandingsMT(tournament)[:k]
+
+    def playerStandingsAfter(self, tournament, after, k):
+        """Returns the k standings rows after a (wins, omw, id) key. See
+        tournament.playerStandingsAfter()."""
+        (wins, omw, id) = after
+        rows = self.playerStandingsMT(tournament)
+        if tournament in self.closedResults:
+            ids = [row[0] for row in rows]
+            if id not in ids:
+                return []
+            return rows[ids.index(id) + 1:][:k]
+        key = (-wins, -omw, id)
+        return [row for row in rows
+                if (-row[2], -row[3], row[0]) > key][:k]
+
+    def playerStandingsAround(self, tournament, player, k):
+        """Returns (rank, rows) around a player. See
+        tournament.playerStandingsAround()."""
+        rows = self.playerStandingsMT(tournament)
+        ids = [row[0] for row in rows]
+        if player not in ids:
+            return (None, [])
+        first = max(0, ids.index(player) - k)
+        return (first + 1, rows[first:ids.index(player) + k + 1])
+
+    def setTiebreakOrder(self, tournament, order):
+        """Sets a tournament's ranking order. See tournament.setTiebreakOrder()."""
+        self._checkTournament(tournament)
+        self.tiebreakOrders[tournament] = tournament_tiebreaks.checkOrder(order)
+
+    def tiebreakOrder(self, tournament):
+        """Returns a tournament's ranking order. See tournament.tiebreakOrder()."""
+        return self.tiebreakOrders.get(tournament,
+                                       tournament_tiebreaks.DEFAULT_ORDER)
+
+    def playerStandingsTiebreaks(self, tournament=None, order=None):
+        """Returns the standings with every tiebreak score. See
+        tournament.playerStandingsTiebreaks()."""
+        if tournament in self.closedResults:
+            rows = self.closedResults[tournament]
+            if order is None:
+                return list(rows)
+            return tournament_tiebreaks.rankRows(rows, order)
+        if tournament is None:
+            names = self.names
+        else:
+            if order is None:
+                order = self.tiebreakOrder(tournament)
+            names = dict((id, self.names[id])
+                         for id in self.registrations.get(tournament, []))
+        store = self._store(tournament)
+        matches = [(player1, player2 or None, winner or None)
+                   for (player1, player2, winner)
+                   in zip(store.players1, store.players2, store.winners)]
+        scores = tournament_tiebreaks.computeTiebreaks(matches, names)
+        return tournament_tiebreaks.standingsRows(
+            scores, names, order or tournament_tiebreaks.DEFAULT_ORDER)
+
+    def closeTournament(self, tournament, archive=False):
+        """Freezes a tournament's standings. See tournament.closeTournament().
+        Archived matches are kept apart, in archivedResults."""
+        self._checkTournament(tournament)
+        if tournament in self.closedResults:
+            raise ValueError("tournament %r does not exist or is already closed"
+                             % (tournament,))
+        self.closedResults[tournament] = self.playerStandingsTiebreaks(tournament)
+        if archive:
+            self.archivedResults[tournament] = self.tournamentResults.pop(
+                tournament, MatchStore())
+
+    def reportMatch(self, winner, loser):
+        """Records a win. loser may be None for a bye."""
+        self.reportRound(None, [(winner, loser, 1)])
+
+    def reportMatchWithDraw(self, player1, player2, result):
+        """Records a match; as in tournament.py, other results are ignored."""
+        if result in (0, 1, 2):
+            self.reportRound(None, [(player1, player2, result)])
+
+    def reportMatchTournamentWithDraw(self, tournament, player1, player2, result):
+        """Records a tournament match; as in tournament.py, other results are draws."""
+        if result not in (1, 2):
+            result = 0
+        self.reportRound(tournament, [(player1, player2, result)])
+
+    def reportRound(self, tournament, results):
+        """Records a whole round, or none of it. See tournament.reportRound()."""
+        if tournament is not None:
+            self._checkOpen(tournament)
+        matches = []
+        for (player1, player2, result) in results:
+            self._checkPlayer(player1, True)
+            self._checkPlayer(player2, True)
+            matches.append((player1, player2,
+                            tournament_matching.winnerOf(player1, player2, result)))
+        store = self._store(tournament)
+        for (player1, player2, winner) in matches:
+            store.add(player1, player2, winner)
+
+    def _pairings(self, ranked, store, score, sameWins, tournament=None):
+        """Lays ranked players out as the rows of the swissPairings views and
+        swaps pairings to avoid rematches, as the swissPairings* functions do."""
+        pairings = []
+        for i in range(0, len(ranked), 2):
+            (rank1, id1, name1, stats1) = ranked[i]
+            if i + 1 < len(ranked):
+                (rank2, id2, name2, stats2) = ranked[i + 1]
+                pairings.append([id1, name1, id2, name2, rank1, rank2,
+                                 score(stats1), score(stats2),
+                                 int(store.hasPlayed(id1, id2))])
+            else:
+                pairings.append([id1, name1, None, None, rank1, None,
+                                 score(stats1), None, 0])
+            if tournament is not None:
+                pairings[-1].append(tournament)
+        if sameWins is not None:
+            tournament_matching.resolveRematches(
+                pairings, tournament_matching.matchedIn(store.played), sameWins)
+        return tuple(pairings)
+
+    def swissPairings(self):
+        """Returns (id1, name1, id2, name2) pairings by wins, rematches allowed."""
+        ranked = self._ranked(self.names, self.results, _byWins)
+        return [tuple(row[:4]) for row
+                in self._pairings(ranked, self.results, _wins, None)]
+
+    def swissPairingsPreventRematch(self):
+        """See tournament.swissPairingsPreventRematch()."""
+        ranked = self._ranked(self.names, self.results, _byWins)
+        return self._pairings(ranked, self.results, _wins, True)
+
+    def swissPairingsDraw(self):
+        """See tournament.swissPairingsDraw(); players are ranked by points."""
+        ranked = self._ranked(self.names, self.results, _byPoints)
+        return self._pairings(ranked, self.results, _points, False)
+
+    def _swissPairingsOMW(self, players, store, mode, tournament=None):
+        tournament_matching.checkPairingMode(mode)
+        ranked = self._ranked(players, store, _byWinsOMW)
+        if(mode == PAIRING_MATCHING):
+            rows = [(rank, id, name, stats[0])
+                    for (rank, id, name, stats) in ranked]
+            return tournament_matching.pairByMatching(rows, store.played,
+                                                      tournament)
+        return self._pairings(ranked, store, _wins, True, tournament)
+
+    def swissPairingsOMW(self, mode=PAIRING_SWAP):
+        """See tournament.swissPairingsOMW()."""
+        return self._swissPairingsOMW(self.names, self.results, mode)
+
+    def swissPairingsMT(self, tournament, mode=PAIRING_SWAP):
+        """See tournament.swissPairingsMT()."""
+        return self._swissPairingsOMW(self.registrations.get(tournament, []),
+                                      self._store(tournament), mode,
+                                      tournament)
+
+    def swissPairingsAllTournaments(self, tournaments=None, mode=PAIRING_SWAP,
+                                    processes=None):
+        """See tournament.swissPairingsAllTournaments(). The engine pairs
+        every tournament in the calling process."""
+        tournament_matching.checkPairingMode(mode)
+        if tournaments is None:
+            tournaments = sorted(self.tournaments)
+        return dict((t, self.swissPairingsMT(t, mode)) for t in tournaments)
+
+    def iterStandings(self, tournament=None, batchSize=None):
+        """Yields the rows of playerStandingsOMW() or playerStandingsMT().
+        See tournament.iterStandings()."""
+        if tournament is None:
+            rows = self.playerStandingsOMW()
+        else:
+            rows = self.playerStandingsMT(tournament)
+        for row in rows:
+            yield row
+
+    def iterPairings(self, tournament=None, mode=PAIRING_SWAP, batchSize=None):
+        """Yields pairings made batchSize players at a time, as
+        tournament.iterPairings() does."""
+        tournament_matching.checkPairingMode(mode)
+        batchSize = batchSize or tournament_matching.STREAM_BATCH_SIZE
+        batchSize = batchSize + batchSize % 2
+        if tournament is None:
+            (players, store) = (self.names, self.results)
+        else:
+            players = self.registrations.get(tournament, [])
+            store = self._store(tournament)
+        ranked = [(rank, id, name, stats[0]) for (rank, id, name, stats)
+                  in self._ranked(players, store, _byWinsOMW)]
+        for start in range(0, len(ranked), batchSize):
+            (_, pairings) = tournament_matching.pairTournament(
+                (tournament, ranked[start:start + batchSize], store.played,
+                 mode))
+            for pairing in pairings:
+                yield pairing
+
+    def matchedBefore(self, id1, id2):
+        """Returns True if the two players met before."""
+        return self.results.hasPlayed(id1, id2)
+
+    def matchedTournamentBefore(self, tournament, id1, id2):
+        """Returns True if the two players met before in the tournament."""
+        return self._store(tournament).hasPlayed(id1, id2)
+
+    def registerTournament(self, id, name):
+        """Adds a tournament; id must be unique."""
+        if id in self.tournaments:
+            raise ValueError("tournament %r already exists" % (id,))
+        self.tournaments[id] = name
+
+    def registerPlayerTournament(self, player, tournament):
+        """Adds a player to a tournament."""
+        self.registerPlayersTournament([(player, tournament)])
+
+    def registerPlayersTournament(self, pairs):
+        """Adds many players to tournaments. Returns the registration ids."""
+        for (player, tournament) in pairs:
+            self._checkPlayer(player)
+            self._checkOpen(tournament)
+        for (player, tournament) in pairs:
+            self.registrations.setdefault(tournament, []).append(player)
+        first = self.lastRegistrationId + 1
+        self.lastRegistrationId = self.lastRegistrationId + len(pairs)
+        return list(range(first, self.lastRegistrationId + 1))
+
+    def countPlayersTournament(self, tournament):
+        """Returns the number of players registered for the tournament."""
+        return len(self.registrations.get(tournament, []))
+
+    def deletePlayerTournaments(self):
+        """Remove all the player tournament records."""
+        self.registrations.clear()
+
+    def deleteTournaments(self):
+        """Remove all the tournaments."""
+        if (any(self.registrations.values())
+                or any(self.tournamentResults.values())):
+            raise ValueError("tournaments still have players or matches")
+        self.tournaments.clear()
+        self.tiebreakOrders.clear()
+        self.closedResults.clear()
+        self.archivedResults.clear()
+
+    def deleteTournamentMatches(self):
+        """Remove all the tournament match records."""
+        self.tournamentResults.clear()
+
+
+# Positions of omw and matches in playerStandingsTiebreaks() rows.
+_OMW = tournament_tiebreaks.COLUMNS.index("omw")
+_MATCHES = tournament_tiebreaks.COLUMNS.index("matches")
+
+
+# Sort keys and scores over MatchStore.stats() tuples.
+def _byWins(stats):
+    return -stats[0]
+
+def _byWinsOMW(stats):
+    return (-stats[0], -stats[3])
+
+def _byPoints(stats):
+    return -_points(stats)
+
+def _wins(stats):
+    return stats[0]
+
+def _points(stats):
+    return stats[0] * 3 + stats[1]
@@ -0,0 +1,724 @@
+#!/usr/bin/env python
+# -*- coding: cp1254 -*-
+#
+# tournament_matching.py -- Swiss pairing, independent of the database
+#
+# maxWeightMatching() is Edmonds' blossom algorithm for maximum weight
+# matching in general graphs, in the primal-dual form described by Galil,
+# "Efficient algorithms for finding maximum matching in graphs" (1986).
+# pairRanked() uses it to pair a ranked field without rematches.
+#
+# pairByMatching() and resolveRematches() turn ranked players into the rows
+# of the swissPairings views, for tournament.py and the in-memory backend of
+# tournament_engine.py alike.
+
+
+# Pairing modes of the swissPairingsOMW() and swissPairingsMT() functions:
+# PAIRING_SWAP pairs neighbours in the ranking and swaps players between
+# adjacent pairings to avoid rematches, which can leave some rematches in.
+# PAIRING_MATCHING solves the round as a maximum weight matching and only
+# returns a rematch when no rematch-free pairing exists.
+PAIRING_SWAP = "swap"
+PAIRING_MATCHING = "matching"
+
+# Players paired at a time by the iterPairings() functions, which read the
+# field in rank order in batches of this size.
+STREAM_BATCH_SIZE = 1000
+
+
+def maxWeightMatching(edges, maxcardinality=False):
+    """Computes a maximum weight matching of a general graph.
+
+    Runs in O(n^3) time for n vertices. Weights must be integers, which
+    keeps every dual variable an integer and the result exact.
+
+    Args:
+      edges: list of (i, j, weight) tuples; vertices are numbered 0..n-1
+      maxcardinality: if True, only maximum cardinality matchings are
+                      considered, and the heaviest of those is returned
+
+    Returns:
+      A list mate, where mate[i] is the vertex matched to i, or -1 if i is
+      left unmatched.
+    """
+    if not edges:
+        return []
+
+    nedge = len(edges)
+    nvertex = 0
+    for (i, j, w) in edges:
+        if i >= nvertex:
+            nvertex = i + 1
+        if j >= nvertex:
+            nvertex = j + 1
+    maxweight = max(0, max([w for (i, j, w) in edges]))
+
+    # endpoint[p] is the vertex at end p of edge p // 2.
+    endpoint = [edges[p // 2][p % 2] for p in range(2 * nedge)]
+    # neighbend[v] lists the remote endpoints of the edges incident to v.
+    neighbend = [[] for i in range(nvertex)]
+    for k in range(nedge):
+        (i, j, w) = edges[k]
+        neighbend[i].append(2 * k + 1)
+        neighbend[j].append(2 * k)
+
+    # mate[v] is the remote endpoint of v's matched edge, or -1.
+    mate = nvertex * [-1]
+    # Labels of top-level blossoms and vertices: 0 free, 1 S, 2 T.
+    label = (2 * nvertex) * [0]
+    # labelend[b] is the endpoint through which b got its label.
+    labelend = (2 * nvertex) * [-1]
+    inblossom = list(range(nvertex))
+    blossomparent = (2 * nvertex) * [-1]
+    blossomchilds = (2 * nvertex) * [None]
+    blossombase = list(range(nvertex)) + nvertex * [-1]
+    blossomendps = (2 * nvertex) * [None]
+    # bestedge[b] is the least-slack edge from b to a different S-blossom.
+    bestedge = (2 * nvertex) * [-1]
+    blossombestedges = (2 * nvertex) * [None]
+    unusedblossoms = list(range(nvertex, 2 * nvertex))
+    dualvar = nvertex * [maxweight] + nvertex * [0]
+    allowedge = nedge * [False]
+    queue = []
+
+    def slack(k):
+        (i, j, w) = edges[k]
+        return dualvar[i] + dualvar[j] - 2 * w
+
+    def blossomLeaves(b):
+        if b < nvertex:
+            yield b
+        else:
+            for t in blossomchilds[b]:
+                if t < nvertex:
+                    yield t
+                else:
+                    for v in blossomLeaves(t):
+                        yield v
+
+    def assignLabel(w, t, p):
+        b = inblossom[w]
+        label[w] = label[b] = t
+        labelend[w] = labelend[b] = p
+        bestedge[w] = bestedge[b] = -1
+        if t == 1:
+            queue.extend(blossomLeaves(b))
+        elif t == 2:
+            base = blossombase[b]
+            assignLabel(endpoint[mate[base]], 1, mate[base] ^ 1)
+
+    def scanBlossom(v, w):
+        # Trace back from v and w to find either a new blossom (returns its
+        # base) or an augmenting path (returns -1).
+        path = []
+        base = -1
+        while v != -1 or w != -1:
+            b = inblossom[v]
+            if label[b] & 4:
+                base = blossombase[b]
+                break
+            path.append(b)
+            label[b] = 5
+            if labelend[b] == -1:
+                v = -1
+            else:
+                v = endpoint[labelend[b]]
+                b = inblossom[v]
+                v = endpoint[labelend[b]]
+            if w != -1:
+                v, w = w, v
+        for b in path:
+            label[b] = 1
+        return base
+
+    def addBlossom(base, k):
+        (v, w, wt) = edges[k]
+        bb = inblossom[base]
+        bv = inblossom[v]
+        bw = inblossom[w]
+        b = unusedblossoms.pop()
+        blossombase[b] = base
+        blossomparent[b] = -1
+        blossomparent[bb] = b
+        blossomchilds[b] = path = []
+        blossomendps[b] = endps = []
+        while bv != bb:
+            blossomparent[bv] = b
+            path.append(bv)
+            endps.append(labelend[bv])
+            v = endpoint[labelend[bv]]
+            bv = inblossom[v]
+        path.append(bb)
+        path.reverse()
+        endps.reverse()
+        endps.append(2 * k)
+        while bw != bb:
+            blossomparent[bw] = b
+            path.append(bw)
+            endps.append(labelend[bw] ^ 1)
+            w = endpoint[labelend[bw]]
+            bw = inblossom[w]
+        label[b] = 1
+        labelend[b] = labelend[bb]
+        dualvar[b] = 0
+        for v in blossomLeaves(b):
+            if label[inblossom[v]] == 2:
+                # A T-vertex inside the new S-blossom becomes an S-vertex.
+                queue.append(v)
+            inblossom[v] = b
+        bestedgeto = (2 * nvertex) * [-1]
+        for bv in path:
+            if blossombestedges[bv] is None:
+                nblists = [[p // 2 for p in neighbend[v]]
+                           for v in blossomLeaves(bv)]
+            else:
+                nblists = [blossombestedges[bv]]
+            for nblist in nblists:
+                for k in nblist:
+                    (i, j, wt) = edges[k]
+                    if inblossom[j] == b:
+                        i, j = j, i
+                    bj = inblossom[j]
+                    if (bj != b and label[bj] == 1 and
+                            (bestedgeto[bj] == -1 or
+                             slack(k) < slack(bestedgeto[bj]))):
+                        bestedgeto[bj] = k
+            blossombestedges[bv] = None
+            bestedge[bv] = -1
+        blossombestedges[b] = [k for k in bestedgeto if k != -1]
+        bestedge[b] = -1
+        for k in blossombestedges[b]:
+            if bestedge[b] == -1 or slack(k) < slack(bestedge[b]):
+                bestedge[b] = k
+
+    def expandBlossom(b, endstage):
+        for s in blossomchilds[b]:
+            blossomparent[s] = -1
+            if s < nvertex:
+                inblossom[s] = s
+            elif endstage and dualvar[s] == 0:
+                expandBlossom(s, endstage)
+            else:
+                for v in blossomLeaves(s):
+                    inblossom[v] = s
+        if (not endstage) and label[b] == 2:
+            # Relabel the sub-blossoms on the even path from the entry
+            # child to the base, so the alternating tree stays valid.
+            entrychild = inblossom[endpoint[labelend[b] ^ 1]]
+            j = blossomchilds[b].index(entrychild)
+            if j & 1:
+                j -= len(blossomchilds[b])
+                jstep = 1
+                endptrick = 0
+            else:
+                jstep = -1
+                endptrick = 1
+            p = labelend[b]
+            while j != 0:
+                label[endpoint[p ^ 1]] = 0
+                label[endpoint[
+                    blossomendps[b][j - endptrick] ^ endptrick ^ 1]] = 0
+                assignLabel(endpoint[p ^ 1], 2, p)
+                allowedge[blossomendps[b][j - endptrick] // 2] = True
+                j += jstep
+                p = blossomendps[b][j - endptrick] ^ endptrick
+                allowedge[p // 2] = True
+                j += jstep
+            bv = blossomchilds[b][j]
+            label[endpoint[p ^ 1]] = label[bv] = 2
+            labelend[endpoint[p ^ 1]] = labelend[bv] = p
+            bestedge[bv] = -1
+            j += jstep
+            while blossomchilds[b][j] != entrychild:
+                bv = blossomchilds[b][j]
+                if label[bv] == 1:
+                    j += jstep
+                    continue
+                for v in blossomLeaves(bv):
+                    if label[v] != 0:
+                        break
+                if label[v] != 0:
+                    label[v] = 0
+                    label[endpoint[mate[blossombase[bv]]]] = 0
+                    assignLabel(v, 2, labelend[v])
+                j += jstep
+        label[b] = labelend[b] = -1
+        blossomchilds[b] = blossomendps[b] = None
+        blossombase[b] = -1
+        blossombestedges[b] = None
+        bestedge[b] = -1
+        unusedblossoms.append(b)
+
+    def augmentBlossom(b, v):
+        # Swap matched and unmatched edges inside blossom b so that vertex v
+        # becomes its base.
+        t = v
+        while blossomparent[t] != b:
+            t = blossomparent[t]
+        if t >= nvertex:
+            augmentBlossom(t, v)
+        i = j = blossomchilds[b].index(t)
+        if i & 1:
+            j -= len(blossomchilds[b])
+            jstep = 1
+            endptrick = 0
+        else:
+            jstep = -1
+            endptrick = 1
+        while j != 0:
+            j += jstep
+            t = blossomchilds[b][j]
+            p = blossomendps[b][j - endptrick] ^ endptrick
+            if t >= nvertex:
+                augmentBlossom(t, endpoint[p])
+            j += jstep
+            t = blossomchilds[b][j]
+            if t >= nvertex:
+                augmentBlossom(t, endpoint[p ^ 1])
+            mate[endpoint[p]] = p ^ 1
+            mate[endpoint[p ^ 1]] = p
+        blossomchilds[b] = blossomchilds[b][i:] + blossomchilds[b][:i]
+        blossomendps[b] = blossomendps[b][i:] + blossomendps[b][:i]
+        blossombase[b] = blossombase[blossomchilds[b][0]]
+
+    def augmentMatching(k):
+        (v, w, wt) = edges[k]
+        for (s, p) in ((v, 2 * k + 1), (w, 2 * k)):
+            while True:
+                bs = inblossom[s]
+                if bs >= nvertex:
+                    augmentBlossom(bs, s)
+                mate[s] = p
+                if labelend[bs] == -1:
+                    break
+                t = endpoint[labelend[bs]]
+                bt = inblossom[t]
+                s = endpoint[labelend[bt]]
+                j = endpoint[labelend[bt] ^ 1]
+                if bt >= nvertex:
+                    augmentBlossom(bt, j)
+                mate[j] = labelend[bt]
+                p = labelend[bt] ^ 1
+
+    # Each stage grows alternating trees from the free vertices until the
+    # matching is augmented by one edge, or no augmenting path is left.
+    for stage in range(nvertex):
+        label[:] = (2 * nvertex) * [0]
+        bestedge[:] = (2 * nvertex) * [-1]
+        blossombestedges[nvertex:] = nvertex * [None]
+        allowedge[:] = nedge * [False]
+        queue[:] = []
+        for v in range(nvertex):
+            if mate[v] == -1 and label[inblossom[v]] == 0:
+                assignLabel(v, 1, -1)
+
+        augmented = False
+        while True:
+            while queue and not augmented:
+                v = queue.pop()
+                for p in neighbend[v]:
+                    k = p // 2
+                    w = endpoint[p]
+                    if inblossom[v] == inblossom[w]:
+                        continue
+                    if not allowedge[k]:
+                        kslack = slack(k)
+                        if kslack <= 0:
+                            allowedge[k] = True
+                    if allowedge[k]:
+                        if label[inblossom[w]] == 0:
+                            assignLabel(w, 2, p ^ 1)
+                        elif label[inblossom[w]] == 1:
+                            base = scanBlossom(v, w)
+                            if base >= 0:
+                                addBlossom(base, k)
+                            else:
+                                augmentMatching(k)
+                                augmented = True
+                                break
+                        elif label[w] == 0:
+                            label[w] = 2
+                            labelend[w] = p ^ 1
+                    elif label[inblossom[w]] == 1:
+                        b = inblossom[v]
+                        if bestedge[b] == -1 or kslack < slack(bestedge[b]):
+                            bestedge[b] = k
+                    elif label[w] == 0:
+                        if bestedge[w] == -1 or kslack < slack(bestedge[w]):
+                            bestedge[w] = k
+            if augmented:
+                break
+
+            # No augmenting path with the current duals: find the largest
+            # dual change that keeps every edge slack non-negative.
+            deltatype = -1
+            delta = deltaedge = deltablossom = None
+            if not maxcardinality:
+                deltatype = 1
+                delta = min(dualvar[:nvertex])
+            for v in range(nvertex):
+                if label[inblossom[v]] == 0 and bestedge[v] != -1:
+                    d = slack(bestedge[v])
+                    if deltatype == -1 or d < delta:
+                        delta = d
+                        deltatype = 2
+                        deltaedge = bestedge[v]
+            for b in range(2 * nvertex):
+                if (blossomparent[b] == -1 and label[b] == 1 and
+                        bestedge[b] != -1):
+                    d = slack(bestedge[b]) // 2
+                    if deltatype == -1 or d < delta:
+                        delta = d
+                        deltatype = 3
+                        deltaedge = bestedge[b]
+            for b in range(nvertex, 2 * nvertex):
+                if (blossombase[b] >= 0 and blossomparent[b] == -1 and
+                        label[b] == 2 and
+                        (deltatype == -1 or dualvar[b] < delta)):
+                    delta = dualvar[b]
+                    deltatype = 4
+                    deltablossom = b
+            if deltatype == -1:
+                # Only possible with maxcardinality: the matching is
+                # maximal, finish with a final dual update.
+                deltatype = 1
+                delta = max(0, min(dualvar[:nvertex]))
+
+            for v in range(nvertex):
+                if label[inblossom[v]] == 1:
+                    dualvar[v] -= delta
+                elif label[inblossom[v]] == 2:
+                    dualvar[v] += delta
+            for b in range(nvertex, 2 * nvertex):
+                if blossombase[b] >= 0 and blossomparent[b] == -1:
+                    if label[b] == 1:
+                        dualvar[b] += delta
+                    elif label[b] == 2:
+                        dualvar[b] -= delta
+
+            if deltatype == 1:
+                break
+            elif deltatype == 2:
+                allowedge[deltaedge] = True
+                (i, j, wt) = edges[deltaedge]
+                if label[inblossom[i]] == 0:
+                    i, j = j, i
+                queue.append(i)
+            elif deltatype == 3:
+                allowedge[deltaedge] = True
+                (i, j, wt) = edges[deltaedge]
+                queue.append(i)
+            elif deltatype == 4:
+                expandBlossom(deltablossom, False)
+
+        if not augmented:
+            break
+        # Expand S-blossoms whose dual reached zero; they are no longer
+        # needed as the matching changed.
+        for b in range(nvertex, 2 * nvertex):
+            if (blossomparent[b] == -1 and blossombase[b] >= 0 and
+                    label[b] == 1 and dualvar[b] == 0):
+                expandBlossom(b, True)
+
+    for v in range(nvertex):
+        if mate[v] >= 0:
+            mate[v] = endpoint[mate[v]]
+    return mate
+
+
+def _solveSegment(scores, matched, start, end, bye=False):
+    """Pairs players start..end-1 without rematches if possible.
+
+    Pairs of players with close scores, and then close ranks, are preferred.
+    If bye is True, one player is left without an opponent: a vertex that
+    every player may be matched to stands for the bye, so that the bye goes
+    wherever it makes a rematch-free pairing possible, to the lowest scored
+    and then lowest ranked player among those.
+
+    Returns:
+      (pairs, complete, bye): pairs is a list of (i, j) index tuples,
+      complete is False if some players could not be paired without a
+      rematch, and bye is the index of the player left out, or None.
+    """
+    size = end - start
+    low = min(scores[start:end])
+    high = max(scores[start:end])
+    maxCost = (high - low) * (high - low) * size + size
+    edges = []
+    for u in range(start, end):
+        for v in range(u + 1, end):
+            if matched(u, v):
+                continue
+            cost = (scores[u] - scores[v]) * (scores[u] - scores[v]) * size
+            cost = cost + (v - u)
+            edges.append((u - start, v - start, int(maxCost + 1 - cost)))
+        if bye:
+            cost = (scores[u] - low) * (scores[u] - low) * size + (end - 1 - u)
+            edges.append((u - start, size, int(maxCost + 1 - cost)))
+    mate = maxWeightMatching(edges, maxcardinality=True)
+    mate = mate + (size + 1 - len(mate)) * [-1]
+    pairs = []
+    unpaired = []
+    byePlayer = None
+    for u in range(size):
+        if mate[u] == size:
+            byePlayer = start + u
+        elif mate[u] > u:
+            pairs.append((start + u, start + mate[u]))
+        elif mate[u] == -1:
+            unpaired.append(start + u)
+    complete = not unpaired
+    if bye and byePlayer is None:
+        byePlayer = unpaired.pop()
+    i = 0
+    while i < len(unpaired):
+        pairs.append((unpaired[i], unpaired[i + 1]))
+        i = i + 2
+    return pairs, complete, byePlayer
+
+
+def pairRanked(scores, matched, block=4):
+    """Pairs a ranked field so that no two players meet a second time.
+
+    Players are first paired with their neighbour in the ranking, as the
+    swissPairings views do. The ranking is then cut into aligned blocks of
+    block players, and each block holding a rematch is re-paired by maximum
+    weight matching. A block that cannot be paired without a rematch is
+    merged with its neighbour into a block twice the size, and so on up to
+    the whole field, so the result is rematch-free whenever any rematch-free
+    pairing exists. In a typical round only a few small blocks are solved.
+
+    In an odd field the bye goes to the lowest ranked player, as in the
+    views, unless the others cannot then be paired without a rematch. The
+    whole field is then solved again with the bye left to the matching.
+
+    Merging blocks up to the whole field costs O(n^3) in the worst case;
+    "tournament_bench.py matching" times simulated events of a given size.
+
+    Args:
+      scores: the players' scores (wins or points), in rank order
+      matched: function(i, j) of two indices into scores, returning True if
+               those players have played each other
+      block: size of the smallest blocks, an even number
+
+    Returns:
+      (pairs, bye): pairs is a list of (i, j) index tuples sorted by i, and
+      bye is the index of the player left without an opponent, or None.
+    """
+    n = len(scores)
+    bye = None
+    if n % 2 == 1:
+        bye = n - 1
+        n = n - 1
+
+    # Blocks are (start, size) with start a multiple of size; the block
+    # covers players start..min(start + size, n) - 1.
+    pending = set()
+    for k in range(0, n, 2):
+        if matched(k, k + 1):
+            pending.add((k - k % block, block))
+    solved = {}
+    stuck = False
+    while pending:
+        failed = set()
+        for (start, size) in sorted(pending):
+            end = min(start + size, n)
+            pairs, complete, _ = _solveSegment(scores, matched, start, end)
+            if complete or size >= n:
+                solved[(start, size)] = pairs
+                stuck = not complete
+            else:
+                failed.add((start - start % (2 * size), 2 * size))
+        for (start, size) in failed:
+            # The larger block replaces every block already solved inside it.
+            for key in list(solved):
+                if start <= key[0] < start + size:
+                    del solved[key]
+        pending = failed
+
+    if stuck and bye is not None:
+        pairs, complete, other = _solveSegment(scores, matched, 0, n + 1,
+                                               bye=True)
+        if complete:
+            return sorted(pairs), other
+
+    partner = {}
+    for pairs in solved.values():
+        for (i, j) in pairs:
+            partner[i] = j
+            partner[j] = i
+    result = []
+    for i in range(n):
+        if i in partner:
+            if partner[i] > i:
+                result.append((i, partner[i]))
+        elif i % 2 == 0:
+            result.append((i, i + 1))
+    return result, bye
+
+
+def matchedIn(played):
+    """Returns a matchedBefore-style function that looks pairs up in played."""
+    def matched(id1, id2):
+        if id1 is None or id2 is None:
+            return False
+        if id1 < id2:
+            return (id1, id2) in played
+        return (id2, id1) in played
+    return matched
+
+
+def winnerOf(player1, player2, result):
+    """Returns the id of the winner for a result code, None for a draw."""
+    if(result == 1):
+        return player1
+    elif(result == 2):
+        return player2
+    elif(result == 0):
+        return None
+    raise ValueError("result should be 0, 1 or 2, not %r" % (result,))
+
+
+def checkPairingMode(mode):
+    """Raises ValueError unless mode is one of the PAIRING_* modes."""
+    if mode not in (PAIRING_SWAP, PAIRING_MATCHING):
+        raise ValueError("unknown pairing mode %r" % (mode,))
+
+
+def pairByMatching(ranked, played, tournament=None):
+    """Pairs ranked players with pairRanked().
+
+    Args:
+      ranked: list of (rank, id, name, wins) rows in rank order
+      played: set of (id1, id2) pairs with id1 < id2 who met before
+      tournament: if not None, appended to every row as in swissPairingsMT
+
+    Returns:
+      A tuple of pairings laid out as the rows of the swissPairings views.
+    """
+    ids = [row[1] for row in ranked]
+    matched = matchedIn(played)
+
+    def matchedAt(i, j):
+        return matched(ids[i], ids[j])
+    pairs, bye = pairRanked([row[3] for row in ranked], matchedAt)
+    pairings = []
+    for (i, j) in pairs:
+        (rank1, id1, name1, wins1) = ranked[i]
+        (rank2, id2, name2, wins2) = ranked[j]
+        pairings.append([id1, name1, id2, name2, rank1, rank2, wins1, wins2,
+                         int(matched(id1, id2))])
+    if bye is not None:
+        (rank1, id1, name1, wins1) = ranked[bye]
+        pairings.append([id1, name1, None, None, rank1, None, wins1, None, 0])
+    if tournament is not None:
+        for pairing in pairings:
+            pairing.append(tournament)
+    return tuple(pairings)
+
+
+def pairBySwapping(ranked, played, tournament=None):
+    """Pairs ranked players as the swissPairingsOMW and swissPairingsMT
+    views do, each with the next in rank order, then swaps pairings to
+    avoid rematches with resolveRematches().
+
+    Args:
+      ranked: list of (rank, id, name, wins) rows in rank order
+      played: set of (id1, id2) pairs with id1 < id2 who met before
+      tournament: if not None, appended to every row as in swissPairingsMT
+
+    Returns:
+      A tuple of pairings laid out as the rows of the swissPairings views.
+    """
+    matched = matchedIn(played)
+    pairings = []
+    for i in range(0, len(ranked), 2):
+        (rank1, id1, name1, wins1) = ranked[i]
+        if i + 1 < len(ranked):
+            (rank2, id2, name2, wins2) = ranked[i + 1]
+            pairings.append([id1, name1, id2, name2, rank1, rank2, wins1,
+                             wins2, int(matched(id1, id2))])
+        else:
+            pairings.append([id1, name1, None, None, rank1, None, wins1, None,
+                             0])
+        if tournament is not None:
+            pairings[-1].append(tournament)
+    resolveRematches(pairings, matched, True)
+    return tuple(pairings)
+
+
+def pairTournament(args):
+    """Pairs one tournament for swissPairingsAllTournaments().
+
+    Args:
+      args: a (tournament, ranked, played, mode) tuple, ranked and played as
+            for pairByMatching(); a single argument so that it can be
+            mapped over a process pool
+
+    Returns:
+      A (tournament, pairings) tuple.
+    """
+    (tournament, ranked, played, mode) = args
+    if mode == PAIRING_MATCHING:
+        return (tournament, pairByMatching(ranked, played, tournament))
+    return (tournament, pairBySwapping(ranked, played, tournament))
+
+
+def resolveRematches(pairings, matched, sameWins):
+    """Swaps second players between pairings to avoid rematches.
+
+    Used by the swissPairings* functions of tournament.py on the rows of their
+    views.
+
+    Args:
+      pairings: list of pairings, each a list laid out as the swissPairings
+                views (id1, name1, id2, name2, rank1, rank2, wins1, wins2,
+                matchedBefore, ...). Modified in place.
+      matched: function(id1, id2) returning True if the players met before
+      sameWins: if True, a pairing is only swapped with one whose players
+                have the same wins as its own players
+    """
+    def canSwap(i, j):
+        if(sameWins):
+            return ((pairings[j][7] == pairings[i][7])
+                and (not matched(pairings[i][0],pairings[j][2]))
+                and (pairings[j][6] == pairings[i][6])
+                and (not matched(pairings[j][0],pairings[i][0])))
+        return ((not matched(pairings[i][0],pairings[j][2]))
+            and (not matched(pairings[j][0],pairings[i][2])))
+
+    def swap(i, j):
+        for column in (2, 3, 5, 7):
+            pairings[i][column], pairings[j][column] = (
+                pairings[j][column], pairings[i][column])
+        pairings[i][8] = 0
+        pairings[j][8] = 0
+
+    i = 0
+    while(i < len(pairings)):
+        #if two players in the pairing matched before
+        if(pairings[i][8] == 1):
+            j = i - 1
+            isRematchResolved = False
+#perform search on previous pairings:
+#if there exists such a pairing that
+#player1 in the pairing i never matched with player2 in pairing j
+#and player2 in the pairing i never matched with player1 in pairing j
+#then switch player2's of pairing i and pairing j
+            while(j>0):
+                if(canSwap(i, j)):
+                    swap(i, j)
+                    isRematchResolved = True
+                    break
+                j = j - 1
+#if no available pairings found in previous pairings,
+#then search for the subsequent pairings
+            if(not isRematchResolved):
+                j = i + 1
+                while(j < len(pairings)):
+                    if(canSwap(i, j)):
+                        swap(i, j)
+                        isRematchResolved = True
+                        break
+                    j = j + 1
+        i = i + 1
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: cp1254 -*-
+#
+# tournament_migrate.py -- bring an existing tournament database up to date
+#
+# Usage:
+#   python tournament_migrate.py          apply the pending migrations
+#   python tournament_migrate.py --check  list pending migrations and
+#                                         missing indexes, change nothing
+#
+# The database is the one tournament.py connects to (TOURNAMENT_DSN).
+
+import os
+import re
+import sys
+import psycopg2
+import tournament
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "migrations")
+
+# A migration whose first line is this marker is run outside a transaction,
+# one statement at a time, as CREATE INDEX CONCURRENTLY requires.
+NO_TRANSACTION = "-- migrate: no-transaction"
+
+# Indexes the standings, pairing and rematch queries rely on: (table, name).
+REQUIRED_INDEXES = [
+    ("matches", "matches_player1_player2_idx"),
+    ("matches", "matches_player2_player1_idx"),
+    ("matches", "matches_winner_idx"),
+    ("tournamentmatches", "tournamentmatches_tournament_player1_player2_idx"),
+    ("tournamentmatches", "tournamentmatches_tournament_player2_player1_idx"),
+    ("tournamentmatches", "tournamentmatches_tournament_winner_idx"),
+    ("playertournaments", "playertournaments_tournament_player_idx"),
+    ("player_tournament_stats", "player_tournament_stats_ranking_idx"),
+]
+
+
+def migrationFiles():
+    """Returns the migrations as a list of (version, name, path), in order.
+
+    Migration files are named NNNN_name.sql, NNNN being the version.
+    """
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = re.match(r"^(\d+)_(\w+)\.sql$", filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2),
+                               os.path.join(MIGRATIONS_DIR, filename)))
+    migrations.sort()
+    return migrations
+
+
+def appliedVersions(cursor):
+    """Returns the set of migration versions applied to the database."""
+    cursor.execute("SELECT to_regclass('schema_migrations')")
+    if cursor.fetchone()[0] is None:
+        return set()
+    cursor.execute("SELECT version FROM schema_migrations")
+    return set([row[0] for row in cursor.fetchall()])
+
+
+def pendingMigrations(cursor):
+    """Returns the migrations not yet applied, as from migrationFiles()."""
+    applied = appliedVersions(cursor)
+    return [m for m in migrationFiles() if m[0] not in applied]
+
+
+def missingIndexes(cursor):
+    """Returns the REQUIRED_INDEXES that do not exist in the database."""
+    cursor.execute("SELECT tablename, indexname FROM pg_indexes "
+                   "WHERE schemaname = current_schema()")
+    existing = set(cursor.fetchall())
+    return [index for index in REQUIRED_INDEXES if index not in existing]
+
+
+def _statements(sql):
+    """Splits a migration into statements. Only used for no-transaction
+    migrations, which must not contain function bodies."""
+    lines = [line for line in sql.splitlines()
+             if not line.strip().startswith("--")]
+    statements = [s.strip() for s in "\n".join(lines).split(";")]
+    return [s for s in statements if s]
+
+
+def applyMigration(db, version, name, path):
+    """Applies one migration and records it in schema_migrations."""
+    sql = open(path).read()
+    cursor = db.cursor()
+    cursor.execute("CREATE TABLE IF NOT EXISTS schema_migrations("
+                   "version int primary key, name text, "
+                   "applied_at timestamp default now())")
+    db.commit()
+    if sql.startswith(NO_TRANSACTION):
+        db.autocommit = True
+        try:
+            for statement in _statements(sql):
+                cursor.execute(statement)
+        finally:
+            db.autocommit = False
+    else:
+        cursor.execute(sql)
+    cursor.execute("INSERT INTO schema_migrations (version, name) "
+                   "VALUES (%s, %s)", (version, name))
+    db.commit()
+
+
+def migrate(dsn=None):
+    """Applies every pending migration, in order.
+
+    Returns:
+      The list of migrations applied, as from migrationFiles().
+    """
+    db = psycopg2.connect(dsn or tournament.DSN)
+    try:
+        cursor = db.cursor()
+        pending = pendingMigrations(cursor)
+        db.commit()
+        for (version, name, path) in pending:
+            applyMigration(db, version, name, path)
+        return pending
+    finally:
+        db.close()
+
+
+def check(dsn=None):
+    """Returns (pending migrations, missing indexes) without changing anything."""
+    db = psycopg2.connect(dsn or tournament.DSN)
+    try:
+        cursor = db.cursor()
+        return pendingMigrations(cursor), missingIndexes(cursor)
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    if "--check" in sys.argv[1:]:
+        pending, missing = check()
+        for (version, name, path) in pending:
+            sys.stdout.write("pending migration %s: %s\n" % (version, name))
+        for (table, index) in missing:
+            sys.stdout.write("missing index %s on %s\n" % (index, table))
+        if pending or missing:
+            sys.exit(1)
+        sys.stdout.write("Database is up to date.\n")
+    else:
+        for (version, name, path) in migrate():
+            sys.stdout.write("applied migration %s: %s\n" % (version, name))
+        sys.stdout.write("Database is up to date.\n")
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: cp1254 -*-
+#
+# tournament_stats.py -- opt-in instrumentation of the tournament API
+#
+# When enabled, every public function of tournament.py records its calls,
+# errors, latency histogram, and the connections, queries and rows fetched
+# while it runs (including those of the functions it calls):
+#
+#   import tournament_stats
+#   tournament_stats.enable()
+#   ...
+#   tournament_stats.stats()["swissPairingsPreventRematch"]["queries"]
+#
+# Setting TOURNAMENT_STATS=1 in the environment enables it at import, and
+# TOURNAMENT_STATS_INTERVAL=<seconds> also dumps the stats to stderr, as
+# one JSON line, at that interval.
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+timer = getattr(time, "perf_counter", time.time)
+
+# Upper bounds, in seconds, of the latency histogram buckets. A last bucket
+# counts the calls slower than all of them.
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10)
+
+_enabled = False
+_lock = threading.Lock()
+_functions = {}
+_local = threading.local()
+_dumper = None
+
+# Indexes of the counters of a running call.
+_QUERIES, _ROWS, _CONNECTIONS = 0, 1, 2
+
+
+class FunctionStats(object):
+    """What the calls of one function have cost so far."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.maxSeconds = 0.0
+        self.histogram = [0] * (len(BUCKETS) + 1)
+        self.queries = 0
+        self.rows = 0
+        self.connections = 0
+
+    def add(self, seconds, counters, failed):
+        self.calls = self.calls + 1
+        if failed:
+            self.errors = self.errors + 1
+        self.seconds = self.seconds + seconds
+        self.maxSeconds = max(self.maxSeconds, seconds)
+        bucket = 0
+        while bucket < len(BUCKETS) and seconds > BUCKETS[bucket]:
+            bucket = bucket + 1
+        self.histogram[bucket] = self.histogram[bucket] + 1
+        self.queries = self.queries + counters[_QUERIES]
+        self.rows = self.rows + counters[_ROWS]
+        self.connections = self.connections + counters[_CONNECTIONS]
+
+    def asDict(self):
+        bounds = list(BUCKETS) + [None]
+        return {"calls": self.calls, "errors": self.errors,
+                "seconds": self.seconds, "max_seconds": self.maxSeconds,
+                "histogram": list(zip(bounds, self.histogram)),
+                "queries": self.queries, "rows": self.rows,
+                "connections": self.connections}
+
+
+def instrumented(function):
+    """Decorates a public function so that its calls are recorded while
+    instrumentation is enabled. Disabled, it only adds a flag test."""
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return function(*args, **kwargs)
+        counters = [0, 0, 0]
+        stack = _stack()
+        stack.append(counters)
+        failed = True
+        start = timer()
+        try:
+            result = function(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            seconds = timer() - start
+            stack.pop()
+            with _lock:
+                stats = _functions.get(name)
+                if stats is None:
+                    stats = _functions[name] = FunctionStats()
+                stats.add(seconds, counters, failed)
+    return wrapper
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _count(index, count):
+    if _enabled:
+        for counters in getattr(_local, "stack", ()):
+            counters[index] = counters[index] + count
+
+
+def recordQuery(count=1):
+    """Counts statements sent to the server by the running calls."""
+    _count(_QUERIES, count)
+
+
+def recordRows(count):
+    """Counts rows fetched by the running calls."""
+    _count(_ROWS, count)
+
+
+def recordConnection():
+    """Counts a connection checked out of the pool by the running calls."""
+    _count(_CONNECTIONS, 1)
+
+
+def enable(dumpInterval=None, stream=None):
+    """Starts recording calls.
+
+    Args:
+      dumpInterval: if not None, dump() the stats every dumpInterval seconds
+                    from a background thread
+      stream: file the periodic dumps are written to, stderr by default
+    """
+    global _enabled, _dumper
+    _enabled = True
+    if dumpInterval is not None and _dumper is None:
+        _dumper = _Dumper(dumpInterval, stream or sys.stderr)
+        _dumper.start()
+
+
+def disable():
+    """Stops recording calls and any periodic dump. The stats are kept."""
+    global _enabled, _dumper
+    _enabled = False
+    if _dumper is not None:
+        _dumper.stopped.set()
+        _dumper = None
+
+
+def reset():
+    """Forgets every recorded call."""
+    with _lock:
+        _functions.clear()
+
+
+def stats():
+    """Returns a dict of function name -> dict of its stats:
+      calls, errors: number of calls, and of those that raised
+      seconds, max_seconds: total and slowest wall time of the calls
+      histogram: list of (upper bound in seconds, calls), the last bound
+                 being None
+      queries, rows, connections: statements run, rows fetched and pool
+                 checkouts made during the calls
+    """
+    with _lock:
+        return dict((name, function.asDict())
+                    for (name, function) in _functions.items())
+
+
+def dump(stream=None):
+    """Writes the stats to stream (stderr by default) as one JSON line."""
+    stream = stream or sys.stderr
+    stream.write(json.dumps({"time": time.time(), "stats": stats()},
+                            sort_keys=True) + "\n")
+    stream.flush()
+
+
+class _Dumper(threading.Thread):
+
+    def __init__(self, interval, stream):
+        super(_Dumper, self).__init__()
+        self.daemon = True
+        self.interval = interval
+        self.stream = stream
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            dump(self.stream)
+
+
+if os.environ.get("TOURNAMENT_STATS", "0") == "1":
+    interval = os.environ.get("TOURNAMENT_STATS_INTERVAL")
+    enable(float(interval) if interval else None)
@@ -4,7 +4,19 @@
 # Test cases for tournament.py
 
 from tournament import *
+import tournament
+import tournament_cache
+import tournament_matching
+import tournament_migrate
+import tournament_engine
+import tournament_stats
+try:
+    import tournament_vectorized
+except ImportError:
+    tournament_vectorized = None
 import math
+import psycopg2.pool
+import threading
 from random import randint
 
 def testDeleteMatches():
@@ -272,118 +284,954 @@ def testMultipleTournaments():
                 result = randint(0,2)
                 reportMatchTournamentWithDraw(t,pid1,pid2,result)
         print "14. After %s rounds, players with one win are paired, except %s." %(rounds,countMisMatches)
+
+def testSession():
+    deleteMatches()
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    deletePlayers()
+    register42Players()
+    players = [row[0] for row in playerStandings()]
+    with TournamentSession() as session:
+        session.registerTournament(0,"Session Tournament")
+        for p in players:
+            session.registerPlayerTournament(p,0)
+        if session.countPlayersTournament(0) != len(players):
+            raise ValueError("A session should see its own registrations.")
+        i = 0
+        while (i < len(players)):
+            session.reportMatchTournamentWithDraw(0,players[i],players[i+1],1)
+            i = i + 2
+        pairings = session.swissPairingsMT(0)
+        if countPlayersTournament(0) != 0:
+            raise ValueError("Session writes should not be visible before commit.")
+    if countPlayersTournament(0) != len(players):
+        raise ValueError("Session writes should be visible after commit.")
+    # 42 players leave 21 winners, so one winner meets a loser.
+    mismatched = 0
+    for pairing in pairings:
+        [pid1, pname1, pid2, pname2,prank1,prank2,pwins1,pwins2,pmatchedBefore,ptournament] = pairing
+        if(pwins1 != pwins2):
+            mismatched = mismatched + 1
+    if mismatched != 1:
+        raise ValueError("After one round, players with equal wins should be paired.")
+    try:
+        with TournamentSession() as session:
+            session.registerTournament(1,"Rolled Back Tournament")
+            session.registerPlayerTournament(players[0],1)
+            raise KeyError("abort")
+    except KeyError:
+        pass
+    if countPlayersTournament(1) != 0:
+        raise ValueError("A failed session should be rolled back.")
+    print "15. A session reports, ranks and pairs a round in one transaction."
+
+def testBulkRegister():
+    deleteMatches()
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    deletePlayers()
+    names = ["Bulk Player %s" % i for i in range(2000)] + ["Tab\tBack\\slash"]
+    ids = registerPlayers(names)
+    if len(ids) != len(names) or len(set(ids)) != len(names):
+        raise ValueError("registerPlayers should return one new id per name.")
+    if countPlayers() != len(names):
+        raise ValueError("registerPlayers should register every name.")
+    registered = dict((row[0], row[1]) for row in playerStandings())
+    for (id, name) in zip(ids, names):
+        if registered[id] != name:
+            raise ValueError("registerPlayers should return ids in input order.")
+    registerTournament(0,"Bulk Tournament")
+    registerPlayersTournament([(id, 0) for id in ids[:1000]])
+    if countPlayersTournament(0) != 1000:
+        raise ValueError("registerPlayersTournament should register every pair.")
+    if registerPlayers([]) != []:
+        raise ValueError("registerPlayers of no names should return no ids.")
+    print "16. Players and tournament players can be registered in bulk."
+
+def testReportRound():
+    deleteMatches()
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    deletePlayers()
+    ids = register99Players()
+    registerTournament(0,"Round Tournament")
+    registerPlayersTournament([(id, 0) for id in ids])
+    results = []
+    i = 0
+    while (i + 1 < len(ids)):
+        results.append((ids[i], ids[i+1], i % 3))
+        i = i + 2
+    results.append((ids[-1], None, 1))
+    reportRound(0, results)
+    expectedWins = len([r for r in results if r[2] != 0])
+    pairings = swissPairingsMT(0)
+    wins = 0
+    for pairing in pairings:
+        wins = wins + pairing[6] + (pairing[7] or 0)
+    if wins != expectedWins:
+        raise ValueError("reportRound should record %s wins, not %s." %(expectedWins,wins))
+    try:
+        reportRound(0, [(ids[0], ids[1], 1), (ids[2], ids[3], 7)])
+        raise AssertionError("reportRound should reject unknown results.")
+    except ValueError:
+        pass
+    try:
+        reportRound(0, [(ids[0], ids[1], 1), (ids[2], -1, 1)])
+        raise AssertionError("reportRound should reject unknown players.")
+    except psycopg2.IntegrityError:
+        pass
+    reportRound(None, [(ids[0], ids[1], 1), (ids[2], ids[3], 0)])
+    standings = playerStandings()
+    for (i, n, w, m) in standings:
+        if i in (ids[0], ids[1], ids[2], ids[3]) and m != 1:
+            raise ValueError("reportRound should be all-or-nothing.")
+        if i == ids[0] and w != 1:
+            raise ValueError("reportRound should record the winner.")
+    print "17. A whole round can be reported at once."
+
+def testPairingMatching():
+    deleteMatches()
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    deletePlayers()
+    ids = register99Players()
+    registerTournament(0,"Matching Tournament")
+    registerPlayersTournament([(id, 0) for id in ids])
+    playersCount = len(ids)
+    rounds = int(math.ceil(math.log(playersCount,2)))
+    played = set()
+    for r in range(rounds):
+        pairings = swissPairingsMT(0, PAIRING_MATCHING)
+        if len(pairings) != playersCount/2 + 1:
+            raise ValueError(
+                "For %s players, swissPairings should return %s pairs. Not %s" %(playersCount,playersCount/2+1,len(pairings)))
+        results = []
+        seen = set()
+        for pairing in pairings:
+            [pid1, pname1, pid2, pname2,prank1,prank2,pwins1,pwins2,pmatchedBefore,ptournament] = pairing
+            if pid1 in seen or pid2 in seen:
+                raise ValueError("A player should be paired only once per round.")
+            seen.add(pid1)
+            if pid2 is None:
+                results.append((pid1, None, 1))
+                continue
+            seen.add(pid2)
+            if pmatchedBefore != 0 or frozenset([pid1, pid2]) in played:
+                raise ValueError("Round %s pairs players %s and %s again." %(r + 1, pid1, pid2))
+            played.add(frozenset([pid1, pid2]))
+            results.append((pid1, pid2, randint(0,2)))
+        reportRound(0, results)
+    # Player 0 has played 1, 2 and 3: with the bye on player 4, 0 would have
+    # to meet one of them again.
+    played = set([(0, 1), (0, 2), (0, 3)])
+    (pairs, bye) = tournament_matching.pairRanked(
+        [3, 2, 1, 0, 0], lambda i, j: (min(i, j), max(i, j)) in played)
+    if bye is None or any((min(i, j), max(i, j)) in played for (i, j) in pairs):
+        raise ValueError("The bye should move when it makes a rematch-free pairing possible.")
+    print "18. After %s rounds, the matching pairings have no rematches." %(rounds)
+
+def testStandingsStats():
+    deleteMatches()
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    deletePlayers()
+    ids = register42Players()
+    matches = []
+    for r in range(4):
+        results = []
+        i = 0
+        while (i + 1 < len(ids)):
+            player1 = ids[(i + r) % len(ids)]
+            player2 = ids[(i + 3 * r + 1) % len(ids)]
+            if player1 != player2:
+                results.append((player1, player2, randint(0,2)))
+            i = i + 2
+        reportRound(None, results)
+        matches.extend(results)
+    wins = dict((id, 0) for id in ids)
+    opponents = dict((id, set()) for id in ids)
+    for (player1, player2, result) in matches:
+        if result == 1:
+            wins[player1] = wins[player1] + 1
+        elif result == 2:
+            wins[player2] = wins[player2] + 1
+        opponents[player1].add(player2)
+        opponents[player2].add(player1)
+    for (i, n, w, omw, m) in playerStandingsOMW():
+        expectedOMW = sum([wins[o] for o in opponents[i]])
+        if w != wins[i] or omw != expectedOMW:
+            raise ValueError("Player %s should have %s wins and %s OMW, not %s and %s." %(i,wins[i],expectedOMW,w,omw))
+    deleteMatches()
+    for (i, n, w, omw, m) in playerStandingsOMW():
+        if w != 0 or omw != 0 or m != 0:
+            raise ValueError("After deleting matches, standings should be reset.")
+    print "19. Stored standings match the reported results."
+
+def testSchemaUpToDate():
+    pending, missing = tournament_migrate.check()
+    if pending:
+        raise ValueError("Migrations %s have not been applied." %([m[0] for m in pending]))
+    if missing:
+        raise ValueError("Indexes %s are missing." %([i[1] for i in missing]))
+    print "20. The database schema is up to date and fully indexed."
+
+def testStandingsMT():
+    deleteMatches()
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    deletePlayers()
+    ids = register42Players()
+    expected = {}
+    for t in range(3):
+        registerTournament(t,"Tournament " + str(t+1))
+        players = ids[t * 4:]
+        registerPlayersTournament([(id, t) for id in players])
+        wins = dict((id, 0) for id in players)
+        opponents = dict((id, set()) for id in players)
+        matches = dict((id, 0) for id in players)
+        for r in range(3):
+            results = []
+            for pairing in swissPairingsMT(t):
+                [pid1, pname1, pid2, pname2,prank1,prank2,pwins1,pwins2,pmatchedBefore,ptournament] = pairing
+                result = randint(0,2)
+                results.append((pid1, pid2, result))
+                matches[pid1] = matches[pid1] + 1
+                if pid2 is not None:
+                    matches[pid2] = matches[pid2] + 1
+                    opponents[pid1].add(pid2)
+                    opponents[pid2].add(pid1)
+                if result == 1:
+                    wins[pid1] = wins[pid1] + 1
+                elif result == 2:
+                    wins[pid2] = wins[pid2] + 1
+            reportRound(t, results)
+        for id in players:
+            omw = sum([wins[o] for o in opponents[id]])
+            expected[(t, id)] = (wins[id], omw, matches[id])
+    for t in range(3):
+        standings = playerStandingsMT(t)
+        if len(standings) != len(ids) - t * 4:
+            raise ValueError("playerStandingsMT should list the tournament's players.")
+        previous = None
+        for (i, n, w, omw, m) in standings:
+            if (w, omw, m) != expected[(t, i)]:
+                raise ValueError("Player %s in tournament %s should have %s, not %s." %(i,t,expected[(t, i)],(w, omw, m)))
+            if previous is not None and (w, omw) > previous:
+                raise ValueError("playerStandingsMT should be sorted by wins and OMW.")
+            previous = (w, omw)
+    print "21. Tournament standings count each tournament's matches only."
+
+def testEngine():
+    deleteMatches()
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    deletePlayers()
+    engine = tournament_engine.TournamentEngine()
+    for name in tournament_engine.API:
+        if not hasattr(engine, name):
+            raise ValueError("TournamentEngine should provide %s()." %(name))
+    ids = register42Players()
+    engineIds = engine.registerPlayers(NAMES_42)
+    toEngine = dict(zip(ids, engineIds))
+    registerTournament(0,"Tournament 1")
+    engine.registerTournament(0,"Tournament 1")
+    registerPlayersTournament([(id, 0) for id in ids])
+    engine.registerPlayersTournament([(id, 0) for id in engineIds])
+    for r in range(5):
+        results = []
+        for i in range(0, len(ids), 2):
+            results.append((ids[(i + 5 * r) % len(ids)], ids[(i + 7 * r + 1) % len(ids)], randint(0,2)))
+        results = [result for result in results if result[0] != result[1]]
+        reportRound(None, results)
+        reportRound(0, results)
+        engineResults = [(toEngine[p1], toEngine[p2], result) for (p1, p2, result) in results]
+        engine.reportRound(None, engineResults)
+        engine.reportRound(0, engineResults)
+    expected = set([(toEngine[i], n, w, omw, m) for (i, n, w, omw, m) in playerStandingsOMW()])
+    if set(engine.playerStandingsOMW()) != expected:
+        raise ValueError("TournamentEngine standings should match the database.")
+    expected = set([(toEngine[i], n, w, omw, m) for (i, n, w, omw, m) in playerStandingsMT(0)])
+    if set(engine.playerStandingsMT(0)) != expected:
+        raise ValueError("TournamentEngine tournament standings should match the database.")
+    for pairing in engine.swissPairingsMT(0, PAIRING_MATCHING):
+        if pairing[8] != 0:
+            raise ValueError("TournamentEngine should pair without rematches.")
+    print "22. The in-memory engine keeps the same standings as the database."
+
+def testVectorizedStandings():
+    if tournament_vectorized is None:
+        print "23. Vectorized standings skipped, NumPy is not installed."
+        return
+    deleteMatches()
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    deletePlayers()
+    ids = register42Players()
+    registerTournament(0,"Tournament 1")
+    registerPlayersTournament([(id, 0) for id in ids])
+    for r in range(5):
+        results = []
+        for i in range(0, len(ids), 2):
+            results.append((ids[(i + 5 * r) % len(ids)], ids[(i + 7 * r + 1) % len(ids)], randint(0,2)))
+        results = [result for result in results if result[0] != result[1]]
+        reportRound(None, results)
+        reportRound(0, results)
+    for (standings, vectorized) in ((playerStandingsOMW(), tournament_vectorized.playerStandingsOMW()),
+                                    (playerStandingsMT(0), tournament_vectorized.playerStandingsMT(0))):
+        if len(standings) != len(vectorized) or set(standings) != set(vectorized):
+            raise ValueError("Vectorized standings should match the standings views.")
+        if [(w, omw) for (i, n, w, omw, m) in standings] != [(w, omw) for (i, n, w, omw, m) in vectorized]:
+            raise ValueError("Vectorized standings should be sorted by wins and OMW.")
+    print "23. Vectorized standings match the standings views."
+
+def testInstrumentation():
+    deleteMatches()
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    deletePlayers()
+    register42Players()
+    tournament_stats.reset()
+    tournament_stats.enable()
+    try:
+        countPlayers()
+        swissPairingsPreventRematch()
+    finally:
+        tournament_stats.disable()
+    countPlayers()
+    stats = tournament_stats.stats()
+    if stats["countPlayers"]["calls"] != 1:
+        raise ValueError("Only calls made while instrumentation is enabled should be counted.")
+    if stats["countPlayers"]["connections"] != 1 or stats["countPlayers"]["rows"] < 1:
+        raise ValueError("countPlayers() should check out one connection and fetch one row.")
+    pairings = stats["swissPairingsPreventRematch"]
+    if pairings["queries"] < 2 or pairings["rows"] < 21:
+        raise ValueError("swissPairingsPreventRematch() should count its queries and rows.")
+    if sum([calls for (bound, calls) in pairings["histogram"]]) != 1:
+        raise ValueError("Each call should fall in one latency bucket.")
+    print "24. Instrumentation counts calls, queries and rows."
+
+def testAllTournaments():
+    deleteMatches()
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    deletePlayers()
+    ids = register42Players()
+    for t in range(3):
+        registerTournament(t,"Tournament " + str(t+1))
+        registerPlayersTournament([(id, t) for id in ids[t:]])
+    for r in range(4):
+        for (t, pairings) in swissPairingsAllTournaments().items():
+            reportRound(t, [(p[0], p[2], randint(0,2) if p[2] is not None else 1) for p in pairings])
+    threshold = tournament.PARALLEL_PAIRING_PLAYERS
+    tournament.PARALLEL_PAIRING_PLAYERS = 0
+    try:
+        parallel = swissPairingsAllTournaments([0, 2], PAIRING_MATCHING, 2)
+    finally:
+        tournament.PARALLEL_PAIRING_PLAYERS = threshold
+    if sorted(parallel.keys()) != [0, 2]:
+        raise ValueError("swissPairingsAllTournaments() should pair the requested tournaments.")
+    for (t, pairings) in parallel.items():
+        players = []
+        for pairing in pairings:
+            if pairing[9] != t:
+                raise ValueError("Each pairing should name its tournament.")
+            if pairing[8] != 0:
+                raise ValueError("Matching should pair without rematches.")
+            players.extend([id for id in (pairing[0], pairing[2]) if id is not None])
+        if sorted(players) != sorted(ids[t:]):
+            raise ValueError("Every player of tournament %s should be paired once." %(t))
+    print "25. All tournaments can be paired in one call."
+    
+def testCache():
+    deleteMatches()
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    deletePlayers()
+    ids = register42Players()
+    tournament_cache.enable(maxsize=4)
+    try:
+        first = swissPairingsPreventRematch()
+        hits = tournament_cache.info()["hits"]
+        if swissPairingsPreventRematch() != first or tournament_cache.info()["hits"] != hits + 1:
+            raise ValueError("A second read with no write in between should come from the cache.")
+        playerStandings()
+        reportMatch(ids[0], ids[1])
+        if playerStandings()[0][0] != ids[0]:
+            raise ValueError("Reporting a match should invalidate the cached standings.")
+        for n in range(6):
+            matchedBefore(ids[0], ids[n])
+        if tournament_cache.info()["size"] != 4:
+            raise ValueError("The cache should evict beyond its maximum size.")
+        tournament_cache.enable(maxsize=4, shared=True)
+        standings = playerStandings()
+        db = tournament.connect()
+        try:
+            db.cursor().execute("INSERT INTO matches (player1,player2,winner) VALUES (%s,%s,%s)", (ids[2], ids[3], ids[2]))
+            db.commit()
+        finally:
+            tournament.release(db)
+        if playerStandings() == standings:
+            raise ValueError("In shared mode, writes by other clients should invalidate the cache.")
+    finally:
+        tournament_cache.disable()
+    db = tournament.connect()
+    try:
+        cursor = db.cursor()
+        cursor.execute("SELECT count(*) FROM cache_versions WHERE tournament = -3")
+        sharedMode = cursor.fetchone()[0]
+    finally:
+        tournament.release(db)
+    if sharedMode != 0:
+        raise ValueError("Disabling shared mode should turn the version triggers off.")
+    print "26. Standings and pairings are cached until a write changes them."
+    
+def testStreaming():
+    deleteMatches()
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    deletePlayers()
+    ids = register42Players()
+    registerTournament(0,"Tournament 1")
+    registerPlayersTournament([(id, 0) for id in ids])
+    for r in range(3):
+        reportRound(None, [(p[0], p[2], randint(0,2)) for p in swissPairingsOMW()])
+        reportRound(0, [(p[0], p[2], randint(0,2)) for p in swissPairingsMT(0)])
+    if list(iterStandings(batchSize=5)) != list(playerStandingsOMW()):
+        raise ValueError("iterStandings() should return the rows of playerStandingsOMW().")
+    if list(iterStandings(0, 5)) != list(playerStandingsMT(0)):
+        raise ValueError("iterStandings(tournament) should return the rows of playerStandingsMT().")
+    if list(iterPairings(0, PAIRING_SWAP, len(ids))) != list(swissPairingsAllTournaments([0])[0]):
+        raise ValueError("iterPairings() over one batch should pair the whole tournament.")
+    for t in (None, 0):
+        players = []
+        for pairing in iterPairings(t, PAIRING_MATCHING, 7):
+            players.extend([pairing[0], pairing[2]])
+        if sorted(players) != sorted(ids):
+            raise ValueError("iterPairings() should pair every player once.")
+    stream = iterStandings(batchSize=2)
+    next(stream)
+    stream.close()
+    if countPlayers() != 42:
+        raise ValueError("Closing a stream early should give its connection back.")
+    print "27. Standings and pairings can be streamed in batches."
+    
+def testStandingsPages():
+    deleteMatches()
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    deletePlayers()
+    ids = register42Players()
+    registerTournament(0,"Tournament 1")
+    registerPlayersTournament([(id, 0) for id in ids])
+    for r in range(3):
+        reportRound(0, [(p[0], p[2], randint(0,2)) for p in swissPairingsMT(0)])
+    ordered = sorted(playerStandingsMT(0), key=lambda row: (-row[2], -row[3], row[0]))
+    if playerStandingsTop(0, 10) != ordered[:10]:
+        raise ValueError("playerStandingsTop() should return the first rows of the standings.")
+    pages = []
+    page = playerStandingsTop(0, 10)
+    while page:
+        pages.extend(page)
+        (id, name, wins, omw, matches) = page[-1]
+        page = playerStandingsAfter(0, (wins, omw, id), 10)
+    if pages != ordered:
+        raise ValueError("Paging with playerStandingsAfter() should list every player once, in order.")
+    for i in (0, 20, 41):
+        (rank, rows) = playerStandingsAround(0, ordered[i][0], 3)
+        first = max(0, i - 3)
+        if rank != first + 1 or rows != ordered[first:i + 4]:
+            raise ValueError("playerStandingsAround() should return the rows around the player and their rank.")
+    if playerStandingsAround(0, -1, 3) != (None, []):
+        raise ValueError("playerStandingsAround() should return no rows for an unregistered player.")
+    print "28. Standings can be read a page at a time."
+    
+def testTiebreaks():
+    deleteMatches()
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    deletePlayers()
+    ids = register42Players()
+    registerTournament(0,"Tournament 1")
+    registerPlayersTournament([(id, 0) for id in ids])
+    for r in range(4):
+        reportRound(0, [(p[0], p[2], randint(0,2)) for p in swissPairingsMT(0)])
+    expected = sorted(playerStandingsMT(0), key=lambda row: (-row[2], -row[3], row[0]))
+    rows = playerStandingsTiebreaks(0)
+    if [(row[0], row[1], row[2], row[9], row[5]) for row in rows] != expected:
+        raise ValueError("By default tiebreak standings should rank as playerStandingsMT() does.")
+    setTiebreakOrder(0, ("points", "buchholz", "sonneborn_berger"))
+    if tiebreakOrder(0) != ("points", "buchholz", "sonneborn_berger"):
+        raise ValueError("tiebreakOrder() should return the order set.")
+    keys = [(-row[4], -row[6], -row[8], row[0]) for row in playerStandingsTiebreaks(0)]
+    if keys != sorted(keys):
+        raise ValueError("Tiebreak standings should follow the tournament's order.")
+    try:
+        setTiebreakOrder(0, ("points", "coin toss"))
+        raise AssertionError("An unknown tiebreak should be rejected.")
+    except ValueError:
+        pass
+    print "29. Standings can be ranked by several tiebreaks, per tournament."
+    
+def testPreparedStatements():
+    deleteMatches()
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    deletePlayers()
+    ids = register42Players()
+    reportMatch(ids[0], ids[1])
+    reportMatchWithDraw(ids[2], ids[3], 0)
+    matchedBefore(ids[0], ids[1])
+    swissPairingsOMW()
+    db = tournament.connect()
+    try:
+        cursor = db.cursor()
+        cursor.execute("SELECT name FROM pg_prepared_statements")
+        prepared = set([row[0] for row in cursor.fetchall()])
+    finally:
+        tournament.release(db)
+    if prepared != db.prepared:
+        raise ValueError("A connection should know which statements it has prepared.")
+    for name in ("report_match", "matched_before", "swiss_pairings_omw"):
+        if name not in prepared:
+            raise ValueError("The %s statement should stay prepared on the pooled connection." %(name))
+    print "30. Hot statements are prepared once per pooled connection."
+    
+def testPartitions():
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    deletePlayers()
+    ids = register42Players()
+    registerTournament(0,"Tournament 1")
+    registerTournament(1,"Tournament 2")
+    registerPlayersTournament([(id, t) for id in ids for t in (0, 1)])
+    reportRound(1, [(p[0], p[2], 1) for p in swissPairingsMT(1)])
+    db = tournament.connect()
+    try:
+        cursor = db.cursor()
+        cursor.execute("SELECT DISTINCT tableoid::regclass::text FROM playertournaments WHERE tournament = 0")
+        registrations = cursor.fetchall()
+        cursor.execute("SELECT DISTINCT tableoid::regclass::text FROM tournamentmatches")
+        matches = cursor.fetchall()
+    finally:
+        tournament.release(db)
+    if registrations != [("playertournaments_0",)]:
+        raise ValueError("A tournament's registrations should be stored in its own partition.")
+    if matches != [("tournamentmatches_1",)]:
+        raise ValueError("A tournament's matches should be stored in its own partition.")
+    if len(playerStandingsMT(1)) != 42:
+        raise ValueError("Standings should read the tournament's partitions.")
+    print "31. Each tournament's rows are stored in its own partitions."
+    
+def testCloseTournament():
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    deletePlayers()
+    ids = register42Players()
+    registerTournament(2,"Tournament 3")
+    registerTournament(3,"Tournament 4")
+    registerPlayersTournament([(id, t) for id in ids for t in (2, 3)])
+    for r in range(3):
+        reportRound(2, [(p[0], p[2], randint(0,2)) for p in swissPairingsMT(2)])
+    setTiebreakOrder(2, ("points", "buchholz"))
+    expected = playerStandingsTiebreaks(2)
+    closeTournament(2, archive=True)
+    if playerStandingsTiebreaks(2) != expected:
+        raise ValueError("A closed tournament's standings should be its final results.")
+    if [row[0] for row in playerStandingsMT(2)] != [row[0] for row in expected]:
+        raise ValueError("playerStandingsMT() should list a closed tournament's final ranks.")
+    final = playerStandingsMT(2)
+    if playerStandingsTop(2, 10) != final[:10]:
+        raise ValueError("playerStandingsTop() should follow a closed tournament's final results.")
+    pages = []
+    page = playerStandingsTop(2, 10)
+    while page:
+        pages.extend(page)
+        (id, name, wins, omw, matches) = page[-1]
+        page = playerStandingsAfter(2, (wins, omw, id), 10)
+    if pages != final:
+        raise ValueError("playerStandingsAfter() should page through a closed tournament's final results.")
+    if playerStandingsAround(2, final[20][0], 3) != (18, final[17:24]):
+        raise ValueError("playerStandingsAround() should read a closed tournament's final results.")
+    if countPlayersTournament(2) != 42:
+        raise ValueError("Closing a tournament should keep its registrations.")
+    try:
+        reportMatchTournamentWithDraw(2, ids[0], ids[1], 1)
+        raise AssertionError("A closed tournament should not accept matches.")
+    except psycopg2.IntegrityError:
+        pass
+    try:
+        closeTournament(2)
+        raise AssertionError("A tournament should only be closed once.")
+    except ValueError:
+        pass
+    db = tournament.connect()
+    try:
+        cursor = db.cursor()
+        cursor.execute("SELECT count(*) FROM tournamentmatches WHERE tournament = 2")
+        live = cursor.fetchone()[0]
+    finally:
+        tournament.release(db)
+    if live != 0:
+        raise ValueError("Archived matches should leave tournamentmatches.")
+    reportMatchTournamentWithDraw(3, ids[0], ids[1], 1)
+    print "32. Closed tournaments are read-only and served from their final results."
+    
+def testPrecompute():
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    deletePlayers()
+    ids = register42Players()
+    registerTournament(0,"Tournament 1")
+    registerPlayersTournament([(id, 0) for id in ids])
+    pairings = swissPairingsMT(0)
+    enablePrecompute()
+    try:
+        for p in pairings[:-1]:
+            reportMatchTournamentWithDraw(0, p[0], p[2], 1)
+        p = pairings[-1]
+        reportMatchTournamentWithDraw(0, p[0], p[2], 2)
+        if not waitForPrecompute(30):
+            raise ValueError("The next round should be paired in the background.")
+        hits = tournament_cache.info()["hits"]
+        swissPairingsMT(0)
+        if tournament_cache.info()["hits"] != hits + 1:
+            raise ValueError("Pairings of a complete round should be precomputed.")
+        playerStandingsMT(0)
+        playerStandingsMT(0)
+        if tournament_cache.info()["hits"] != hits + 1:
+            raise ValueError("Precomputing should only cache swissPairingsMT().")
+        reportMatchTournamentWithDraw(0, ids[0], ids[1], 0)
+        waitForPrecompute(30)
+        hits = tournament_cache.info()["hits"]
+        swissPairingsMT(0)
+        if tournament_cache.info()["hits"] != hits:
+            raise ValueError("A new result should discard the precomputed pairings.")
+    finally:
+        disablePrecompute()
+        tournament_cache.disable()
+    print "33. The next round is paired in the background once a round is complete."
+    
+def testConcurrentReports():
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    deletePlayers()
+    ids = register42Players()
+    registerTournament(0,"Tournament 1")
+    registerPlayersTournament([(id, 0) for id in ids])
+    errors = []
+    def reporter(seed):
+        try:
+            for n in range(40):
+                # 4n + 1 is odd, so the two players always differ.
+                player1 = ids[(seed * 7 + n) % len(ids)]
+                player2 = ids[(seed * 7 + n * 5 + 1) % len(ids)]
+                reportMatchTournamentWithDraw(0, player1, player2, randint(0,2))
+        except Exception as error:
+            errors.append(error)
+    threads = [threading.Thread(target=reporter, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise ValueError("Concurrent reports should all be recorded: %r" % (errors[0],))
+    expected = dict((row[0], (row[2], row[9], row[5])) for row in playerStandingsTiebreaks(0))
+    for (id, name, wins, omw, matches) in playerStandingsMT(0):
+        if expected[id] != (wins, omw, matches):
+            raise ValueError("Concurrent reports should keep wins and OMW exact.")
+    print "34. Reports from many clients at once are all recorded."
+    
+def testConcurrentRegistrations():
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    deletePlayers()
+    ids = register42Players()
+    registerTournament(0,"Tournament 1")
+    registerPlayersTournament([(id, 0) for id in ids])
+    errors = []
+    def registrar(seed):
+        try:
+            for n in range(5):
+                t = 10 + seed * 5 + n
+                registerTournament(t, "Tournament %s" % t)
+                registerPlayersTournament([(id, t) for id in ids])
+                reportMatchTournamentWithDraw(t, ids[0], ids[1], 1)
+        except Exception as error:
+            errors.append(error)
+    def reporter(seed):
+        try:
+            for n in range(20):
+                player1 = ids[(seed * 7 + n) % len(ids)]
+                player2 = ids[(seed * 7 + n * 5 + 1) % len(ids)]
+                reportMatchTournamentWithDraw(0, player1, player2, randint(0,2))
+        except Exception as error:
+            errors.append(error)
+    threads = ([threading.Thread(target=registrar, args=(seed,)) for seed in range(4)]
+               + [threading.Thread(target=reporter, args=(seed,)) for seed in range(4)])
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise ValueError("Concurrent registrations should all succeed: %r" % (errors[0],))
+    for t in range(10, 30):
+        if countPlayersTournament(t) != 42:
+            raise ValueError("Each concurrently registered tournament should have its players.")
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    db = tournament.connect()
+    try:
+        cursor = db.cursor()
+        cursor.execute("SELECT count(*) FROM pg_inherits WHERE inhparent = 'playertournaments'::regclass")
+        partitions = cursor.fetchone()[0]
+    finally:
+        tournament.release(db)
+    if partitions != 1:
+        raise ValueError("deleteTournaments() should drop the tournaments' partitions.")
+    print "35. Tournaments can be registered while other clients report."
     
+def testPoolWaits():
+    maxconn = tournament.POOL_MAXCONN
+    timeout = tournament.POOL_TIMEOUT
+    configurePool(maxconn=2, timeout=0.2)
+    try:
+        held = [tournament.connect(), tournament.connect()]
+        try:
+            countPlayers()
+        except psycopg2.pool.PoolError:
+            pass
+        else:
+            raise ValueError("connect() should give up once POOL_TIMEOUT has passed.")
+        for db in held:
+            tournament.release(db)
+        configurePool(maxconn=2, timeout=30)
+        held = [tournament.connect(), tournament.connect()]
+        counts = []
+        waiter = threading.Thread(target=lambda: counts.append(countPlayers()))
+        waiter.start()
+        waiter.join(0.2)
+        if counts:
+            raise ValueError("connect() should wait while every connection is in use.")
+        tournament.release(held.pop())
+        waiter.join(30)
+        if not counts:
+            raise ValueError("connect() should get a connection once one is released.")
+        for db in held:
+            tournament.release(db)
+    finally:
+        configurePool(maxconn=maxconn, timeout=timeout)
+    print "36. A full pool makes connect() wait for a connection."
+    
+def testArchiveDefaultPartition():
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    deletePlayers()
+    ids = register42Players()
+    registerTournament(4,"Tournament 5")
+    # As if the partitions could not be created in time.
+    db = tournament.connect()
+    try:
+        cursor = db.cursor()
+        cursor.execute("DROP TABLE playertournaments_4, tournamentmatches_4")
+        db.commit()
+    finally:
+        tournament.release(db)
+    registerPlayersTournament([(id, 4) for id in ids])
+    reportRound(4, [(p[0], p[2], 1) for p in swissPairingsMT(4)])
+    expected = playerStandingsTiebreaks(4)
+    closeTournament(4, archive=True)
+    if playerStandingsTiebreaks(4) != expected:
+        raise ValueError("A tournament without partitions should close like any other.")
+    db = tournament.connect()
+    try:
+        cursor = db.cursor()
+        cursor.execute("SELECT count(*) FROM tournamentmatches WHERE tournament = 4")
+        live = cursor.fetchone()[0]
+        cursor.execute("SELECT table_name FROM information_schema.tables "
+                       "WHERE table_schema = 'tournament_archive' "
+                       "AND table_name LIKE 'tournamentmatches_4_%' ORDER BY table_name DESC")
+        archived = cursor.fetchone()[0]
+        cursor.execute('SELECT count(*) FROM tournament_archive."%s"' % archived)
+        archivedMatches = cursor.fetchone()[0]
+    finally:
+        tournament.release(db)
+    if live != 0 or archivedMatches != 21:
+        raise ValueError("Matches in the default partition should be moved to the archive.")
+    print "37. Matches left in the default partition are archived too."
+
+def testPlayedPairsOnce():
+    deleteMatches()
+    deleteTournamentMatches()
+    deletePlayerTournaments()
+    deleteTournaments()
+    deletePlayers()
+    register42Players()
+    played = set()
+    for r in range(3):
+        tournament_stats.reset()
+        tournament_stats.enable()
+        try:
+            pairings = swissPairingsPreventRematch()
+        finally:
+            tournament_stats.disable()
+        stats = tournament_stats.stats()["swissPairingsPreventRematch"]
+        # One statement for the pairings and one for the played pairs, each
+        # prepared on first use of the connection.
+        if stats["connections"] != 1 or stats["queries"] > 4:
+            raise ValueError("Pairing should load the played pairs in one query, not one per candidate swap.")
+        for pairing in pairings:
+            pair = (min(pairing[0], pairing[2]), max(pairing[0], pairing[2]))
+            if pair in played:
+                raise ValueError("Players %s and %s should not be paired again." % pair)
+            played.add(pair)
+            reportMatch(pairing[0], pairing[2])
+    print "38. Pairing loads the played pairs once and still avoids rematches."
+    
+NAMES_42 = [
+    "Shelia Cohen",
+    "Enola Holle",
+    "Georgia Conant",
+    "Telma Worster",
+    "Soledad Romig",
+    "Elouise Tobin",
+    "Sharleen Roseborough",
+    "Regena Donnellan",
+    "Leena Frisbee",
+    "Robt Ginther",
+    "Nilda Thrush",
+    "Nicholas Woodell",
+    "Carmel Hieb",
+    "Willy Hyder",
+    "Alta Mona",
+    "Kaila Difranco",
+    "Alfredo Hovis",
+    "Garnett Troncoso",
+    "Kathaleen Seybert",
+    "Ronny Artiaga",
+    "Elias Lehoux",
+    "Chance Ekberg",
+    "Fidelia Heindel",
+    "Dennis Knaus",
+    "Maryland Caddy",
+    "Sylvie Furry",
+    "Renay Hartzler",
+    "Bessie Daughtridge",
+    "Kurt Sibrian",
+    "Audria Thibodaux",
+    "Eugenie Steely",
+    "Reginia Synder",
+    "Berry Elia",
+    "Ricki Loberg",
+    "Caroline Manz",
+    "Mandi Digiovanni",
+    "Bethanie Ostrem",
+    "Tressa Holliman",
+    "Ericka Roux",
+    "Leda Riffe",
+    "Werner Bazaldua",
+    "Ramonita Halle",
+]
+
+NAMES_99 = NAMES_42 + [
+    "Arminda Sperling",
+    "Lindsey Manna",
+    "Margit Fyfe",
+    "Marquetta Enterline",
+    "Pauline Trombetta",
+    "Brent Sibert",
+    "Numbers Hoback",
+    "Lizeth Stodola",
+    "Joellen Firth",
+    "Elmer Nally",
+    "Evie Ho",
+    "Ena Tebo",
+    "Ezra Nader",
+    "Franchesca Stoll",
+    "Clair Reams",
+    "Lewis Hasse",
+    "John Damm",
+    "Alanna Schlenker",
+    "Rueben Dansereau",
+    "Marcelo Clore",
+    "Leola Bently",
+    "Verlene Calfee",
+    "Shiela Keaton",
+    "Reena Bonner",
+    "Alessandra Fortuna",
+    "Cedric Mcnabb",
+    "Dee Shillings",
+    "Clara Bengston",
+    "Jenee Reamer",
+    "Voncile Beller",
+    "Renato Creagh",
+    "Ahmed Greenawalt",
+    "Candyce Lui",
+    "Britney Voyles",
+    "Mee Kellough",
+    "Cesar Ogden",
+    "Norah Decastro",
+    "Chantal Flaherty",
+    "Bertram Ruelas",
+    "Silas Andreotti",
+    "Hulda Smithers",
+    "Marnie Quincy",
+    "Divina Eddins",
+    "Olevia Tillson",
+    "Gerri Commodore",
+    "Kelsey Boydstun",
+    "Julie Woolwine",
+    "Merna Coniglio",
+    "Kay Runner",
+    "Keesha Ravenell",
+    "Maureen Wooding",
+    "Morgan Kunkle",
+    "Fiona Harkleroad",
+    "Isreal Santi",
+    "Meaghan Naylor",
+    "Reginald Clifton",
+    "Brigitte Malave",
+]
+
+NAMES_100 = NAMES_99 + [
+    "Nilsa Sheffield",
+]
+
 def register42Players():
-    registerPlayer("Shelia Cohen")
-    registerPlayer("Enola Holle")
-    registerPlayer("Georgia Conant")
-    registerPlayer("Telma Worster")
-    registerPlayer("Soledad Romig")
-    registerPlayer("Elouise Tobin")
-    registerPlayer("Sharleen Roseborough")
-    registerPlayer("Regena Donnellan")
-    registerPlayer("Leena Frisbee")
-    registerPlayer("Robt Ginther")
-    registerPlayer("Nilda Thrush")
-    registerPlayer("Nicholas Woodell")
-    registerPlayer("Carmel Hieb")
-    registerPlayer("Willy Hyder")
-    registerPlayer("Alta Mona")
-    registerPlayer("Kaila Difranco")
-    registerPlayer("Alfredo Hovis")
-    registerPlayer("Garnett Troncoso")
-    registerPlayer("Kathaleen Seybert")
-    registerPlayer("Ronny Artiaga")
-    registerPlayer("Elias Lehoux")
-    registerPlayer("Chance Ekberg")
-    registerPlayer("Fidelia Heindel")
-    registerPlayer("Dennis Knaus")
-    registerPlayer("Maryland Caddy")
-    registerPlayer("Sylvie Furry")
-    registerPlayer("Renay Hartzler")
-    registerPlayer("Bessie Daughtridge")
-    registerPlayer("Kurt Sibrian")
-    registerPlayer("Audria Thibodaux")
-    registerPlayer("Eugenie Steely")
-    registerPlayer("Reginia Synder")
-    registerPlayer("Berry Elia")
-    registerPlayer("Ricki Loberg")
-    registerPlayer("Caroline Manz")
-    registerPlayer("Mandi Digiovanni")
-    registerPlayer("Bethanie Ostrem")
-    registerPlayer("Tressa Holliman")
-    registerPlayer("Ericka Roux")
-    registerPlayer("Leda Riffe")
-    registerPlayer("Werner Bazaldua")
-    registerPlayer("Ramonita Halle")
+    return registerPlayers(NAMES_42)
 
 
 def register99Players():
-    register42Players()
-    registerPlayer("Arminda Sperling")
-    registerPlayer("Lindsey Manna")
-    registerPlayer("Margit Fyfe")
-    registerPlayer("Marquetta Enterline")
-    registerPlayer("Pauline Trombetta")
-    registerPlayer("Brent Sibert")
-    registerPlayer("Numbers Hoback")
-    registerPlayer("Lizeth Stodola")
-    registerPlayer("Joellen Firth")
-    registerPlayer("Elmer Nally")
-    registerPlayer("Evie Ho")
-    registerPlayer("Ena Tebo")
-    registerPlayer("Ezra Nader")
-    registerPlayer("Franchesca Stoll")
-    registerPlayer("Clair Reams")
-    registerPlayer("Lewis Hasse")
-    registerPlayer("John Damm")
-    registerPlayer("Alanna Schlenker")
-    registerPlayer("Rueben Dansereau")
-    registerPlayer("Marcelo Clore")
-    registerPlayer("Leola Bently")
-    registerPlayer("Verlene Calfee")
-    registerPlayer("Shiela Keaton")
-    registerPlayer("Reena Bonner")
-    registerPlayer("Alessandra Fortuna")
-    registerPlayer("Cedric Mcnabb")
-    registerPlayer("Dee Shillings")
-    registerPlayer("Clara Bengston")
-    registerPlayer("Jenee Reamer")
-    registerPlayer("Voncile Beller")
-    registerPlayer("Renato Creagh")
-    registerPlayer("Ahmed Greenawalt")
-    registerPlayer("Candyce Lui")
-    registerPlayer("Britney Voyles")
-    registerPlayer("Mee Kellough")
-    registerPlayer("Cesar Ogden")
-    registerPlayer("Norah Decastro")
-    registerPlayer("Chantal Flaherty")
-    registerPlayer("Bertram Ruelas")
-    registerPlayer("Silas Andreotti")
-    registerPlayer("Hulda Smithers")
-    registerPlayer("Marnie Quincy")
-    registerPlayer("Divina Eddins")
-    registerPlayer("Olevia Tillson")
-    registerPlayer("Gerri Commodore")
-    registerPlayer("Kelsey Boydstun")
-    registerPlayer("Julie Woolwine")
-    registerPlayer("Merna Coniglio")
-    registerPlayer("Kay Runner")
-    registerPlayer("Keesha Ravenell")
-    registerPlayer("Maureen Wooding")
-    registerPlayer("Morgan Kunkle")
-    registerPlayer("Fiona Harkleroad")
-    registerPlayer("Isreal Santi")
-    registerPlayer("Meaghan Naylor")
-    registerPlayer("Reginald Clifton")
-    registerPlayer("Brigitte Malave")
+    return registerPlayers(NAMES_99)
     
 def register100Players():
-    register99Players()
-    registerPlayer("Nilsa Sheffield")
+    return registerPlayers(NAMES_100)
 
 
 if __name__ == '__main__':
+    testSchemaUpToDate()
     testDeleteMatches()
     testDelete()
     testCount()
@@ -398,6 +1246,29 @@ if __name__ == '__main__':
     testTournamentDraw()
     testTournamentOMW()
     testMultipleTournaments()
+    testSession()
+    testBulkRegister()
+    testReportRound()
+    testPairingMatching()
+    testStandingsStats()
+    testStandingsMT()
+    testEngine()
+    testVectorizedStandings()
+    testInstrumentation()
+    testAllTournaments()
+    testCache()
+    testStreaming()
+    testStandingsPages()
+    testTiebreaks()
+    testPreparedStatements()
+    testPartitions()
+    testCloseTournament()
+    testPrecompute()
+    testConcurrentReports()
+    testConcurrentRegistrations()
+    testPoolWaits()
+    testArchiveDefaultPartition()
+    testPlayedPairsOnce()
     print "Success!  All tests pass!"
 
 
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: cp1254 -*-
+#
+# tournament_tiebreaks.py -- tiebreak scores, independent of the database
+#
+# computeTiebreaks() reads a list of matches once and derives every score
+# the standings can be ranked by, so that adding a tiebreak level does not
+# add a scan of the matches. Points are those of playerStandingsDraw: 3 for
+# a win, 1 for a draw. A bye (no player2) counts as a match, and a win or a
+# draw, but not as a game against an opponent.
+#
+#   wins, points       the player's own score
+#   buchholz           sum of the points of the opponent of each game
+#   median_buchholz    the same without the highest and the lowest, once
+#                      the player has played more than two games
+#   sonneborn_berger   sum over the games of the points the player scored
+#                      in the game times the opponent's points
+#   omw                sum of the wins of each distinct opponent, as in
+#                      playerStandingsOMW
+#   opponent_points    sum of the points of each distinct opponent
+
+from collections import defaultdict
+
+# The scores a ranking order can name.
+TIEBREAKS = ("wins", "points", "buchholz", "median_buchholz",
+             "sonneborn_berger", "omw", "opponent_points")
+
+# The order of playerStandingsOMW and playerStandingsMT.
+DEFAULT_ORDER = ("wins", "omw")
+
+# The columns of the rows of standingsRows().
+COLUMNS = ("id", "name", "wins", "draws", "points", "matches") + TIEBREAKS[2:]
+
+
+def checkOrder(order):
+    """Returns a ranking order as a tuple, or raises ValueError if it is
+    empty, repeats a score or names one that is not in TIEBREAKS."""
+    order = tuple(order)
+    if not order:
+        raise ValueError("a ranking order needs at least one score")
+    for name in order:
+        if name not in TIEBREAKS:
+            raise ValueError("unknown tiebreak %r, expected one of %s"
+                             % (name, ", ".join(TIEBREAKS)))
+    if len(set(order)) != len(order):
+        raise ValueError("ranking order %r repeats a score" % (order,))
+    return order
+
+
+def computeTiebreaks(matches, players=()):
+    """Computes the scores of every player of a list of matches.
+
+    Args:
+      matches: iterable of (player1, player2, winner) tuples, player2 None
+               for a bye and winner None for a draw
+      players: ids to include even if they have no matches
+
+    Returns:
+      A dict of player id -> dict of wins, draws, points, matches and each
+      score of TIEBREAKS.
+    """
+    wins = defaultdict(int)
+    draws = defaultdict(int)
+    played = defaultdict(int)
+    # player -> list of (opponent, points the player scored in the game)
+    games = defaultdict(list)
+    for (player1, player2, winner) in matches:
+        played[player1] += 1
+        if winner is None:
+            draws[player1] += 1
+            points1 = points2 = 1
+        else:
+            wins[winner] += 1
+            points1 = 3 if winner == player1 else 0
+            points2 = 3 - points1
+        if player2 is not None:
+            played[player2] += 1
+            if winner is None:
+                draws[player2] += 1
+            games[player1].append((player2, points1))
+            games[player2].append((player1, points2))
+
+    ids = set(players)
+    ids.update(played)
+    points = dict((id, wins[id] * 3 + draws[id]) for id in ids)
+    scores = {}
+    for id in ids:
+        opponentPoints = sorted(points[opponent]
+                                for (opponent, _) in games[id])
+        opponents = set(opponent for (opponent, _) in games[id])
+        median = opponentPoints
+        if len(median) > 2:
+            median = median[1:-1]
+        scores[id] = {
+            "wins": wins[id],
+            "draws": draws[id],
+            "points": points[id],
+            "matches": played[id],
+            "buchholz": sum(opponentPoints),
+            "median_buchholz": sum(median),
+            "sonneborn_berger": sum([scored * points[opponent]
+                                     for (opponent, scored) in games[id]]),
+            "omw": sum([wins[opponent] for opponent in opponents]),
+            "opponent_points": sum([points[opponent]
+                                    for opponent in opponents]),
+        }
+    return scores
+
+
+def standingsRows(scores, names, order=DEFAULT_ORDER):
+    """Ranks players by order, each score descending, then by id.
+
+    Args:
+      scores: the dict returned by computeTiebreaks()
+      names: dict of player id -> name, of the players to rank
+      order: sequence of names from TIEBREAKS, the first deciding
+
+    Returns:
+      A list of tuples laid out as COLUMNS.
+    """
+    empty = computeTiebreaks((), [0])[0]
+    rows = []
+    for (id, name) in names.items():
+        score = scores.get(id, empty)
+        rows.append((id, name) + tuple([score[column]
+                                        for column in COLUMNS[2:]]))
+    return rankRows(rows, order)
+
+
+def rankRows(rows, order=DEFAULT_ORDER):
+    """Sorts rows laid out as COLUMNS by order, each score descending, then
+    by id, as standingsRows() does."""
+    order = checkOrder(order)
+    positions = [COLUMNS.index(key) for key in order]
+    return sorted(rows, key=lambda row: (tuple([-row[position]
+                                                for position in positions]),
+                                         row[0]))
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: cp1254 -*-
+#
+# tournament_vectorized.py -- standings of very large fields with NumPy
+#
+# The standings views and the player_stats triggers work row by row. For
+# fields of tens of thousands of players it is faster to load the matches
+# once as integer arrays and reduce them with NumPy:
+#
+#   wins, draws and matches are bincounts over the player columns,
+#   points are 3 per win plus 1 per draw, as in playerStandingsDraw,
+#   OMW is the product of the distinct-opponent adjacency matrix, kept as
+#   a list of (player, opponent) index pairs, with the wins vector.
+#
+# NumPy is only needed by this module; tournament.py does not import it.
+
+import numpy
+import tournament
+
+
+def computeStandings(players1, players2, winners, players=()):
+    """Computes the standings of a list of matches.
+
+    A missing player2 (a bye) or winner (a draw) is given as 0, which no
+    player id takes, as in the matches of tournament_engine.MatchStore.
+
+    Args:
+      players1, players2, winners: integer sequences, one entry per match
+      players: ids to include even if they have no matches
+
+    Returns:
+      A dict of NumPy arrays, all indexed like its "id" array, which holds
+      the sorted ids of the players in the matches and in players:
+        id, wins, draws, points, matches, omw
+    """
+    players1 = numpy.asarray(players1, dtype=numpy.int64)
+    players2 = numpy.asarray(players2, dtype=numpy.int64)
+    winners = numpy.asarray(winners, dtype=numpy.int64)
+    ids = _unique(numpy.concatenate(
+        (numpy.asarray(players, dtype=numpy.int64), players1,
+         players2[players2 != 0])))
+    n = len(ids)
+    # Player ids are serial, so a lookup table maps them to indexes faster
+    # than a binary search would.
+    lookup = numpy.zeros(ids[-1] + 1 if n else 1, dtype=numpy.int64)
+    lookup[ids] = numpy.arange(n)
+
+    hasPlayer2 = players2 != 0
+    draw = winners == 0
+    index1 = lookup[players1]
+    index2 = lookup[players2[hasPlayer2]]
+    wins = numpy.bincount(lookup[winners[~draw]], minlength=n)
+    draws = (numpy.bincount(index1[draw], minlength=n)
+             + numpy.bincount(index2[draw[hasPlayer2]], minlength=n))
+    matches = (numpy.bincount(index1, minlength=n)
+               + numpy.bincount(index2, minlength=n))
+
+    # Each pair of players who met is counted once, however many times
+    # they played: encode (low, high) index pairs as one integer, unique.
+    paired = index1[hasPlayer2]
+    low = numpy.minimum(paired, index2)
+    high = numpy.maximum(paired, index2)
+    pairs = _unique(low * n + high)
+    low = pairs // n
+    high = pairs % n
+    other = low != high
+    omw = (numpy.bincount(low, weights=wins[high], minlength=n)
+           + numpy.bincount(high[other], weights=wins[low[other]],
+                            minlength=n))
+
+    return {"id": ids, "wins": wins, "draws": draws,
+            "points": wins * 3 + draws, "matches": matches,
+            "omw": omw.astype(numpy.int64)}
+
+
+def _unique(values):
+    """Returns the sorted distinct values of an integer array."""
+    values = numpy.sort(values)
+    if len(values):
+        first = numpy.concatenate(([True], values[1:] != values[:-1]))
+        values = values[first]
+    return values
+
+
+def standingsRows(standings, players, names):
+    """Returns (id, name, wins, omw, matches) rows for players, sorted by
+    wins and then by OMW, from the arrays of computeStandings().
+
+    Args:
+      standings: the dict returned by computeStandings()
+      players: list of player ids, each listed once per row wanted
+      names: dict of player id -> name
+    """
+    if not len(players):
+        return []
+    index = numpy.searchsorted(standings["id"],
+                               numpy.asarray(players, dtype=numpy.int64))
+    ids = standings["id"][index]
+    wins = standings["wins"][index]
+    omw = standings["omw"][index]
+    matches = standings["matches"][index]
+    order = numpy.lexsort((ids, -omw, -wins))
+    return [(id, names[id], w, o, m) for (id, w, o, m)
+            in zip(ids[order].tolist(), wins[order].tolist(),
+                   omw[order].tolist(), matches[order].tolist())]
+
+
+def fetchMatchArrays(cursor, tournament=None):
+    """Loads the matches of the matches table, or of one tournament, as
+    three NumPy arrays (players1, players2, winners), with 0 for null."""
+    if tournament is None:
+        cursor.execute("SELECT coalesce(player1, 0), coalesce(player2, 0), "
+                       "coalesce(winner, 0) FROM matches")
+    else:
+        cursor.execute("SELECT coalesce(player1, 0), coalesce(player2, 0), "
+                       "coalesce(winner, 0) FROM tournamentmatches "
+                       "WHERE tournament = %s", (tournament,))
+    rows = numpy.array(cursor.fetchall(), dtype=numpy.int64).reshape(-1, 3)
+    return rows[:, 0], rows[:, 1], rows[:, 2]
+
+
+def playerStandingsOMW():
+    """Returns the same rows as tournament.playerStandingsOMW(), computed
+    from the matches table in NumPy. Tied players are listed by id."""
+    with tournament.TournamentSession() as session:
+        session.cursor.execute("SELECT id, name FROM players")
+        names = dict(session.cursor.fetchall())
+        arrays = fetchMatchArrays(session.cursor)
+    players = sorted(names)
+    return standingsRows(computeStandings(*arrays, players=players),
+                         players, names)
+
+
+def playerStandingsMT(tournamentId):
+    """Returns the same rows as tournament.playerStandingsMT(), computed
+    from the tournament's matches in NumPy. Tied players are listed by id."""
+    with tournament.TournamentSession() as session:
+        session.cursor.execute(
+            "SELECT players.id, players.name FROM players "
+            "JOIN playertournaments ON players.id = playertournaments.player "
+            "WHERE playertournaments.tournament = %s", (tournamentId,))
+        registered = session.cursor.fetchall()
+        arrays = fetchMatchArrays(session.cursor, tournamentId)
+    players = [row[0] for row in registered]
+    return standingsRows(computeStandings(*arrays, players=players),
+                         players, dict(registered))